@@ -0,0 +1,5 @@
+"""
+Нагрузочные замеры API на сгенерированном наборе данных.
+
+    python -m benchmarks --db-url sqlite+aiosqlite:///bench.db --users 2000
+"""
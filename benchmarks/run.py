@@ -0,0 +1,249 @@
+"""
+Прогон сценариев против приложения из `main.app` внутри процесса:
+задержки p50/p95/p99 и пропускная способность по эндпоинтам.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from httpx import AsyncClient, Response
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from benchmarks.seed import Dataset, SeedConfig, api_key, seed
+from database.init_db import db, db_read
+from main import app
+from utils import file_system, images
+from utils.batching import like_batcher, start_like_batcher
+
+Scenario = Callable[[AsyncClient, random.Random, Dataset], Awaitable[Response]]
+# зависимости сессий приложения, которые подменяются базой замера
+DB_DEPS = (db, db_read)
+
+
+async def timeline(
+    client: AsyncClient, rnd: random.Random, data: Dataset
+) -> Response:
+    user = rnd.randint(1, data.users)
+    return await client.get("/api/tweets/", headers={"api-key": api_key(user)})
+
+
+async def timeline_summary(
+    client: AsyncClient, rnd: random.Random, data: Dataset
+) -> Response:
+    user = rnd.randint(1, data.users)
+    return await client.get(
+        "/api/tweets/",
+        params={"likes": "summary"},
+        headers={"api-key": api_key(user)},
+    )
+
+
+async def like(
+    client: AsyncClient, rnd: random.Random, data: Dataset
+) -> Response:
+    user = rnd.randint(1, data.users)
+    tweet = rnd.randint(1, data.tweets)
+    return await client.post(
+        f"/api/tweets/{tweet}/likes", headers={"api-key": api_key(user)}
+    )
+
+
+async def follow(
+    client: AsyncClient, rnd: random.Random, data: Dataset
+) -> Response:
+    user, other = rnd.sample(range(1, data.users + 1), 2)
+    return await client.post(
+        f"/api/users/{other}/follow", headers={"api-key": api_key(user)}
+    )
+
+
+async def upload(
+    client: AsyncClient, rnd: random.Random, data: Dataset
+) -> Response:
+    user = rnd.randint(1, data.users)
+    content = rnd.randbytes(16 * 1024)
+    return await client.post(
+        "/api/medias",
+        files={"file": ("bench.bin", content)},
+        headers={"api-key": api_key(user)},
+    )
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "timeline": timeline,
+    "timeline_summary": timeline_summary,
+    "like": like,
+    "follow": follow,
+    "upload": upload,
+}
+
+
+@dataclass
+class Result:
+    """Замеры одного сценария."""
+
+    name: str
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def percentile(self, q: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100)[q - 1]
+
+    def row(self) -> str:
+        rps = len(self.latencies) / self.elapsed if self.elapsed else 0.0
+        return (
+            f"{self.name:<16} {len(self.latencies):>7} {self.errors:>6} "
+            f"{self.percentile(50) * 1000:>9.1f} "
+            f"{self.percentile(95) * 1000:>9.1f} "
+            f"{self.percentile(99) * 1000:>9.1f} {rps:>9.1f}"
+        )
+
+
+HEADER = (
+    f"{'scenario':<16} {'requests':>7} {'errors':>6} "
+    f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}"
+)
+
+
+async def run_scenario(
+    client: AsyncClient,
+    name: str,
+    data: Dataset,
+    requests: int,
+    concurrency: int,
+    rnd: random.Random,
+) -> Result:
+    """Выполняет `requests` запросов сценария по `concurrency` параллельно."""
+    scenario = SCENARIOS[name]
+    result = Result(name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await scenario(client, rnd, data)
+            result.latencies.append(time.perf_counter() - start)
+            result.errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def bench(
+    db_url: str,
+    config: SeedConfig,
+    scenarios: list[str],
+    requests: int,
+    concurrency: int,
+) -> list[Result]:
+    """Заполняет базу и прогоняет сценарии, возвращает замеры."""
+    if make_url(db_url).get_backend_name() == "sqlite":
+        engine = create_async_engine(db_url, connect_args={"timeout": 30})
+    else:
+        engine = create_async_engine(db_url, pool_size=concurrency)
+    Session = async_sessionmaker(
+        bind=engine, expire_on_commit=False, class_=AsyncSession
+    )
+
+    async def override_db():
+        async with Session() as session:
+            yield session
+
+    media_root = file_system.MEDIA_ROOT
+    file_system.MEDIA_ROOT = images.MEDIA_ROOT = tempfile.mkdtemp(
+        prefix="bench-media-"
+    )
+    previous = {dep: app.dependency_overrides.get(dep) for dep in DB_DEPS}
+    app.dependency_overrides.update(dict.fromkeys(DB_DEPS, override_db))
+    # батчер лайков пишет своей сессией, мимо зависимостей; клиент не
+    # запускает startup-события приложения, поэтому батчер запускается здесь
+    sessionmaker = like_batcher.sessionmaker
+    like_batcher.sessionmaker = Session
+    try:
+        data = await seed(engine, config)
+        await start_like_batcher()
+        rnd = random.Random(config.seed)
+        async with AsyncClient(app=app, base_url="http://bench") as client:
+            return [
+                await run_scenario(
+                    client, name, data, requests, concurrency, rnd
+                )
+                for name in scenarios
+            ]
+    finally:
+        await like_batcher.stop()
+        like_batcher.sessionmaker = sessionmaker
+        file_system.MEDIA_ROOT = images.MEDIA_ROOT = media_root
+        for dep, override in previous.items():
+            if override is None:
+                app.dependency_overrides.pop(dep, None)
+            else:
+                app.dependency_overrides[dep] = override
+        await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--db-url",
+        default=os.environ.get(
+            "BENCH_DATABASE_URL", "sqlite+aiosqlite:///bench.db"
+        ),
+        help="база для замеров; схема пересоздается",
+    )
+    parser.add_argument("--users", type=int, default=SeedConfig.users)
+    parser.add_argument("--following", type=int, default=SeedConfig.following)
+    parser.add_argument(
+        "--tweets-per-user", type=int, default=SeedConfig.tweets_per_user
+    )
+    parser.add_argument(
+        "--likes-per-user", type=int, default=SeedConfig.likes_per_user
+    )
+    parser.add_argument("--alpha", type=float, default=SeedConfig.alpha)
+    parser.add_argument("--seed", type=int, default=SeedConfig.seed)
+    parser.add_argument("--requests", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="по умолчанию все",
+    )
+    args = parser.parse_args(argv)
+
+    config = SeedConfig(
+        users=args.users,
+        following=args.following,
+        tweets_per_user=args.tweets_per_user,
+        likes_per_user=args.likes_per_user,
+        alpha=args.alpha,
+        seed=args.seed,
+    )
+    results = asyncio.run(
+        bench(
+            args.db_url,
+            config,
+            args.scenario or list(SCENARIOS),
+            args.requests,
+            args.concurrency,
+        )
+    )
+    print(HEADER)
+    for result in results:
+        print(result.row())
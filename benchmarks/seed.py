@@ -0,0 +1,168 @@
+"""
+Генерация социального графа для замеров: пользователи, подписки со
+степенным распределением популярности, твиты, лайки и медиа.
+"""
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.bulk import load_rows
+from database.models import (
+    Base,
+    Tweet,
+    TweetLike,
+    TweetMedia,
+    User,
+    home_timeline,
+    user_to_user,
+)
+from utils.settings import get_settings
+
+
+@dataclass
+class SeedConfig:
+    """Размеры набора данных."""
+
+    users: int = 1_000
+    following: int = 50
+    tweets_per_user: int = 20
+    likes_per_user: int = 100
+    media_ratio: float = 0.1
+    # показатель степенного закона: чем больше, тем сильнее перекос
+    alpha: float = 1.1
+    seed: int = 42
+
+
+@dataclass
+class Dataset:
+    """
+    Что сгенерировано: нужно сценариям, чтобы выбирать цели.
+
+    Таблицы грузятся через `database.bulk` (COPY на PostgreSQL).
+    """
+
+    users: int
+    tweets: int
+
+
+def api_key(user_id: int) -> str:
+    return f"bench-{user_id}"
+
+
+def _popularity(config: SeedConfig, rnd: random.Random) -> list[float]:
+    """Накопленные веса пользователей по закону Ципфа."""
+    ranks = list(range(1, config.users + 1))
+    rnd.shuffle(ranks)
+    return list(accumulate(1 / rank**config.alpha for rank in ranks))
+
+
+def _follows(
+    config: SeedConfig, rnd: random.Random, weights: list[float]
+) -> list[dict]:
+    user_ids = range(1, config.users + 1)
+    k = min(config.following, config.users - 1)
+    follows = []
+    for follower in user_ids:
+        followees = set(rnd.choices(user_ids, cum_weights=weights, k=k))
+        followees.discard(follower)
+        follows += [
+            {"followers_id": follower, "following_id": followee}
+            for followee in followees
+        ]
+    return follows
+
+
+def _tweets(config: SeedConfig, rnd: random.Random) -> list[dict]:
+    now = datetime.utcnow()
+    tweets = []
+    for author in range(1, config.users + 1):
+        for _ in range(config.tweets_per_user):
+            idx = len(tweets) + 1
+            age = timedelta(seconds=rnd.randrange(30 * 24 * 3600))
+            tweets.append(
+                {
+                    "id": idx,
+                    "content": f"tweet {idx} by {author}",
+                    "user_id": author,
+                    "created_at": now - age,
+                }
+            )
+    return tweets
+
+
+def _likes(
+    config: SeedConfig,
+    rnd: random.Random,
+    weights: list[float],
+    tweets: list[dict],
+) -> list[dict]:
+    """Лайки, чаще твитам популярных авторов."""
+    user_ids = range(1, config.users + 1)
+    by_author: dict[int, list[dict]] = {}
+    for tweet in tweets:
+        by_author.setdefault(tweet["user_id"], []).append(tweet)
+
+    likes = []
+    for user in user_ids:
+        authors = rnd.choices(
+            user_ids, cum_weights=weights, k=config.likes_per_user
+        )
+        liked = {}
+        for author in authors:
+            if by_author.get(author):
+                tweet = rnd.choice(by_author[author])
+                liked[tweet["id"]] = tweet
+        likes += [{"tweet_id": t, "user_id": user} for t in liked]
+    return likes
+
+
+async def seed(engine: AsyncEngine, config: SeedConfig) -> Dataset:
+    """Пересоздает схему и заполняет ее данными."""
+    rnd = random.Random(config.seed)
+    weights = _popularity(config, rnd)
+
+    users = [
+        {"id": i, "name": f"user {i}", "api_key": api_key(i)}
+        for i in range(1, config.users + 1)
+    ]
+    follows = _follows(config, rnd, weights)
+    tweets = _tweets(config, rnd)
+    likes = _likes(config, rnd, weights, tweets)
+    media = [
+        {"url": f"/images/bench/{tweet['id']}.png", "tweet_id": tweet["id"]}
+        for tweet in tweets
+        if rnd.random() < config.media_ratio
+    ]
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await load_rows(conn, User.__table__, users)
+        await load_rows(conn, user_to_user, follows)
+        await load_rows(conn, Tweet.__table__, tweets)
+        await load_rows(conn, TweetLike.__table__, likes)
+        await load_rows(conn, TweetMedia.__table__, media)
+        if get_settings().fanout_on_write:
+            await _fill_home_timelines(conn)
+
+    return Dataset(users=config.users, tweets=len(tweets))
+
+
+async def _fill_home_timelines(conn) -> None:
+    """
+    Ленты fan-out-on-write: свои твиты и твиты всех, на кого подписан.
+    Заполняются, только если fan-out включен: на больших графах это
+    самая долгая часть заполнения.
+    """
+    t = Tweet.__table__
+    own = select(t.c.user_id, t.c.id, t.c.user_id, t.c.created_at)
+    followed = select(
+        user_to_user.c.followers_id, t.c.id, t.c.user_id, t.c.created_at
+    ).join(user_to_user, user_to_user.c.following_id == t.c.user_id)
+    columns = ["user_id", "tweet_id", "author_id", "created_at"]
+    for rows in (own, followed):
+        await conn.execute(insert(home_timeline).from_select(columns, rows))
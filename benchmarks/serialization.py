@@ -0,0 +1,78 @@
+"""
+Микро-замер сериализации страницы ленты: ORM-сущности через pydantic
+`TweetsOut` (как FastAPI с `response_model`) против `TimelineRow` через
+`timeline_payload` и orjson. База не нужна.
+
+    python -m benchmarks.serialization --tweets 200 --likes 20
+"""
+import argparse
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from database.models import Tweet, TweetLike, TweetMedia, User
+from schemas.tweet_schema import TweetsOut
+from utils.pagination import Page
+from utils.serialization import FastJSONResponse, timeline_payload
+from utils.service import TimelineRow
+
+
+def orm_page(tweets: int, likes: int) -> list[Tweet]:
+    users = [User(id=i, name=f"user {i}") for i in range(likes + 1)]
+    return [
+        Tweet(
+            id=i,
+            content=f"tweet {i}",
+            like_count=likes,
+            author=users[0],
+            likes=[TweetLike(user=u, user_id=u.id) for u in users[1:]],
+            tweet_media_ids=[TweetMedia(url=f"/images/{i}.png")],
+        )
+        for i in range(tweets)
+    ]
+
+
+def row_page(tweets: int, likes: int) -> list[TimelineRow]:
+    likers = [(i, f"user {i}") for i in range(1, likes + 1)]
+    return [
+        TimelineRow(
+            i, f"tweet {i}", likes, 0, "user 0", [f"/images/{i}.png"], likers
+        )
+        for i in range(tweets)
+    ]
+
+
+def pydantic_path(tweets: list[Tweet]) -> bytes:
+    # как FastAPI: валидация `response_model` и jsonable_encoder
+    value = TweetsOut.validate({"tweets": tweets, "next_cursor": None})
+    return JSONResponse(jsonable_encoder(value, by_alias=True)).body
+
+
+def fast_path(rows: list[TimelineRow]) -> bytes:
+    page = Page(items=rows, next_cursor=None)
+    return FastJSONResponse(timeline_payload(page)).body
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tweets", type=int, default=50)
+    parser.add_argument("--likes", type=int, default=20)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    tweets = orm_page(args.tweets, args.likes)
+    rows = row_page(args.tweets, args.likes)
+    results = {
+        "pydantic": timeit.timeit(
+            lambda: pydantic_path(tweets), number=args.number
+        ),
+        "fast": timeit.timeit(lambda: fast_path(rows), number=args.number),
+    }
+    for name, seconds in results.items():
+        print(f"{name:<10} {seconds / args.number * 1000:>8.2f} ms/page")
+    print(f"speedup    {results['pydantic'] / results['fast']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Модуль содержит массовую загрузку и выгрузку таблиц в CSV/NDJSON.
+
+На PostgreSQL (asyncpg) строки идут через `COPY` пачками по
+`batch_size`, на остальных диалектах - через executemany. Память
+ограничена одной пачкой. Запуск из командной строки:
+
+    python -m database.bulk import tweets tweets.csv
+    python -m database.bulk export tweet_likes likes.ndjson
+
+Загрузка не раскладывает твиты по `home_timelines`: при
+`FANOUT_ON_WRITE` ленты затронутых юзеров нужно заполнить заново через
+`Dal.backfill_timeline`.
+"""
+import argparse
+import asyncio
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from sqlalchemy import Table, func, insert, select, text, update
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    create_async_engine,
+)
+
+from database.models import Base, Tweet, TweetLike, User, user_to_user
+from utils.search import tweet_index
+from utils.settings import get_db_url
+
+BULK_TABLES = (
+    "users",
+    "tweets",
+    "user_follows",
+    "tweet_likes",
+    "tweet_media",
+)
+BATCH_SIZE = 10_000
+# колонки, по значениям которых пересчитываются счетчики и версии
+AFFECTED_KEYS = {
+    "tweets": ("user_id",),
+    "tweet_likes": ("tweet_id",),
+    "user_follows": ("followers_id", "following_id"),
+}
+
+
+def _format(path: Path, fmt: str | None) -> str:
+    fmt = fmt or path.suffix.lstrip(".")
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError(f"Unknown format {fmt!r}, expected csv or ndjson")
+    return fmt
+
+
+def _table(name: str) -> Table:
+    if name not in BULK_TABLES:
+        raise ValueError(f"Unknown table {name!r}, expected {BULK_TABLES}")
+    return Base.metadata.tables[name]
+
+
+def read_rows(path: Path, fmt: str) -> Iterator[dict[str, Any]]:
+    """Построчно читает CSV с заголовком или NDJSON."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _parse(column, value: Any) -> Any:
+    if value is None or value == "" and column.nullable:
+        return None
+    python_type = column.type.python_type
+    if isinstance(value, python_type):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def _converter(
+    table: Table, columns: list[str]
+) -> Callable[[dict], tuple[Any, ...]]:
+    """Строка файла -> кортеж значений колонок нужных типов."""
+    unknown = set(columns) - set(table.c.keys())
+    if unknown:
+        raise ValueError(f"Unknown columns for {table.name}: {unknown}")
+    table_columns = [table.c[name] for name in columns]
+    return lambda row: tuple(
+        _parse(column, row.get(column.name)) for column in table_columns
+    )
+
+
+def _batches(rows: Iterator[Any], size: int) -> Iterator[list[Any]]:
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _affected(
+    table: Table, columns: list[str], records: list[tuple]
+) -> set[int]:
+    """Значения ключевых колонок пачки (авторы, твиты, юзеры подписок)."""
+    positions = [
+        columns.index(name)
+        for name in AFFECTED_KEYS.get(table.name, ())
+        if name in columns
+    ]
+    return {record[i] for record in records for i in positions}
+
+
+async def _copy_batch(
+    conn: AsyncConnection, table: Table, columns: list[str], records: list
+) -> None:
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        table.name, records=records, columns=columns
+    )
+
+
+async def _after_load(
+    conn: AsyncConnection, table: Table, keys: set[int]
+) -> None:
+    """
+    Сдвигает последовательность id, пересчитывает счетчики и версии
+    затронутых юзеров и твитов. `keys` - значения колонок `AFFECTED_KEYS`.
+    """
+    if conn.dialect.name == "postgresql" and "id" in table.c:
+        await conn.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'),"
+                f" (SELECT max(id) FROM {table.name}))"
+            )
+        )
+    if table.name == Tweet.__tablename__:
+        # индекс поиска в памяти не видит вставок мимо ORM
+        tweet_index.clear()
+
+    users = User.__table__
+    follows = user_to_user.c
+    # пачками, чтобы не упереться в лимит параметров запроса
+    for chunk in _batches(iter(sorted(keys)), BATCH_SIZE):
+        if table.name == Tweet.__tablename__:
+            await conn.execute(
+                update(users)
+                .where(users.c.id.in_(chunk))
+                .values(feed_version=users.c.feed_version + 1)
+            )
+        if table.name == TweetLike.__tablename__:
+            likes = (
+                select(func.count())
+                .where(TweetLike.tweet_id == Tweet.id)
+                .scalar_subquery()
+            )
+            await conn.execute(
+                update(Tweet.__table__)
+                .where(Tweet.id.in_(chunk))
+                .values(like_count=likes)
+            )
+            authors = select(Tweet.user_id).where(Tweet.id.in_(chunk))
+            await conn.execute(
+                update(users)
+                .where(users.c.id.in_(authors))
+                .values(feed_version=users.c.feed_version + 1)
+            )
+        if table is user_to_user:
+            await conn.execute(
+                update(users)
+                .where(users.c.id.in_(chunk))
+                .values(
+                    graph_version=users.c.graph_version + 1,
+                    followers_count=select(func.count())
+                    .where(follows.following_id == User.id)
+                    .scalar_subquery(),
+                    following_count=select(func.count())
+                    .where(follows.followers_id == User.id)
+                    .scalar_subquery(),
+                )
+            )
+
+
+async def load_rows(
+    conn: AsyncConnection,
+    table: Table,
+    rows: Iterable[dict[str, Any]],
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Загружает строки в таблицу в транзакции `conn`, возвращает их число.
+
+    После загрузки сдвигает последовательность id, пересчитывает
+    `tweets.like_count` и счетчики подписок затронутых юзеров и меняет их
+    `feed_version`/`graph_version`, чтобы клиенты не получили старый 304.
+    """
+    loaded = 0
+    keys: set[int] = set()
+    use_copy = conn.dialect.driver == "asyncpg"
+    if use_copy:
+        # заодно открывает транзакцию, в которой пойдет COPY
+        await conn.execute(text("SET LOCAL synchronous_commit TO OFF"))
+    for batch in _batches(iter(rows), batch_size):
+        columns = list(batch[0])
+        convert = _converter(table, columns)
+        records = [convert(row) for row in batch]
+        if use_copy:
+            await _copy_batch(conn, table, columns, records)
+        else:
+            await conn.execute(
+                insert(table),
+                [dict(zip(columns, record)) for record in records],
+            )
+        keys |= _affected(table, columns, records)
+        loaded += len(records)
+    await _after_load(conn, table, keys)
+    return loaded
+
+
+async def load(
+    engine: AsyncEngine,
+    table_name: str,
+    path: Path,
+    fmt: str | None = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Загружает файл в таблицу одной транзакцией, возвращает число строк.
+
+    :raises ValueError: Неизвестные таблица, формат или колонки.
+    """
+    table = _table(table_name)
+    rows = read_rows(path, _format(path, fmt))
+    async with engine.begin() as conn:
+        return await load_rows(conn, table, rows, batch_size)
+
+
+def _jsonable(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def dump(
+    engine: AsyncEngine,
+    table_name: str,
+    path: Path,
+    fmt: str | None = None,
+) -> None:
+    """Выгружает таблицу в файл; CSV на PostgreSQL - через `COPY TO`."""
+    table = _table(table_name)
+    fmt = _format(path, fmt)
+    async with engine.connect() as conn:
+        if fmt == "csv" and conn.dialect.driver == "asyncpg":
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_from_table(
+                table.name,
+                columns=table.c.keys(),
+                output=str(path),
+                format="csv",
+                header=True,
+            )
+            return
+
+        result = await conn.stream(
+            select(table).order_by(*table.primary_key.columns)
+        )
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if fmt == "csv":
+                writer.writerow(table.c.keys())
+            async for row in result:
+                if fmt == "csv":
+                    writer.writerow(row)
+                else:
+                    record = {k: _jsonable(v) for k, v in row._mapping.items()}
+                    f.write(json.dumps(record) + "\n")
+
+
+async def _run(args: argparse.Namespace) -> None:
+    engine = create_async_engine(args.db_url)
+    try:
+        if args.command == "import":
+            count = await load(
+                engine, args.table, args.path, args.format, args.batch_size
+            )
+            print(f"{args.table}: {count} rows loaded")
+        else:
+            await dump(engine, args.table, args.path, args.format)
+    finally:
+        await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk import/export.")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("table", choices=BULK_TABLES)
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=("csv", "ndjson"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--db-url", default=None)
+    args = parser.parse_args(argv)
+    args.db_url = args.db_url or get_db_url()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
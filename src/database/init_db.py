@@ -1,17 +1,93 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from fastapi import Request
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from database.pool import InstrumentedAsyncPool
+from database.replicas import SessionRouter
+from utils.settings import get_db_url, get_replica_urls, get_settings
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def pool_limits() -> tuple[int, int]:
+    """
+    `(pool_size, max_overflow)` воркера: настройки пула, урезанные до доли
+    воркера в `db_max_connections`. Брокер postgres держит еще 3
+    соединения на воркер.
+    """
+    s = get_settings()
+    share = s.db_max_connections // max(s.workers, 1)
+    if s.stream_broker == 'postgres':
+        share -= 3
+    share = max(share, 1)
+
+    pool_size = min(s.db_pool_size, share)
+    return pool_size, min(s.db_max_overflow, share - pool_size)
+
+
+def engine_options(url: str) -> dict:
+    """Параметры пула соединений и драйвера из настроек."""
+    s = get_settings()
+    pool_size, max_overflow = pool_limits()
+    options = dict(
+        poolclass=InstrumentedAsyncPool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=s.db_pool_timeout,
+        pool_recycle=s.db_pool_recycle,
+        pool_pre_ping=s.db_pool_pre_ping,
+    )
+    if make_url(url).get_driver_name() == 'asyncpg':
+        # 0 отключает кэш подготовленных выражений (нужно за pgbouncer)
+        options['connect_args'] = {
+            'statement_cache_size': s.db_statement_cache_size,
+            'prepared_statement_cache_size': s.db_statement_cache_size,
+        }
+    return options
 
-from utils.settings import get_db_url
 
 url = get_db_url()
 async_engine = create_async_engine(
     url,
     # echo=True
+    **engine_options(url),
 )
 Session = async_sessionmaker(
     bind=async_engine, expire_on_commit=False, class_=AsyncSession
 )
+session_router = SessionRouter(
+    Session,
+    [
+        create_async_engine(replica, **engine_options(replica))
+        for replica in get_replica_urls()
+    ],
+    sticky_seconds=get_settings().replica_sticky_seconds,
+    retry_seconds=get_settings().replica_retry_seconds,
+)
+
+
+async def dispose_engine() -> None:
+    """Закрывает соединения пулов при остановке воркера."""
+    await session_router.dispose()
+    await async_engine.dispose()
 
 
-async def db():  # noqa
+async def db(request: Request):  # noqa
+    """Сессия первичной БД; запрос на запись включает read-your-writes."""
+    if request.method not in READ_METHODS:
+        session_router.mark_write(request.headers.get('api-key'))
     async with Session() as session:
         yield session
+
+
+async def db_read(request: Request):
+    """Сессия для чтения: реплика или первичная БД."""
+    session = await session_router.read(request.headers.get('api-key'))
+    try:
+        yield session
+    finally:
+        await session.close()
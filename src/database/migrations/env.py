@@ -6,7 +6,7 @@ from sqlalchemy import pool
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
-from database.models import Base
+from database.models import TWEET_SEARCH_COLUMN, TWEET_SEARCH_INDEX, Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -40,6 +40,21 @@ def get_url():
 config.set_main_option("sqlalchemy.url", get_url())
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Skip the full-text search column and index.
+
+    They are created by raw DDL on PostgreSQL only and are not part of
+    the metadata, so autogenerate would otherwise drop them.
+    """
+    if type_ == "column" and reflected and compare_to is None:
+        return not (
+            object.table.name == "tweets" and name == TWEET_SEARCH_COLUMN
+        )
+    if type_ == "index" and reflected and compare_to is None:
+        return name != TWEET_SEARCH_INDEX
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -57,6 +72,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -66,7 +82,11 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,28 @@
+"""tweets timeline keyset index
+
+Revision ID: a1c3e5f7b9d2
+Revises: f4398eb0d2a4
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b9d2'
+down_revision = 'f4398eb0d2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_tweets_user_id_created_at_id',
+        'tweets',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweets_user_id_created_at_id', table_name='tweets')
@@ -0,0 +1,52 @@
+"""home timelines for fan-out-on-write
+
+Revision ID: b2d4f6a8c0e1
+Revises: a1c3e5f7b9d2
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c0e1'
+down_revision = 'a1c3e5f7b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('home_timelines',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tweet_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['tweet_id'], ['tweets.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'tweet_id')
+    )
+    op.create_index(
+        'ix_home_timelines_user_id_created_at_tweet_id',
+        'home_timelines',
+        ['user_id', sa.text('created_at DESC'), sa.text('tweet_id DESC')],
+        unique=False,
+    )
+
+    # раскладываем уже существующие твиты по лентам авторов и подписчиков
+    op.execute(
+        """
+        INSERT INTO home_timelines (user_id, tweet_id, author_id, created_at)
+        SELECT t.user_id, t.id, t.user_id, t.created_at FROM tweets t
+        UNION
+        SELECT f.followers_id, t.id, t.user_id, t.created_at
+        FROM tweets t JOIN user_follows f ON f.following_id = t.user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_home_timelines_user_id_created_at_tweet_id',
+        table_name='home_timelines',
+    )
+    op.drop_table('home_timelines')
@@ -0,0 +1,32 @@
+"""tweets like_count counter
+
+Revision ID: c3e5a7b9d1f2
+Revises: b2d4f6a8c0e1
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d1f2'
+down_revision = 'b2d4f6a8c0e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tweets', sa.Column('like_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.execute(
+        """
+        UPDATE tweets SET like_count = l.cnt
+        FROM (
+            SELECT tweet_id, count(*) AS cnt FROM tweet_likes GROUP BY tweet_id
+        ) AS l
+        WHERE l.tweet_id = tweets.id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('tweets', 'like_count')
@@ -0,0 +1,31 @@
+"""tweet_media content hash
+
+Revision ID: d4f6b8c0e2a3
+Revises: c3e5a7b9d1f2
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6b8c0e2a3'
+down_revision = 'c3e5a7b9d1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tweet_media', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(
+        'ix_tweet_media_content_hash_unattached',
+        'tweet_media',
+        ['content_hash'],
+        unique=True,
+        postgresql_where=sa.text('tweet_id IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweet_media_content_hash_unattached', table_name='tweet_media')
+    op.drop_column('tweet_media', 'content_hash')
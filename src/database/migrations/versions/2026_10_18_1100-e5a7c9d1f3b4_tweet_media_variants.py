@@ -0,0 +1,25 @@
+"""tweet_media image variants
+
+Revision ID: e5a7c9d1f3b4
+Revises: d4f6b8c0e2a3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9d1f3b4'
+down_revision = 'd4f6b8c0e2a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tweet_media', sa.Column('thumb_url', sa.String(), nullable=True))
+    op.add_column('tweet_media', sa.Column('feed_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tweet_media', 'feed_url')
+    op.drop_column('tweet_media', 'thumb_url')
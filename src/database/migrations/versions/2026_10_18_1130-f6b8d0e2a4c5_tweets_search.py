@@ -0,0 +1,34 @@
+"""tweets full-text search column
+
+Revision ID: f6b8d0e2a4c5
+Revises: e5a7c9d1f3b4
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f6b8d0e2a4c5'
+down_revision = 'e5a7c9d1f3b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        ALTER TABLE tweets ADD COLUMN content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+        """
+    )
+    op.create_index(
+        'ix_tweets_content_tsv',
+        'tweets',
+        ['content_tsv'],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweets_content_tsv', table_name='tweets')
+    op.drop_column('tweets', 'content_tsv')
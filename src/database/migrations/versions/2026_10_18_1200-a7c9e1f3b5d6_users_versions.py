@@ -0,0 +1,25 @@
+"""users feed and graph version counters
+
+Revision ID: a7c9e1f3b5d6
+Revises: f6b8d0e2a4c5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1f3b5d6'
+down_revision = 'f6b8d0e2a4c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('feed_version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('users', sa.Column('graph_version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'graph_version')
+    op.drop_column('users', 'feed_version')
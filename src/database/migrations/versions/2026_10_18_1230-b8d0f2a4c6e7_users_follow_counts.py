@@ -0,0 +1,40 @@
+"""users follow counters and reverse follows index
+
+Revision ID: b8d0f2a4c6e7
+Revises: a7c9e1f3b5d6
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b8d0f2a4c6e7'
+down_revision = 'a7c9e1f3b5d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('users', sa.Column('following_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.create_index('ix_user_follows_following_id_followers_id', 'user_follows', ['following_id', 'followers_id'], unique=False)
+    op.execute(
+        """
+        UPDATE users SET
+            followers_count = (
+                SELECT count(*) FROM user_follows
+                WHERE user_follows.following_id = users.id
+            ),
+            following_count = (
+                SELECT count(*) FROM user_follows
+                WHERE user_follows.followers_id = users.id
+            )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_follows_following_id_followers_id', table_name='user_follows')
+    op.drop_column('users', 'following_count')
+    op.drop_column('users', 'followers_count')
@@ -0,0 +1,53 @@
+"""tweet_media uploader
+
+Revision ID: c9e1a3b5d7f8
+Revises: b8d0f2a4c6e7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1a3b5d7f8'
+down_revision = 'b8d0f2a4c6e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('tweet_media', sa.Column('uploader_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('tweet_media_uploader_id_fkey', 'tweet_media', 'users', ['uploader_id'], ['id'], ondelete='SET NULL')
+    # загрузившего старые неприкрепленные файлы не восстановить, а без него
+    # прикрепить их нельзя: удаляем записи, клиент загрузит файл заново
+    op.execute("DELETE FROM tweet_media WHERE tweet_id IS NULL")
+    op.drop_index('ix_tweet_media_content_hash_unattached', table_name='tweet_media')
+    op.create_index(
+        'ix_tweet_media_uploader_id_content_hash_unattached',
+        'tweet_media',
+        ['uploader_id', 'content_hash'],
+        unique=True,
+        postgresql_where=sa.text('tweet_id IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tweet_media_uploader_id_content_hash_unattached', table_name='tweet_media')
+    # без загрузившего одинаковые неприкрепленные файлы снова должны быть
+    # одной записью: оставляем самую раннюю
+    op.execute(
+        """
+        DELETE FROM tweet_media AS m USING tweet_media AS first
+        WHERE m.tweet_id IS NULL AND first.tweet_id IS NULL
+            AND m.content_hash = first.content_hash AND m.id > first.id
+        """
+    )
+    op.create_index(
+        'ix_tweet_media_content_hash_unattached',
+        'tweet_media',
+        ['content_hash'],
+        unique=True,
+        postgresql_where=sa.text('tweet_id IS NULL'),
+    )
+    op.drop_constraint('tweet_media_uploader_id_fkey', 'tweet_media', type_='foreignkey')
+    op.drop_column('tweet_media', 'uploader_id')
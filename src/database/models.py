@@ -3,7 +3,19 @@
 """
 from datetime import datetime
 
-from sqlalchemy import Column, ForeignKey, Integer, Table, func, text
+from sqlalchemy import (
+    DDL,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Table,
+    event,
+    func,
+    text,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -16,6 +28,12 @@ user_to_user = Table(
     Base.metadata,
     Column("followers_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("following_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # PK обслуживает "на кого подписан", индекс - "кто подписан"
+    Index(
+        "ix_user_follows_following_id_followers_id",
+        "following_id",
+        "followers_id",
+    ),
 )
 
 
@@ -27,8 +45,12 @@ class User(Base):
         id - уникальный идентификатор юзера в БД, int
         username - имя юзера, str
         api_key - идентификатор на сервисе, str (хедер `api-key` запроса)
+        feed_version - версия твитов юзера и лайков на них, int
+        graph_version - версия подписок и подписчиков юзера, int
+        followers_count, following_count - число подписчиков и подписок
+            (денормализовано, ведется при подписке), int
 
-    relations:
+    relations (не загружаются неявно, только через options запроса):
         tweets - твиты, написанные юзером, o2m
         followers - юзеры, подписанные на текущего юзера, m2m
         following - юзеры, на которых подписан текущий юзер, m2m
@@ -41,16 +63,29 @@ class User(Base):
     )
     name: Mapped[str] = mapped_column(nullable=False, unique=True, index=True)
     tweets: Mapped[list['Tweet']] = relationship(
-        back_populates='author', cascade='all, delete-orphan', lazy='selectin'
+        back_populates='author', cascade='all, delete-orphan', lazy='raise'
     )
     api_key: Mapped[str] = mapped_column(unique=True, index=True)
+    # счетчики изменений для ETag ленты и профиля
+    feed_version: Mapped[int] = mapped_column(
+        default=0, server_default=text('0')
+    )
+    graph_version: Mapped[int] = mapped_column(
+        default=0, server_default=text('0')
+    )
+    followers_count: Mapped[int] = mapped_column(
+        default=0, server_default=text('0')
+    )
+    following_count: Mapped[int] = mapped_column(
+        default=0, server_default=text('0')
+    )
     followers = relationship(
         "User",
         secondary=user_to_user,
         primaryjoin=id == user_to_user.c.following_id,
         secondaryjoin=id == user_to_user.c.followers_id,
         back_populates="following",
-        lazy='selectin'
+        lazy='raise',
     )
     following = relationship(
         "User",
@@ -58,7 +93,7 @@ class User(Base):
         primaryjoin=id == user_to_user.c.followers_id,
         secondaryjoin=id == user_to_user.c.following_id,
         back_populates="followers",
-        lazy='selectin'
+        lazy='raise',
     )
 
     def __repr__(self):
@@ -73,6 +108,7 @@ class Tweet(Base):
         id - уникальный идентификатор юзера в БД, int
         content - содержание твита, str
         user_id - id автора
+        like_count - количество лайков (денормализовано, ведется при лайке)
 
     relations:
         likes - o2m связь с лайками
@@ -91,7 +127,14 @@ class Tweet(Base):
     created_at: Mapped[datetime] = mapped_column(
         server_default=text('CURRENT_TIMESTAMP')
     )
-    tweet_media_ids: Mapped[list['TweetMedia']] = relationship(lazy='selectin')
+    like_count: Mapped[int] = mapped_column(
+        default=0, server_default=text('0')
+    )
+    # без каскада удаление твита обнулило бы tweet_id у его медиа, и они
+    # столкнулись бы с такой же неприкрепленной загрузкой в частичном индексе
+    tweet_media_ids: Mapped[list['TweetMedia']] = relationship(
+        lazy='selectin', cascade="all, delete-orphan"
+    )
 
     likes: Mapped[list['TweetLike']] = relationship(
         back_populates='tweet', lazy='selectin', cascade="all, delete-orphan"
@@ -105,6 +148,61 @@ class Tweet(Base):
         return f'Tweet(id={self.id}, user={self.author.name}'
 
 
+# индекс под keyset-пагинацию ленты: каждая страница - range scan по автору
+Index(
+    'ix_tweets_user_id_created_at_id',
+    Tweet.user_id,
+    Tweet.created_at.desc(),
+    Tweet.id.desc(),
+)
+
+# полнотекстовый поиск (только PostgreSQL): генерируемая колонка tsvector
+# не отображена в модель, чтобы схема оставалась переносимой; autogenerate
+# пропускает ее и индекс (include_object в migrations/env.py)
+SEARCH_CONFIG = 'simple'
+TWEET_SEARCH_COLUMN = 'content_tsv'
+TWEET_SEARCH_INDEX = f'ix_tweets_{TWEET_SEARCH_COLUMN}'
+for ddl in (
+    f"ALTER TABLE tweets ADD COLUMN {TWEET_SEARCH_COLUMN} tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}', content)) STORED",
+    f"CREATE INDEX {TWEET_SEARCH_INDEX} "
+    f"ON tweets USING gin ({TWEET_SEARCH_COLUMN})",
+):
+    event.listen(
+        Tweet.__table__,
+        'after_create',
+        DDL(ddl).execute_if(dialect='postgresql'),
+    )
+
+
+# предрассчитанные ленты (fan-out-on-write): строка на каждого получателя твита
+home_timeline = Table(
+    "home_timelines",
+    Base.metadata,
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "tweet_id",
+        Integer,
+        ForeignKey("tweets.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column("author_id", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+Index(
+    'ix_home_timelines_user_id_created_at_tweet_id',
+    home_timeline.c.user_id,
+    home_timeline.c.created_at.desc(),
+    home_timeline.c.tweet_id.desc(),
+)
+
+
 class TweetMedia(Base):
     """
     Модель меда в твите
@@ -113,6 +211,10 @@ class TweetMedia(Base):
         id - уникальный идентификатор в БД, int
         url - адрес до файла на nginx?
         tweet_id - id твита, к которому этот медиа-файл прикреплен
+        uploader_id - id загрузившего юзера, только он может прикрепить файл
+        content_hash - sha256 содержимого файла
+        thumb_url - адрес превью, если картинку удалось обработать
+        feed_url - адрес варианта под ширину ленты
     """
 
     __tablename__ = 'tweet_media'
@@ -124,11 +226,33 @@ class TweetMedia(Base):
     tweet_id: Mapped[int] = mapped_column(
         ForeignKey('tweets.id'), nullable=True
     )
+    uploader_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='SET NULL'), nullable=True
+    )
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=True)
+    thumb_url: Mapped[str] = mapped_column(nullable=True)
+    feed_url: Mapped[str] = mapped_column(nullable=True)
+
+    @property
+    def display_url(self) -> str:
+        """Адрес для ленты: уменьшенный вариант, если есть, иначе оригинал"""
+        return self.feed_url or self.url
 
     def __repr__(self):
         return f'TweetMedia(tweet_id={self.tweet_id}, url={self.url}'
 
 
+# одинаковые загрузки юзера, еще не прикрепленные к твиту - одна запись
+Index(
+    'ix_tweet_media_uploader_id_content_hash_unattached',
+    TweetMedia.uploader_id,
+    TweetMedia.content_hash,
+    unique=True,
+    postgresql_where=TweetMedia.tweet_id.is_(None),
+    sqlite_where=TweetMedia.tweet_id.is_(None),
+)
+
+
 class TweetLike(Base):
     """
     Модель лайка твита
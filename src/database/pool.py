@@ -0,0 +1,69 @@
+"""
+Модуль содержит пул соединений с метриками ожидания соединения
+"""
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Счетчики выдачи соединений из пула."""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.checkout_seconds = 0.0
+        self.checkout_max_seconds = 0.0
+
+    def observe(self, seconds: float, waited: bool) -> None:
+        self.checkouts += 1
+        self.waits += waited
+        self.checkout_seconds += seconds
+        self.checkout_max_seconds = max(self.checkout_max_seconds, seconds)
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """
+    `AsyncAdaptedQueuePool`, который считает время получения соединения
+    (включая pre-ping) и сколько раз запросу пришлось ждать свободное
+    соединение.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        # свободных нет и новые открыть нельзя: соединение придется ждать
+        waited = (
+            self._max_overflow > -1
+            and self.checkedin() == 0
+            and self.overflow() >= self._max_overflow
+        )
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            self.metrics.waits += 1
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.observe(time.perf_counter() - start, waited)
+        return conn
+
+    def stats(self) -> dict:
+        """Состояние пула и счетчики для эндпоинта метрик."""
+        m = self.metrics
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "in_use": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": m.checkouts,
+            "waits": m.waits,
+            "timeouts": m.timeouts,
+            "checkout_seconds_total": m.checkout_seconds,
+            "checkout_seconds_max": m.checkout_max_seconds,
+        }
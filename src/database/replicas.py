@@ -0,0 +1,146 @@
+"""
+Модуль содержит маршрутизацию чтения на реплики БД.
+
+GET-маршруты берут сессию у `SessionRouter.read`: реплика по кругу, а
+первичная БД - если реплик нет, все недоступны или клиент недавно писал
+(read-your-writes). Недоступная реплика исключается на `retry_seconds`
+и проверяется снова при следующем чтении.
+"""
+import asyncio
+import time
+from typing import Callable
+
+from loguru import logger
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
+
+# ошибки подключения, после которых чтение уходит на первичную БД
+CONNECT_ERRORS = (DBAPIError, OSError, asyncio.TimeoutError)
+
+
+class StickyWindow:
+    """
+    Ключи клиентов, недавно писавших в БД, с TTL.
+
+    Окно локально для процесса, как и кэш api key: запрос, попавший на
+    другой воркер, может прочитать реплику раньше.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 100_000,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._timer = timer
+        self._until: dict[str, float] = {}
+
+    def mark(self, key: str) -> None:
+        """Открывает окно чтения с первичной БД для ключа."""
+        if self.ttl <= 0:
+            return
+        now = self._timer()
+        if len(self._until) >= self.maxsize:
+            self._until = {k: t for k, t in self._until.items() if t > now}
+        self._until[key] = now + self.ttl
+
+    def active(self, key: str) -> bool:
+        until = self._until.get(key)
+        if until is None:
+            return False
+        if until <= self._timer():
+            del self._until[key]
+            return False
+        return True
+
+
+class Replica:
+    """Реплика: движок, фабрика сессий и время повторной проверки."""
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.sessionmaker = async_sessionmaker(
+            bind=engine, expire_on_commit=False, class_=AsyncSession
+        )
+        self.down_until = 0.0
+
+
+class SessionRouter:
+    """Фабрика сессий: запись - в первичную БД, чтение - на реплики."""
+
+    def __init__(
+        self,
+        primary: async_sessionmaker,
+        replicas: list[AsyncEngine],
+        sticky_seconds: float,
+        retry_seconds: float,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.primary = primary
+        self.replicas = [Replica(engine) for engine in replicas]
+        self.sticky = StickyWindow(sticky_seconds, timer=timer)
+        self.retry_seconds = retry_seconds
+        self._timer = timer
+        self._next = 0
+        self.counters = dict(replica_reads=0, primary_reads=0, failovers=0)
+
+    def mark_write(self, key: str | None) -> None:
+        """Следующие чтения клиента `key` идут в первичную БД."""
+        if key and self.replicas:
+            self.sticky.mark(key)
+
+    async def read(self, key: str | None = None) -> AsyncSession:
+        """
+        Сессия для чтения с уже полученным соединением. Реплика, к которой
+        не удалось подключиться, исключается, чтение переходит к следующей.
+        """
+        if not (key and self.sticky.active(key)):
+            for replica in self._healthy():
+                session = replica.sessionmaker()
+                try:
+                    await session.connection()
+                except CONNECT_ERRORS as exc:
+                    await session.close()
+                    self._mark_down(replica, exc)
+                    continue
+                self.counters["replica_reads"] += 1
+                return session
+
+        self.counters["primary_reads"] += 1
+        return self.primary()
+
+    def _healthy(self) -> list[Replica]:
+        """Доступные реплики по кругу, начиная со следующей."""
+        now = self._timer()
+        count = len(self.replicas)
+        start = self._next = (self._next + 1) % max(count, 1)
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [r for r in ordered if r.down_until <= now]
+
+    def _mark_down(self, replica: Replica, exc: Exception) -> None:
+        self.counters["failovers"] += 1
+        replica.down_until = self._timer() + self.retry_seconds
+        logger.warning(
+            f"replica {replica.engine.url!r} is down for "
+            f"{self.retry_seconds}s: {exc!r}"
+        )
+
+    def stats(self) -> dict[str, int]:
+        """Счетчики для мониторинга."""
+        now = self._timer()
+        healthy = sum(r.down_until <= now for r in self.replicas)
+        return {
+            **self.counters,
+            "replicas": len(self.replicas),
+            "healthy": healthy,
+        }
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
@@ -7,7 +7,7 @@ if USE_SENTRY:
     s = get_settings()
     sentry_sdk.init(
         dsn=s.sentry_dsn,
-        traces_sample_rate=1.0,
+        traces_sample_rate=s.sentry_traces_sample_rate,
     )
 
 app = create_app()
@@ -1,8 +1,19 @@
 from fastapi import FastAPI
 
+from database.init_db import async_engine, dispose_engine, session_router
+from routers.internal import router as internal
 from routers.media import router as media
+from routers.stream import router as stream
 from routers.tweets import router as tweets
 from routers.users import router as users
+from utils.batching import like_batcher, start_like_batcher
+from utils.caching import install_conditional_requests
+from utils.file_system import install_body_limit
+from utils.images import check_image_support, shutdown_pool
+from utils.metrics import instrument_app, instrument_engine
+from utils.query_budget import install_query_budget
+from utils.settings import get_settings
+from utils.stream import hub
 
 
 def create_app() -> FastAPI:
@@ -12,7 +23,7 @@ def create_app() -> FastAPI:
     :rtype: FastAPI
     """
     app = FastAPI(
-        debug=True,
+        debug=get_settings().debug,
         title='Twitter clone',
     )
     app.include_router(
@@ -27,5 +38,27 @@ def create_app() -> FastAPI:
         media,
         prefix="/api",
     )
+    app.include_router(
+        stream,
+        prefix="/api",
+    )
+    app.include_router(internal)
+    # внутренний слой: иначе 413 из чтения тела заворачивается в группу
+    # исключений задач BaseHTTPMiddleware и превращается в 400
+    install_body_limit(app)
+    instrument_app(app)
+    install_query_budget(app)
+    install_conditional_requests(app)
+    instrument_engine(async_engine)
+    for replica in session_router.replicas:
+        instrument_engine(replica.engine)
+    app.add_event_handler("startup", check_image_support)
+    app.add_event_handler("shutdown", shutdown_pool)
+    app.add_event_handler("startup", hub.start)
+    app.add_event_handler("startup", start_like_batcher)
+    # дописать принятые лайки, пока хаб и пул соединений еще открыты
+    app.add_event_handler("shutdown", like_batcher.stop)
+    app.add_event_handler("shutdown", hub.stop)
+    app.add_event_handler("shutdown", dispose_engine)
 
     return app
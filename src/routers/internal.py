@@ -0,0 +1,41 @@
+"""
+This module contains routes for router `internal`
+
+Not mounted under `/api`, so nginx does not expose it outside.
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from database.init_db import async_engine, session_router
+from utils.authentication import principal_cache
+from utils.metrics import registry, render_gauges
+from utils.stream import hub
+
+router = APIRouter(tags=['internal'], include_in_schema=False)
+
+
+@router.get('/internal/metrics')
+async def get_metrics():
+    """
+    connection pool, replica routing, api-key cache and stream counters
+    """
+    return {
+        "pool": async_engine.pool.stats(),
+        "replicas": session_router.stats(),
+        "auth_cache": principal_cache.stats(),
+        "stream": {"subscribers": len(hub)},
+    }
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """
+    request, query, pool and cache metrics in Prometheus text format
+    """
+    return (
+        registry.render()
+        + render_gauges("db_pool", async_engine.pool.stats())
+        + render_gauges("db_replicas", session_router.stats())
+        + render_gauges("auth_cache", principal_cache.stats())
+        + render_gauges("stream", {"subscribers": len(hub)})
+    )
@@ -1,28 +1,39 @@
 """
 This module contains routes for router `media`
 """
+from typing import Annotated
+
 from fastapi import APIRouter, Depends, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.init_db import db
 from schemas.media_schema import MediaOut
+from utils.authentication import Principal, get_current_user
+from utils.query_budget import query_budget
+from utils.responses import RESPONSE_401
 from utils.service import Dal
 
 router = APIRouter(prefix='/medias', tags=['media'], redirect_slashes=False)
 
 
-@router.post('', response_model=MediaOut, status_code=201)
+@router.post(
+    '', response_model=MediaOut, responses=RESPONSE_401, status_code=201
+)
+@query_budget(2)
 async def upload_files(
     file: UploadFile,
+    current_user: Annotated[Principal, Depends(get_current_user)],
     sess: AsyncSession = Depends(db),
 ):
     """
     upload given file
     validate and return id
     don't forget to get url
+
+    Only the uploader can attach the media to a tweet.
     """
 
     if not file:
         return {"message": "No upload file sent"}
 
-    return await Dal(sess).upload_file(file)
+    return await Dal(sess).upload_file(file, current_user.id)
@@ -0,0 +1,68 @@
+"""
+This module contains routes for router `stream`
+"""
+import json
+from typing import Annotated, AsyncIterator
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.init_db import db
+from utils.authentication import Principal, get_current_user
+from utils.query_budget import query_budget
+from utils.responses import RESPONSE_401
+from utils.service import Dal
+from utils.settings import STREAM_KEEPALIVE
+from utils.stream import Subscription, hub
+
+router = APIRouter(tags=['stream'])
+
+
+@router.get(
+    '/stream',
+    response_class=StreamingResponse,
+    responses=RESPONSE_401,
+    status_code=200,
+)
+@query_budget(2)
+async def stream(
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db)],
+):
+    """
+    Server-sent events for the current user's timeline.
+
+    Events: `tweet`, `tweet_deleted`, `like`, `unlike` of followed authors
+    and own ones, `follow` / `unfollow` of the current user, and `resync`
+    when the client fell behind and should re-fetch `/api/tweets/`.
+    """
+    authors = await Dal(sess).get_followee_ids(current_user.id)
+    # соединение с БД не держим открытым все время стрима
+    await sess.close()
+
+    subscription = hub.subscribe(current_user.id, authors)
+    return StreamingResponse(
+        event_stream(subscription),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def event_stream(
+    subscription: Subscription, keepalive: float = STREAM_KEEPALIVE
+) -> AsyncIterator[str]:
+    """
+    События подписки в формате SSE, комментарий-пинг при простое.
+    Отписывает при закрытии (клиент отключился).
+    """
+    try:
+        yield ': connected\n\n'
+        while True:
+            event = await subscription.get(keepalive)
+            if event is None:
+                yield ': ping\n\n'
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
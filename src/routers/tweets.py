@@ -3,40 +3,177 @@ This module contains routes for router `tweets`
 """
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.init_db import db
-from database.models import User
+from database.init_db import db, db_read
 from schemas.base_schema import BaseSchema
-from schemas.tweet_schema import TweetIn, TweetOut, TweetsOut
-from utils.authentication import get_current_user
-from utils.responses import RESPONSE_401_422_404, RESPONSE_401_422_404_403
+from schemas.tweet_schema import (
+    LikesMode,
+    LikesOut,
+    TweetIn,
+    TweetOut,
+    TweetsBatchIn,
+    TweetsBatchOut,
+    TweetsOut,
+)
+from utils.authentication import Principal, get_current_user
+from utils.batching import like_batcher
+from utils.caching import timeline_etag
+from utils.pagination import Page
+from utils.query_budget import query_budget
+from utils.responses import (
+    RESPONSE_401_422_400,
+    RESPONSE_401_422_404,
+    RESPONSE_401_422_404_403,
+)
+from utils.serialization import FastJSONResponse, timeline_payload
 from utils.service import Dal
+from utils.settings import (
+    LIKES_MAX_PAGE_SIZE,
+    LIKES_PAGE_SIZE,
+    LIKES_SAMPLE_SIZE,
+    SEARCH_MAX_QUERY,
+    TIMELINE_MAX_PAGE_SIZE,
+    TIMELINE_PAGE_SIZE,
+    get_settings,
+)
 
 router = APIRouter(prefix='/tweets', tags=['tweets'])
 
 
-@router.get('/', response_model=TweetsOut, status_code=200)
+@router.get(
+    '/',
+    response_model=TweetsOut,
+    response_class=FastJSONResponse,
+    status_code=200,
+)
+@query_budget(4)
 async def _get_tweets(
-    current_user: Annotated[User, Depends(get_current_user)],
-    sess: Annotated[AsyncSession, Depends(db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db_read)],
+    cache: Annotated[dict[str, str], Depends(timeline_etag)],
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Annotated[str | None, Query()] = None,
+    likes: Annotated[LikesMode, Query()] = LikesMode.full,
+):
+    """
+    Get tweets from current user and user's followee, newest first.
+
+    Pass `next_cursor` of the previous page as `cursor` to get the next one.
+    With `likes=summary` every tweet carries `like_count`, `liked` and
+    only a few likers instead of the full list.
+
+    Responds `304 Not Modified` when `If-None-Match` carries the current
+    `ETag` of the timeline.
+    """
+    # JSON собирается из колонок, без ORM и повторной валидации pydantic
+    dal = Dal(sess)
+    page = await dal.get_timeline_rows(
+        current_user.id,
+        limit=limit,
+        cursor=cursor,
+        with_likes=likes is LikesMode.full,
+    )
+    summary = None
+    if likes is LikesMode.summary:
+        summary = await dal.get_likes_summary(
+            [row.id for row in page.items], current_user.id, LIKES_SAMPLE_SIZE
+        )
+    return FastJSONResponse(timeline_payload(page, summary), headers=cache)
+
+
+@router.get('/search', response_model=TweetsOut, status_code=200)
+@query_budget(6)
+async def search_tweets(
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db_read)],
+    q: Annotated[str, Query(min_length=1, max_length=SEARCH_MAX_QUERY)],
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Annotated[str | None, Query()] = None,
+    likes: Annotated[LikesMode, Query()] = LikesMode.full,
 ):
-    """Get all tweets from current user and user's followee."""
+    """
+    Search tweets containing all words of `q`, most relevant first.
+
+    Paginated with `cursor` and shaped like the timeline.
+    """
+    dal = Dal(sess)
+    page = await dal.search_tweets(
+        q, limit=limit, cursor=cursor, with_likes=likes is LikesMode.full
+    )
+    return await _tweets_out(dal, page, likes, current_user.id)
+
 
-    tweets = await Dal(sess).get_all_tweets(current_user)
-    return {"tweets": tweets}
+async def _tweets_out(
+    dal: Dal, page: Page, likes: LikesMode, user_id: int
+) -> dict:
+    """Страница твитов в формате `TweetsOut` с лайками в режиме `likes`."""
+    tweets = page.items
 
+    if likes is LikesMode.summary:
+        summary = await dal.get_likes_summary(
+            [t.id for t in tweets], user_id, LIKES_SAMPLE_SIZE
+        )
+        tweets = [
+            {
+                "id": t.id,
+                "content": t.content,
+                "author": t.author,
+                "attachments": [m.display_url for m in t.tweet_media_ids],
+                "like_count": t.like_count,
+                "liked": summary[t.id].liked,
+                "likes": summary[t.id].sample,
+            }
+            for t in tweets
+        ]
 
-@router.post('/', response_model=TweetOut, status_code=201)
+    return {"tweets": tweets, "next_cursor": page.next_cursor}
+
+
+@router.post(
+    '/',
+    response_model=TweetOut,
+    responses=RESPONSE_401_422_400,
+    status_code=201,
+)
+@query_budget(6)
 async def add_tweet(
     tweet: TweetIn,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     sess: Annotated[AsyncSession, Depends(db)],
 ):
     """Post new tweet."""
 
-    return await Dal(sess).add_tweet(tweet=tweet, user_id=current_user.id)
+    tweet_id = await Dal(sess).add_tweet(tweet=tweet, user_id=current_user.id)
+    return {'tweet_id': tweet_id}
+
+
+@router.post(
+    '/batch',
+    response_model=TweetsBatchOut,
+    responses=RESPONSE_401_422_400,
+    status_code=201,
+)
+@query_budget(6)
+async def add_tweets(
+    batch: TweetsBatchIn,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db)],
+):
+    """
+    Post many tweets at once (importers, bots).
+
+    All tweets are created in one transaction: if any media can't be
+    attached, nothing is posted. Ids are returned in request order.
+    """
+
+    tweet_ids = await Dal(sess).add_tweets(batch.tweets, current_user.id)
+    return {'tweet_ids': tweet_ids}
 
 
 @router.delete(
@@ -45,9 +182,10 @@ async def add_tweet(
     responses=RESPONSE_401_422_404_403,
     status_code=200,
 )
+@query_budget(8)
 async def delete_tweet(
     idx: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     sess: Annotated[AsyncSession, Depends(db)],
 ):
     """Delete own specific tweet."""
@@ -56,20 +194,48 @@ async def delete_tweet(
     return {"result": True}
 
 
+@router.get(
+    '/{idx}/likes',
+    response_model=LikesOut,
+    responses=RESPONSE_401_422_404,
+    status_code=200,
+)
+@query_budget(3)
+async def get_tweet_likes(
+    idx: int,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db_read)],
+    limit: Annotated[
+        int, Query(ge=1, le=LIKES_MAX_PAGE_SIZE)
+    ] = LIKES_PAGE_SIZE,
+    cursor: Annotated[str | None, Query()] = None,
+):
+    """Get users who liked the tweet, page by page."""
+
+    page = await Dal(sess).get_tweet_likes(idx, limit=limit, cursor=cursor)
+    return {"likes": page.items, "next_cursor": page.next_cursor}
+
+
 @router.post(
     '/{idx}/likes',
     response_model=BaseSchema,
     responses=RESPONSE_401_422_404,
     status_code=201,
 )
+@query_budget(2)
 async def add_like_to_tweet(
     idx: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     sess: Annotated[AsyncSession, Depends(db)],
 ):
     """Add like to tweet."""
 
-    await Dal(sess).add_like_to_tweet(tweet_id=idx, user_id=current_user.id)
+    if get_settings().like_batching and like_batcher.running:
+        await like_batcher.submit(idx, current_user.id, like=True)
+    else:
+        await Dal(sess).add_like_to_tweet(
+            tweet_id=idx, user_id=current_user.id
+        )
     return {'result': True}
 
 
@@ -79,14 +245,18 @@ async def add_like_to_tweet(
     responses=RESPONSE_401_422_404,
     status_code=200,
 )
+@query_budget(2)
 async def remove_like_from_tweet(
     idx: int,
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     sess: Annotated[AsyncSession, Depends(db)],
 ):
     """Remove like from tweet."""
 
-    await Dal(sess).remove_like_from_tweet(
-        tweet_id=idx, user_id=current_user.id
-    )
+    if get_settings().like_batching and like_batcher.running:
+        await like_batcher.submit(idx, current_user.id, like=False)
+    else:
+        await Dal(sess).remove_like_from_tweet(
+            tweet_id=idx, user_id=current_user.id
+        )
     return {'result': True}
@@ -4,18 +4,29 @@ This module contains routes for router `tweets`
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from database.init_db import db
-from database.models import User
+from database.init_db import db, db_read
 from schemas.base_schema import BaseSchema
-from schemas.user_schema import UserOut
-from utils.authentication import get_current_user
-from utils.responses import RESPONSE_401, RESPONSE_401_422_404, RESPONSE_401_422_404_400
+from schemas.user_schema import FollowIn, FollowOut, FollowsOut, UserOut
+from utils.authentication import Principal, get_current_user
+from utils.caching import my_profile_etag, profile_etag
+from utils.query_budget import query_budget
+from utils.responses import (
+    RESPONSE_401,
+    RESPONSE_401_422,
+    RESPONSE_401_422_404,
+    RESPONSE_401_422_404_400,
+)
 from utils.service import Dal
+from utils.settings import (
+    FOLLOWS_MAX_PAGE_SIZE,
+    FOLLOWS_PAGE_SIZE,
+    PROFILE_PREVIEW_SIZE,
+)
 
 router = APIRouter(prefix='/users', tags=['users'])
 
@@ -26,14 +37,20 @@ router = APIRouter(prefix='/users', tags=['users'])
     responses=RESPONSE_401,
     status_code=200,
 )
+@query_budget(3)
 async def get_user(
-        current_user: Annotated[User, Depends(get_current_user)],
-        api_key: Annotated[str | None, Header()]
+        current_user: Annotated[Principal, Depends(get_current_user)],
+        sess: Annotated[AsyncSession, Depends(db_read)],
+        api_key: Annotated[str | None, Header()],
+        cache: Annotated[dict[str, str], Depends(my_profile_etag)],
+        response: Response,
 ):
     """Получить информацию о текущем пользователе"""
+    response.headers.update(cache)
     logger.debug(f'{current_user=}')
     logger.debug(f'{api_key=}')
-    return {"user": current_user}
+    user = await Dal(sess).get_profile(current_user.id, PROFILE_PREVIEW_SIZE)
+    return {"user": user}
 
 
 @router.get(
@@ -42,38 +59,114 @@ async def get_user(
     responses=RESPONSE_401_422_404,
     status_code=200,
 )
+@query_budget(3)
 async def get_user_by_id(
-        idx: int, sess: Annotated[AsyncSession, Depends(db)],
-        api_key: Annotated[str | None, Header()]
+        idx: int, sess: Annotated[AsyncSession, Depends(db_read)],
+        api_key: Annotated[str | None, Header()],
+        cache: Annotated[dict[str, str], Depends(profile_etag)],
+        response: Response,
 ):
-    """Get specific user details."""
-    user: User = await Dal(sess).get_user_by_idx(idx)
+    """
+    Get specific user details, `304` when `If-None-Match` matches.
+
+    `followers` and `following` hold the first few users by id, the full
+    lists are paginated at `/followers` and `/following`.
+    """
+    response.headers.update(cache)
+    user = await Dal(sess).get_profile(idx, PROFILE_PREVIEW_SIZE)
     return {"user": user}
 
 
+@router.get(
+    '/{idx}/followers',
+    response_model=FollowsOut,
+    responses=RESPONSE_401_422_404,
+    status_code=200,
+)
+@query_budget(2)
+async def get_followers(
+        idx: int,
+        sess: Annotated[AsyncSession, Depends(db_read)],
+        api_key: Annotated[str | None, Header()],
+        limit: Annotated[
+            int, Query(ge=1, le=FOLLOWS_MAX_PAGE_SIZE)
+        ] = FOLLOWS_PAGE_SIZE,
+        cursor: Annotated[str | None, Query()] = None,
+):
+    """Get users following the user, page by page."""
+    page = await Dal(sess).get_follows(
+        idx, followers=True, limit=limit, cursor=cursor
+    )
+    return {"users": page.items, "next_cursor": page.next_cursor}
+
+
+@router.get(
+    '/{idx}/following',
+    response_model=FollowsOut,
+    responses=RESPONSE_401_422_404,
+    status_code=200,
+)
+@query_budget(2)
+async def get_following(
+        idx: int,
+        sess: Annotated[AsyncSession, Depends(db_read)],
+        api_key: Annotated[str | None, Header()],
+        limit: Annotated[
+            int, Query(ge=1, le=FOLLOWS_MAX_PAGE_SIZE)
+        ] = FOLLOWS_PAGE_SIZE,
+        cursor: Annotated[str | None, Query()] = None,
+):
+    """Get users the user follows, page by page."""
+    page = await Dal(sess).get_follows(
+        idx, followers=False, limit=limit, cursor=cursor
+    )
+    return {"users": page.items, "next_cursor": page.next_cursor}
+
+
+@router.post(
+    '/follow',
+    response_model=FollowOut,
+    responses=RESPONSE_401_422,
+    status_code=200,
+)
+@query_budget(5)
+async def follow_users(
+        follow: FollowIn,
+        current_user: Annotated[Principal, Depends(get_current_user)],
+        sess: Annotated[AsyncSession, Depends(db)],
+        api_key: Annotated[str | None, Header()]
+):
+    """
+    Follow many users at once (onboarding).
+
+    Unknown ids are reported in `not_found`, own id is skipped.
+    """
+    change = await Dal(sess).follow(current_user.id, follow.user_ids)
+    return {"followed": change.changed, "not_found": change.missing}
+
+
 @router.post(
     '/{idx}/follow',
     response_model=BaseSchema,
     responses=RESPONSE_401_422_404_400,
     status_code=200,
 )
+@query_budget(5)
 async def follow_user(
         idx: int,
-        current_user: Annotated[User, Depends(get_current_user)],
+        current_user: Annotated[Principal, Depends(get_current_user)],
         sess: Annotated[AsyncSession, Depends(db)],
         api_key: Annotated[str | None, Header()]
 ):
     """follow specific user"""
-    user_for_follow: User = await Dal(sess).get_user_by_idx(idx)
-    if user_for_follow.id == current_user.id:
+    if idx == current_user.id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Can't follow yourself",
         )
-    if user_for_follow not in current_user.following:
-        current_user.following.append(user_for_follow)
-        sess.add(current_user)
-        await sess.commit()
+    change = await Dal(sess).follow(current_user.id, [idx])
+    if change.missing:
+        raise _user_not_found()
 
     return {'result': True}
 
@@ -84,17 +177,23 @@ async def follow_user(
     responses=RESPONSE_401_422_404,
     status_code=200,
 )
+@query_budget(5)
 async def unfollow_user(
         idx: int,
-        current_user: Annotated[User, Depends(get_current_user)],
+        current_user: Annotated[Principal, Depends(get_current_user)],
         sess: Annotated[AsyncSession, Depends(db)],
         api_key: Annotated[str | None, Header()]
 ):
     """Unfollow specific user."""
-    user_for_unfollow: User = await Dal(sess).get_user_by_idx(idx)
-    if user_for_unfollow in current_user.following:
-        current_user.following.remove(user_for_unfollow)
-        sess.add(current_user)
-        await sess.commit()
+    change = await Dal(sess).unfollow(current_user.id, [idx])
+    if change.missing:
+        raise _user_not_found()
 
     return {'result': True}
+
+
+def _user_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="User not found.",
+    )
@@ -1,8 +1,11 @@
+from enum import Enum
 from typing import Any, Optional
 
 from pydantic import BaseModel, Field, root_validator
 from pydantic.utils import GetterDict
 
+from utils.settings import TWEET_BATCH_SIZE
+
 from .base_schema import BaseSchema
 from .user_schema import BaseUser
 
@@ -20,6 +23,14 @@ class TweetOut(BaseSchema):
         allow_population_by_field_name = True
 
 
+class TweetsBatchIn(BaseModel):
+    tweets: list[TweetIn] = Field(..., min_items=1, max_items=TWEET_BATCH_SIZE)
+
+
+class TweetsBatchOut(BaseSchema):
+    tweet_ids: list[int]
+
+
 class Like(BaseModel):
     id: int = Field(alias="user_id")
     name: str = Field(alias="username")
@@ -30,26 +41,42 @@ class Like(BaseModel):
 
     @root_validator(pre=True)
     def extract_username(cls, v):
-        return vars(v["user"])
+        # из ORM берем юзера лайка, готовые `{id, name}` оставляем как есть
+        user = v.get("user")
+        return vars(user) if user is not None else v
 
 
 class TweetGetter(GetterDict):
     def get(self, key: str, default: Any = None) -> Any:
         if key == "attachments":
             return [
-                *[x.url for x in self._obj.tweet_media_ids],
+                *[x.display_url for x in self._obj.tweet_media_ids],
             ]
 
         else:
             return super(TweetGetter, self).get(key, default)
 
 
+class LikesMode(str, Enum):
+    """
+    Режим лайков в ленте.
+
+    full - полный список лайкнувших;
+    summary - количество, лайк текущего юзера и несколько лайкнувших.
+    """
+
+    full = "full"
+    summary = "summary"
+
+
 class TweetOutAll(BaseModel):
     id: int
     tweet_data: str = Field(alias="content")
     user: BaseUser = Field(alias="author")
     likes: list[Like]
     attachments: list
+    like_count: int = 0
+    liked: Optional[bool] = None
 
     class Config:
         orm_mode = True
@@ -59,3 +86,9 @@ class TweetOutAll(BaseModel):
 
 class TweetsOut(BaseSchema):
     tweets: list[TweetOutAll]
+    next_cursor: Optional[str] = None
+
+
+class LikesOut(BaseSchema):
+    likes: list[BaseUser]
+    next_cursor: Optional[str] = None
@@ -2,6 +2,8 @@ from typing import Optional
 
 from pydantic import BaseModel, Field
 
+from utils.settings import FOLLOW_BATCH_SIZE
+
 from .base_schema import BaseSchema
 
 
@@ -14,6 +16,9 @@ class BaseUser(BaseModel):
 
 
 class User(BaseUser):
+    followers_count: int
+    following_count: int
+    # первые PROFILE_PREVIEW_SIZE по id, полные списки - /followers, /following
     following: list[BaseUser]
     followers: list[BaseUser]
 
@@ -23,3 +28,19 @@ class User(BaseUser):
 
 class UserOut(BaseSchema):
     user: User
+
+
+class FollowsOut(BaseSchema):
+    users: list[BaseUser]
+    next_cursor: Optional[str] = None
+
+
+class FollowIn(BaseModel):
+    user_ids: list[int] = Field(
+        ..., min_items=1, max_items=FOLLOW_BATCH_SIZE, unique_items=True
+    )
+
+
+class FollowOut(BaseSchema):
+    followed: list[int]
+    not_found: list[int]
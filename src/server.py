@@ -0,0 +1,44 @@
+"""
+Запуск API: `python server.py`.
+
+При DEBUG - один процесс с перезагрузкой по изменению файлов. Иначе -
+`workers` процессов на uvloop/httptools: по SIGTERM воркер перестает
+принимать соединения, до `graceful_timeout` секунд дожидается текущих
+запросов и закрывает пул соединений с БД.
+"""
+import importlib.util
+import inspect
+
+import uvicorn
+
+from utils.settings import get_settings
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def uvicorn_options() -> dict:
+    """Параметры `uvicorn.run` из настроек."""
+    s = get_settings()
+    options = dict(host=s.host, port=s.port, lifespan='on')
+    if s.debug:
+        return options | dict(reload=s.reload, workers=1)
+
+    options |= dict(
+        workers=s.workers,
+        loop='uvloop' if _installed('uvloop') else 'asyncio',
+        http='httptools' if _installed('httptools') else 'h11',
+        proxy_headers=True,
+        server_header=False,
+    )
+    # без ограничения открытые стримы (/api/stream) не дают остановиться;
+    # параметр есть не во всех версиях uvicorn
+    parameters = inspect.signature(uvicorn.Config).parameters
+    if 'timeout_graceful_shutdown' in parameters:
+        options['timeout_graceful_shutdown'] = s.graceful_timeout
+    return options
+
+
+if __name__ == '__main__':
+    uvicorn.run('main:app', **uvicorn_options())
@@ -1,19 +1,126 @@
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import APIKeyHeader
+from sqlalchemy import event, inspect
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from database.init_db import db
+from database.models import User
 from utils.service import Dal
+from utils.settings import get_settings
 
 api_key = APIKeyHeader(name="api-key")
 
 
+class Principal(NamedTuple):
+    """Аутентифицированный пользователь: только id и имя, без связей."""
+
+    id: int
+    name: str
+
+
+class PrincipalCache:
+    """
+    LRU-кэш `api key -> Principal` с TTL.
+
+    Кэш локален для процесса: изменения, сделанные другими воркерами,
+    видны не позже чем через `ttl` секунд.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._data: OrderedDict[str, tuple[float, Principal]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Principal | None:
+        """Возвращает пользователя по api key, если запись не истекла."""
+        item = self._data.get(key)
+        if item is None or item[0] <= self._timer():
+            self._data.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: str, principal: Principal) -> None:
+        """Кладет пользователя в кэш, вытесняя самые давние записи."""
+        if self.maxsize <= 0:
+            return
+
+        self._data[key] = (self._timer() + self.ttl, principal)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        """Сбрасывает запись по api key (ротация ключа)."""
+        self._data.pop(key, None)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Сбрасывает все записи пользователя (удаление, смена имени)."""
+        for key in [k for k, (_, p) in self._data.items() if p.id == user_id]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Счетчики для мониторинга."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+_s = get_settings()
+principal_cache = PrincipalCache(
+    maxsize=_s.auth_cache_size, ttl=_s.auth_cache_ttl
+)
+
+
+@event.listens_for(User, "after_update")
+def _invalidate_updated_user(mapper, connection, target: User) -> None:
+    """Сбрасывает кэш при смене api key или имени через ORM."""
+    state = inspect(target)
+    for key in state.attrs.api_key.history.deleted or ():
+        principal_cache.invalidate(key)
+    if state.attrs.name.history.has_changes():
+        principal_cache.invalidate_user(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target: User) -> None:
+    """Сбрасывает кэш при удалении пользователя через ORM."""
+    principal_cache.invalidate_user(target.id)
+
+
 async def get_current_user(
     api_key_header: str = Security(api_key),
     session: AsyncSession = Depends(db),
-):
-    """Возвращает пользователя из базы данных по API ключу."""
+) -> Principal:
+    """Возвращает пользователя по API ключу, сначала ищет в кэше."""
+    if principal := principal_cache.get(api_key_header):
+        return principal
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -22,4 +129,7 @@ async def get_current_user(
     user = await Dal(session).get_current_user(api_key_header)
     if user is None:
         raise credentials_exception
-    return user
+
+    principal = Principal(id=user.id, name=user.name)
+    principal_cache.set(api_key_header, principal)
+    return principal
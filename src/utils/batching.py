@@ -0,0 +1,198 @@
+"""
+Модуль содержит отложенную пакетную запись лайков.
+
+При `like_batching` маршруты лайков не пишут в БД сами, а кладут
+намерение в очередь `like_batcher`. Фоновая задача собирает пакет (до
+`LIKE_BATCH_SIZE` намерений или `LIKE_BATCH_DELAY` секунд) и применяет его
+одной транзакцией; запрос ждет коммита своего пакета, поэтому ответы API
+не меняются. Переполненная очередь отвечает 503. Пока задача не запущена,
+маршруты пишут лайки напрямую.
+"""
+import asyncio
+import time
+from typing import NamedTuple
+
+from fastapi import HTTPException
+from loguru import logger
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette import status
+
+from database.init_db import Session
+from utils.metrics import LATENCY_BUCKETS, Counter, Gauge, Histogram, registry
+from utils.service import Dal
+from utils.settings import (
+    LIKE_BATCH_DELAY,
+    LIKE_BATCH_SIZE,
+    LIKE_QUEUE_SIZE,
+    LIKE_QUEUE_TIMEOUT,
+    get_settings,
+)
+
+BATCH_SIZE_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000)
+
+batch_size = registry.register(
+    Histogram(
+        "like_batch_size",
+        "Like intents per flushed batch.",
+        BATCH_SIZE_BUCKETS,
+    )
+)
+flush_duration = registry.register(
+    Histogram(
+        "like_batch_flush_seconds",
+        "Time to apply one batch of likes.",
+        LATENCY_BUCKETS,
+    )
+)
+intent_latency = registry.register(
+    Histogram(
+        "like_batch_latency_seconds",
+        "Time from enqueueing a like to its batch commit.",
+        LATENCY_BUCKETS,
+    )
+)
+queue_depth = registry.register(
+    Gauge("like_batch_queue_depth", "Like intents waiting for a batch.")
+)
+rejected = registry.register(
+    Counter("like_batch_rejected_total", "Likes rejected by a full queue.")
+)
+
+
+class LikeIntent(NamedTuple):
+    """Лайк (`like=True`) или его снятие и ожидающий коммита запрос."""
+
+    tweet_id: int
+    user_id: int
+    like: bool
+    future: asyncio.Future
+    enqueued: float
+
+
+class LikeBatcher:
+    """Очередь намерений лайков и фоновая задача, сбрасывающая их пакетами."""
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        max_batch: int = LIKE_BATCH_SIZE,
+        max_delay: float = LIKE_BATCH_DELAY,
+        queue_size: int = LIKE_QUEUE_SIZE,
+        put_timeout: float = LIKE_QUEUE_TIMEOUT,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.put_timeout = put_timeout
+        self._queue: asyncio.Queue[LikeIntent] | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает все принятые намерения и останавливает задачу."""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, tweet_id: int, user_id: int, like: bool) -> None:
+        """
+        Ставит лайк или снимает его и ждет коммита пакета.
+
+        :raises HTTPException: Когда твит не найден (404) или очередь
+            переполнена дольше `put_timeout` (503).
+        :raises RuntimeError: Когда задача не запущена.
+        """
+        if not self.running:
+            raise RuntimeError("LikeBatcher is not running, call start()")
+        loop = asyncio.get_running_loop()
+        intent = LikeIntent(
+            tweet_id, user_id, like, loop.create_future(), time.perf_counter()
+        )
+        try:
+            await asyncio.wait_for(self._queue.put(intent), self.put_timeout)
+        except asyncio.TimeoutError:
+            rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many likes, try again later.",
+            )
+        queue_depth.set(self._queue.qsize())
+        await intent.future
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                queue_depth.set(self._queue.qsize())
+
+    async def _collect(self) -> list[LikeIntent]:
+        """Ждет первое намерение и добирает пакет до размера или срока."""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: list[LikeIntent]) -> None:
+        """Применяет пакет одной транзакцией и отвечает ожидающим."""
+        # из нескольких намерений одного юзера на твит действует последнее
+        final = {(i.tweet_id, i.user_id): i.like for i in batch}
+        started = time.perf_counter()
+        try:
+            async with self.sessionmaker() as session:
+                missing = await Dal(session).apply_like_batch(final)
+        except Exception as exc:
+            logger.exception(f"like batch of {len(batch)} failed")
+            for intent in batch:
+                if not intent.future.done():
+                    intent.future.set_exception(exc)
+            return
+
+        done = time.perf_counter()
+        batch_size.observe(len(batch))
+        flush_duration.observe(done - started)
+        for intent in batch:
+            intent_latency.observe(done - intent.enqueued)
+            if intent.future.done():
+                continue
+            if intent.tweet_id in missing:
+                intent.future.set_exception(Dal._tweet_not_found())
+            else:
+                intent.future.set_result(None)
+
+
+like_batcher = LikeBatcher(Session)
+
+
+async def start_like_batcher() -> None:
+    """Запускает `like_batcher`, если включен `like_batching`."""
+    if get_settings().like_batching:
+        await like_batcher.start()
@@ -0,0 +1,106 @@
+"""
+Модуль содержит условные запросы (`ETag` / `If-None-Match`).
+
+Версия ленты и профиля считается одним дешевым запросом по счетчикам
+юзеров; если она совпала с `If-None-Match`, маршрут отвечает 304, не
+загружая и не сериализуя тело.
+"""
+import hashlib
+from typing import Annotated
+
+from fastapi import Depends, FastAPI, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+from database.init_db import db_read
+from utils.authentication import Principal, get_current_user
+from utils.service import Dal
+from utils.settings import CACHE_CONTROL
+
+
+class NotModified(Exception):
+    """Версия ресурса совпала с `If-None-Match` клиента."""
+
+    def __init__(self, headers: dict[str, str]) -> None:
+        self.headers = headers
+
+
+def make_etag(*parts) -> str:
+    """Слабый ETag из частей версии ресурса."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Слабое сравнение ETag с заголовком `If-None-Match`."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def conditional(request: Request, *parts) -> dict[str, str]:
+    """
+    Заголовки кэширования для версии `parts` ресурса.
+
+    :raises NotModified: Когда клиент уже имеет эту версию.
+    """
+    headers = {
+        "ETag": make_etag(*parts, str(request.query_params)),
+        "Cache-Control": CACHE_CONTROL,
+    }
+    if etag_matches(headers["ETag"], request.headers.get("if-none-match")):
+        raise NotModified(headers)
+    return headers
+
+
+async def timeline_etag(
+    request: Request,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db_read)],
+) -> dict[str, str]:
+    """Зависимость: заголовки кэширования ленты текущего юзера."""
+    version = await Dal(sess).get_timeline_version(current_user.id)
+    return conditional(request, "timeline", current_user.id, version)
+
+
+async def profile_etag(
+    idx: int,
+    request: Request,
+    sess: Annotated[AsyncSession, Depends(db_read)],
+) -> dict[str, str]:
+    """Зависимость: заголовки кэширования профиля юзера `idx`."""
+    return await _profile_headers(request, sess, idx)
+
+
+async def my_profile_etag(
+    request: Request,
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    sess: Annotated[AsyncSession, Depends(db_read)],
+) -> dict[str, str]:
+    """Зависимость: заголовки кэширования профиля текущего юзера."""
+    return await _profile_headers(request, sess, current_user.id)
+
+
+async def _profile_headers(
+    request: Request, sess: AsyncSession, idx: int
+) -> dict[str, str]:
+    """Несуществующий профиль не кэшируется: маршрут ответит 404."""
+    version = await Dal(sess).get_profile_version(idx)
+    if version is None:
+        return {}
+    return conditional(request, "profile", idx, version)
+
+
+async def not_modified_handler(request: Request, exc: NotModified):
+    """Ответ 304 без тела с ETag актуальной версии."""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers=exc.headers
+    )
+
+
+def install_conditional_requests(app: FastAPI) -> None:
+    """Подключает ответы 304 для маршрутов с ETag-зависимостями."""
+    app.add_exception_handler(NotModified, not_modified_handler)
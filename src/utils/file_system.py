@@ -1,11 +1,31 @@
 import hashlib
+import uuid
 from contextlib import suppress
 from pathlib import Path
+from typing import NamedTuple
 
 import aiofiles
-from fastapi import UploadFile
+import aiofiles.os
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette import status
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from utils.settings import MEDIA_ROOT
+from utils.settings import (
+    MEDIA_ROOT,
+    UPLOAD_BODY_OVERHEAD,
+    UPLOAD_CHUNK_SIZE,
+    get_settings,
+)
+
+
+class StoredFile(NamedTuple):
+    """Записанный файл: url для nginx, sha256 содержимого и размер в байтах."""
+
+    url: str
+    sha256: str
+    size: int
 
 
 async def prepare_media_dir() -> None:
@@ -13,38 +33,120 @@ async def prepare_media_dir() -> None:
     Path(MEDIA_ROOT).mkdir(mode=0o777, parents=False, exist_ok=True)
 
 
-async def get_filename(path: Path) -> Path:
-    """Добавляет к имени файла цифру, если уже есть с таким именем"""
-    counter = 0
-    dir = path.resolve().parent
-    file = path.stem
-    extension = path.suffix
-    if path.exists():
-        while Path(str(dir), f"{file} ({counter}){extension}").is_file():
-            counter += 1
-        return Path(str(dir), f"{file} ({counter}){extension}")
-    return path
+def content_path(sha256: str, suffix: str) -> Path:
+    """
+    Путь файла по хэшу содержимого: `ab/cd/abcd....ext`.
+
+    Двухуровневое шардирование не дает директории разрастись.
+    """
+    return Path(sha256[:2], sha256[2:4], f"{sha256}{suffix.lower()}")
+
+
+async def _stream_to_temp(file: UploadFile, temp: Path) -> tuple[str, int]:
+    """
+    Пишет загрузку во временный файл кусками по `UPLOAD_CHUNK_SIZE`,
+    по ходу считая sha256 и размер.
+
+    :raises HTTPException: Когда файл больше `max_upload_size`.
+    """
+    max_size = get_settings().max_upload_size
+    digest = hashlib.sha256()
+    size = 0
+
+    async with aiofiles.open(temp, mode="wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File is larger than {max_size} bytes.",
+                )
+            digest.update(chunk)
+            await f.write(chunk)
+
+    return digest.hexdigest(), size
+
 
+async def write_file(file: UploadFile) -> StoredFile | None:
+    """
+    Записывает файл в директорию картинок под хэшем его содержимого.
 
-async def write_file(file: UploadFile) -> str:
-    """Записывает файл в директорию картинок."""
+    Содержимое потоково пишется во временный файл и атомарно
+    переименовывается; если такой файл уже есть, используется он.
+    """
     with suppress(OSError):
         await prepare_media_dir()
-        path = Path(MEDIA_ROOT, file.filename)
-        filename = await get_filename(path)
-        contents = file.file.read()
-        async with aiofiles.open(filename, mode="wb") as f:
-            await f.write(contents)
+        temp = Path(MEDIA_ROOT, f".upload-{uuid.uuid4().hex}.part")
+        try:
+            sha256, size = await _stream_to_temp(file, temp)
+            path = content_path(sha256, Path(file.filename or "").suffix)
+            target = Path(MEDIA_ROOT, path)
+            if not await aiofiles.os.path.exists(target):
+                await aiofiles.os.makedirs(target.parent, exist_ok=True)
+                await aiofiles.os.replace(temp, target)
+        finally:
+            with suppress(FileNotFoundError):
+                await aiofiles.os.remove(temp)
+
+        return StoredFile(
+            url=f"/images/{path.as_posix()}", sha256=sha256, size=size
+        )
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body is larger than {limit} bytes.",
+    )
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware, ограничивающий тело запроса `max_upload_size` плюс
+    запас на multipart.
+
+    Starlette разбирает multipart до вызова маршрута и сохраняет файл во
+    временный файл целиком, поэтому проверка в `write_file` сама по себе
+    не защищает диск и сеть. Здесь запрос с большим `Content-Length`
+    отклоняется, не читая тело, а тело без него - как только прочитано
+    больше предела.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        limit = get_settings().max_upload_size + UPLOAD_BODY_OVERHEAD
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > limit:
+            error = _too_large(limit)
+            response = JSONResponse(
+                {"detail": error.detail}, status_code=error.status_code
+            )
+            return await response(scope, receive, send)
+
+        received = 0
 
-        return f"/images/{filename.stem}{filename.suffix}"
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if received > limit:
+                # ответ 413 уже отдается, остаток тела просто отбрасывается
+                return message
+            received += len(message.get("body", b""))
+            if received > limit:
+                # HTTPException FastAPI пробрасывает из разбора тела как есть
+                raise _too_large(limit)
+            return message
 
+        await self.app(scope, limited_receive, send)
 
-async def files_hash_is_equal(file1, file2) -> bool:
-    """Сравнивает хэш двух файлов, возвращает результат сравнения."""
-    async with aiofiles.open(file1, 'rb') as f1, aiofiles.open(
-        file2, 'rb'
-    ) as f2:
-        hash1 = hashlib.sha256(await f1.read()).hexdigest()
-        hash2 = hashlib.sha256(await f2.read()).hexdigest()
 
-    return hash1 == hash2
+def install_body_limit(app: FastAPI) -> None:
+    """Подключает ограничение размера тела запроса."""
+    app.add_middleware(BodySizeLimitMiddleware)
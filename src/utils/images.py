@@ -0,0 +1,111 @@
+"""
+Модуль содержит обработку загруженных картинок: уменьшенные варианты
+(превью и под ширину ленты) в компактном формате.
+
+Pillow - зависимость проекта; если ее нет в окружении, варианты не
+создаются, отдаются оригиналы, а при старте пишется предупреждение.
+Обработка идет в пуле процессов, event loop не блокируется.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from loguru import logger
+
+from utils.file_system import StoredFile, content_path
+from utils.settings import (
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    IMAGE_VARIANTS,
+    MEDIA_ROOT,
+    get_settings,
+)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = None
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=get_settings().image_workers)
+    return _pool
+
+
+def check_image_support() -> bool:
+    """
+    Проверяет при старте, что варианты можно создавать: при включенных
+    `image_workers` без Pillow пишет предупреждение.
+    """
+    if Image is None and get_settings().image_workers:
+        logger.warning(
+            "IMAGE_WORKERS is set but Pillow is not installed: "
+            "image variants are disabled, originals are served"
+        )
+        return False
+    return True
+
+
+def shutdown_pool() -> None:
+    """Останавливает пул обработки картинок."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def render_variants(
+    media_root: str, original: str, sha256: str
+) -> dict[str, str]:
+    """
+    Создает варианты картинки, возвращает `{вариант: путь от media_root}`.
+
+    Выполняется в отдельном процессе. Уже созданные варианты не
+    пересчитываются; не-картинки дают пустой результат.
+    """
+    suffix = f".{IMAGE_FORMAT.lower()}"
+    variants = {}
+    try:
+        with Image.open(Path(media_root, original)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            for name, width in IMAGE_VARIANTS.items():
+                path = content_path(sha256, f".{name}{suffix}")
+                target = Path(media_root, path)
+                if not target.exists():
+                    variant = image.copy()
+                    variant.thumbnail((width, width * 4))
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    temp = target.with_name(
+                        f".{target.name}.{os.getpid()}.part"
+                    )
+                    variant.save(
+                        temp, format=IMAGE_FORMAT, quality=IMAGE_QUALITY
+                    )
+                    temp.replace(target)
+                variants[name] = path.as_posix()
+    except (OSError, Image.DecompressionBombError):
+        return {}
+    return variants
+
+
+async def make_variants(stored: StoredFile) -> dict[str, str]:
+    """
+    Создает варианты записанного файла в пуле процессов,
+    возвращает `{вариант: url}`.
+    """
+    if Image is None or not get_settings().image_workers:
+        return {}
+
+    original = stored.url.removeprefix("/images/")
+    loop = asyncio.get_running_loop()
+    paths = await loop.run_in_executor(
+        _get_pool(), render_variants, MEDIA_ROOT, original, stored.sha256
+    )
+    return {name: f"/images/{path}" for name, path in paths.items()}
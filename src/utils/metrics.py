@@ -0,0 +1,236 @@
+"""
+Модуль содержит метрики приложения в текстовом формате Prometheus:
+латентность запросов по маршрутам, запросы в обработке, число
+SQL-выражений и время в БД на запрос.
+
+Метрики хранятся в памяти процесса, каждый воркер отдает свои.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from fastapi import FastAPI, Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{k}="{v}"' for k, v in labels)
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    """Базовая метрика: имя, описание и значения по наборам меток."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.type}",
+                *self.samples(),
+            ]
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, buckets: tuple[float, ...]
+    ) -> None:
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        # метки -> [счетчики по корзинам (последняя +Inf), сумма]
+        self.values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        counts, total = self.values.setdefault(
+            key, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            bounds = [*map(str, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = _format_labels((*labels, ("le", bound)))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total[0]}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    """Набор метрик процесса."""
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics) + "\n"
+
+
+registry = Registry()
+
+requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "Requests currently being handled.")
+)
+request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Request latency by route.",
+        LATENCY_BUCKETS,
+    )
+)
+request_statements = registry.register(
+    Histogram(
+        "http_request_db_statements",
+        "SQL statements issued per request.",
+        STATEMENT_BUCKETS,
+    )
+)
+request_db_time = registry.register(
+    Histogram(
+        "http_request_db_seconds",
+        "Time spent in the database per request.",
+        LATENCY_BUCKETS,
+    )
+)
+
+
+def render_gauges(prefix: str, values: dict[str, float]) -> str:
+    """Снимок готовых значений (например, состояния пула) как gauge."""
+    lines = []
+    for key, value in values.items():
+        lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class QueryStats:
+    """SQL-выражения, выполненные внутри `track_queries`."""
+
+    statements: int = 0
+    seconds: float = 0.0
+
+
+# вложенные `track_queries` (метрики, бюджет, тест) считают независимо
+_active_stats: ContextVar[tuple[QueryStats, ...]] = ContextVar(
+    "active_stats", default=()
+)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Считает SQL-выражения, выполненные в текущем контексте."""
+    stats = QueryStats()
+    token = _active_stats.set((*_active_stats.get(), stats))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, *args) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, *args) -> None:
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    for stats in _active_stats.get():
+        stats.statements += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подключает подсчет SQL-выражений запроса к движку."""
+    target = engine.sync_engine
+    if not event.contains(
+        target, "before_cursor_execute", _before_cursor_execute
+    ):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def route_path(request: Request) -> str:
+    # шаблон маршрута, а не путь, чтобы не плодить метки по id
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+def instrument_app(app: FastAPI) -> None:
+    """Подключает middleware, собирающий метрики запросов."""
+
+    @app.middleware("http")
+    async def collect_metrics(request: Request, call_next):
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        status_code = 500
+        try:
+            with track_queries() as stats:
+                response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            requests_in_flight.dec()
+            route = route_path(request)
+            request_duration.observe(
+                time.perf_counter() - start,
+                method=request.method,
+                route=route,
+                status=str(status_code),
+            )
+            request_statements.observe(stats.statements, route=route)
+            request_db_time.observe(stats.seconds, route=route)
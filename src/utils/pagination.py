@@ -0,0 +1,84 @@
+"""
+Модуль содержит утилиты для keyset-пагинации по `(created_at, id)`,
+`(rank, id)` и по id
+"""
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, NamedTuple
+
+from fastapi import HTTPException
+from starlette import status
+
+
+class Page(NamedTuple):
+    """Страница выборки и курсор на следующую страницу (None - конец)."""
+
+    items: list[Any]
+    next_cursor: str | None
+
+
+def encode_cursor(created_at: datetime, idx: int) -> str:
+    """Кодирует ключ `(created_at, id)` последней записи в курсор."""
+    raw = f"{created_at.isoformat()}|{idx}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Декодирует курсор в ключ `(created_at, id)`.
+
+    :raises HTTPException: Когда курсор поврежден.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, idx = raw.split("|")
+        return datetime.fromisoformat(created_at), int(idx)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor.",
+        )
+
+
+def encode_id_cursor(idx: int) -> str:
+    """Кодирует id последней записи в курсор."""
+    return base64.urlsafe_b64encode(str(idx).encode()).decode()
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """
+    Декодирует курсор в id.
+
+    :raises HTTPException: Когда курсор поврежден.
+    """
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor.",
+        )
+
+
+def encode_rank_cursor(rank: float, idx: int) -> str:
+    """Кодирует ключ `(rank, id)` последней записи поиска в курсор."""
+    raw = f"{rank!r}|{idx}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Декодирует курсор поиска в ключ `(rank, id)`.
+
+    :raises HTTPException: Когда курсор поврежден.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        rank, idx = raw.split("|")
+        return float(rank), int(idx)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor.",
+        )
@@ -0,0 +1,93 @@
+"""
+Модуль содержит бюджет SQL-выражений на маршрут.
+
+Маршрут объявляет бюджет декоратором `query_budget`, middleware сверяет
+с ним число выражений запроса: в режиме отладки пишет предупреждение,
+в строгом режиме (тесты) падает с `QueryBudgetExceeded`.
+"""
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+from fastapi import FastAPI, Request
+from loguru import logger
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from utils.metrics import QueryStats, route_path, track_queries
+from utils.settings import get_settings
+
+Endpoint = TypeVar("Endpoint", bound=Callable)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Выполнено больше SQL-выражений, чем разрешено бюджетом."""
+
+    def __init__(self, where: str, budget: int, statements: int) -> None:
+        super().__init__(
+            f"{where} issued {statements} SQL statements, budget {budget}"
+        )
+        self.budget = budget
+        self.statements = statements
+
+
+def query_budget(budget: int) -> Callable[[Endpoint], Endpoint]:
+    """Объявляет максимальное число SQL-выражений на запрос маршрута."""
+
+    def decorator(endpoint: Endpoint) -> Endpoint:
+        endpoint.query_budget = budget
+        return endpoint
+
+    return decorator
+
+
+@contextmanager
+def assert_max_queries(
+    budget: int, where: str = "block"
+) -> Iterator[QueryStats]:
+    """
+    Проверяет, что блок выполнил не больше `budget` SQL-выражений.
+
+    :raises QueryBudgetExceeded: Когда бюджет превышен.
+    """
+    with track_queries() as stats:
+        yield stats
+    if stats.statements > budget:
+        raise QueryBudgetExceeded(where, budget, stats.statements)
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware, сверяющий запросы с бюджетом маршрута.
+
+    Проверка включена при `debug` (предупреждение в лог) или
+    `query_budget_strict` (исключение).
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        s = get_settings()
+        if scope["type"] != "http" or not (s.debug or s.query_budget_strict):
+            return await self.app(scope, receive, send)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send)
+
+        endpoint = getattr(scope.get("route"), "endpoint", None)
+        budget = getattr(endpoint, "query_budget", None)
+        if budget is not None and stats.statements > budget:
+            request = Request(scope)
+            where = f"{request.method} {route_path(request)}"
+            if s.query_budget_strict:
+                raise QueryBudgetExceeded(where, budget, stats.statements)
+            logger.warning(
+                f"{where} issued {stats.statements} SQL statements, "
+                f"budget {budget}"
+            )
+
+
+def install_query_budget(app: FastAPI) -> None:
+    """Подключает проверку бюджета SQL-выражений маршрутов."""
+    app.add_middleware(QueryBudgetMiddleware)
@@ -2,6 +2,7 @@
 Модуль содержит ответы для апи
 RESPONSE_401
 RESPONSE_401_422
+RESPONSE_401_422_400
 RESPONSE_401_422_404
 RESPONSE_401_422_404_403
 RESPONSE_401_422_404_400
@@ -39,6 +40,22 @@ RESPONSE_401_422 = {
     },
 }
 
+RESPONSE_401_422_400 = {
+    **RESPONSE_401_422,
+    400: {
+        "description": "Bad request",
+        "content": {
+            "application/json": {
+                "example": {
+                    "result": False,
+                    "error_type": "Bad request",
+                    "error_message": "Media [1] can't be attached.",
+                }
+            }
+        },
+    },
+}
+
 RESPONSE_401_422_404 = {
     **RESPONSE_401_422,
     404: {
@@ -0,0 +1,95 @@
+"""
+Модуль содержит инвертированный индекс твитов в памяти процесса.
+
+Запасной вариант полнотекстового поиска для диалектов без tsvector
+(SQLite в тестах). Индекс строится из БД при первом поиске и дальше
+поддерживается событиями ORM.
+"""
+import math
+import re
+from collections import Counter
+
+from sqlalchemy import event
+
+from database.models import Tweet
+
+_token = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Слова текста в нижнем регистре."""
+    return _token.findall(text.lower())
+
+
+class InvertedIndex:
+    """
+    Индекс `слово -> {id твита: число вхождений}`.
+
+    Поиск - все слова запроса (как `websearch_to_tsquery`), ранг - tf-idf.
+    """
+
+    def __init__(self) -> None:
+        self.built = False
+        self._postings: dict[str, dict[int, int]] = {}
+        self._docs: dict[int, Counter] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, idx: int, text: str) -> None:
+        self.remove(idx)
+        terms = Counter(tokenize(text))
+        self._docs[idx] = terms
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[idx] = count
+
+    def remove(self, idx: int) -> None:
+        for term in self._docs.pop(idx, ()):
+            postings = self._postings[term]
+            postings.pop(idx, None)
+            if not postings:
+                del self._postings[term]
+
+    def build(self, docs) -> None:
+        """Заполняет индекс заново парами `(id, текст)`."""
+        self.clear()
+        for idx, text in docs:
+            self.add(idx, text)
+        self.built = True
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._docs.clear()
+        self.built = False
+
+    def search(self, query: str) -> list[tuple[float, int]]:
+        """Пары `(ранг, id)` твитов со всеми словами запроса, по убыванию."""
+        terms = set(tokenize(query))
+        postings = [self._postings.get(term, {}) for term in terms]
+        if not postings:
+            return []
+
+        found = set.intersection(*(set(p) for p in postings))
+        total = len(self._docs)
+        ranked = []
+        for idx in found:
+            rank = sum(p[idx] * math.log(1 + total / len(p)) for p in postings)
+            ranked.append((rank, idx))
+        ranked.sort(reverse=True)
+        return ranked
+
+
+tweet_index = InvertedIndex()
+
+
+@event.listens_for(Tweet, "after_insert")
+@event.listens_for(Tweet, "after_update")
+def _index_tweet(mapper, connection, target: Tweet) -> None:
+    if tweet_index.built:
+        tweet_index.add(target.id, target.content)
+
+
+@event.listens_for(Tweet, "after_delete")
+def _unindex_tweet(mapper, connection, target: Tweet) -> None:
+    if tweet_index.built:
+        tweet_index.remove(target.id)
@@ -0,0 +1,54 @@
+"""
+Модуль содержит быструю сериализацию ленты: JSON собирается прямо из
+`TimelineRow` без pydantic и кодируется orjson (если установлен).
+
+Формат совпадает с `TweetsOut` по алиасам.
+"""
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from utils.pagination import Page
+from utils.service import LikesSummary, TimelineRow
+
+try:
+    import orjson  # noqa: F401
+except ImportError:  # pragma: no cover
+    FastJSONResponse = JSONResponse
+else:
+    FastJSONResponse = ORJSONResponse
+
+
+def _like(idx: int, name: str) -> dict:
+    return {"user_id": idx, "username": name}
+
+
+def timeline_tweet(
+    row: TimelineRow, summary: LikesSummary | None = None
+) -> dict:
+    """Твит в формате `TweetOutAll`."""
+    if summary is None:
+        likes = [_like(*liker) for liker in row.likes]
+    else:
+        likes = [_like(liker["id"], liker["name"]) for liker in summary.sample]
+    return {
+        "id": row.id,
+        "content": row.content,
+        "author": {"id": row.author_id, "name": row.author_name},
+        "likes": likes,
+        "attachments": row.attachments,
+        "like_count": row.like_count,
+        "liked": None if summary is None else summary.liked,
+    }
+
+
+def timeline_payload(
+    page: Page, summary: dict[int, LikesSummary] | None = None
+) -> dict:
+    """Страница ленты в формате `TweetsOut`."""
+    return {
+        "result": True,
+        "tweets": [
+            timeline_tweet(row, summary and summary[row.id])
+            for row in page.items
+        ],
+        "next_cursor": page.next_cursor,
+    }
@@ -1,12 +1,95 @@
+from datetime import datetime
+from typing import NamedTuple
+
 from fastapi import HTTPException, UploadFile
-from sqlalchemy import desc, select
+from sqlalchemy import (
+    JSON,
+    ColumnElement,
+    Select,
+    Subquery,
+    UpdateBase,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    literal_column,
+    null,
+    or_,
+    select,
+    true,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import (
+    aliased,
+    lazyload,
+    noload,
+    selectinload,
+)
 from starlette import status
 
-from database.models import Tweet, TweetLike, TweetMedia, User
+from database.models import (
+    SEARCH_CONFIG,
+    TWEET_SEARCH_COLUMN,
+    Tweet,
+    TweetLike,
+    TweetMedia,
+    User,
+    home_timeline,
+    user_to_user,
+)
 from schemas.tweet_schema import TweetIn
 from utils.file_system import write_file
+from utils.images import make_variants
+from utils.pagination import (
+    Page,
+    decode_cursor,
+    decode_id_cursor,
+    decode_rank_cursor,
+    encode_cursor,
+    encode_id_cursor,
+    encode_rank_cursor,
+)
+from utils.search import tweet_index
+from utils.settings import get_settings
+from utils.stream import hub
+
+# запросы на Core-таблицах: DML в CTE не поддерживается ORM-конструкциями
+tweets_table = Tweet.__table__
+likes_table = TweetLike.__table__
+users_table = User.__table__
+
+
+class TimelineRow(NamedTuple):
+    """Твит ленты в колонках: автор, вложения, пары `[id, имя]` лайков."""
+
+    id: int
+    content: str
+    like_count: int
+    author_id: int
+    author_name: str
+    attachments: list[str]
+    likes: list[list]
+
+
+class FollowChange(NamedTuple):
+    """Id юзеров, подписка на которых изменилась, и несуществующие id."""
+
+    changed: list[int]
+    missing: list[int]
+
+
+class LikesSummary(NamedTuple):
+    """Лайкнул ли твит текущий юзер и несколько лайкнувших `{id, name}`."""
+
+    liked: bool
+    sample: list[dict]
 
 
 class Dal:
@@ -15,108 +98,952 @@ class Dal:
     def __init__(self, session: AsyncSession) -> None:
         self._session = session
 
-    async def get_current_user(self, api_key: str) -> User:
-        """Возвращает пользователя по api key."""
-        stmt = (
-            select(User)
-            .filter_by(api_key=api_key)
-            .options(
-                selectinload(User.following), selectinload(User.followers)
+    async def get_current_user(self, api_key: str) -> Row | None:
+        """
+        Возвращает `(id, name)` пользователя по api key.
+
+        Связи юзера (подписки, твиты) не загружаются - роуты, которым они
+        нужны, запрашивают их явно.
+        """
+        stmt = select(User.id, User.name).filter_by(api_key=api_key)
+
+        return (await self._session.execute(stmt)).first()
+
+    async def get_profile(self, idx: int, preview: int) -> dict:
+        """
+        Возвращает профиль юзера одним запросом: счетчики подписок и первые
+        `preview` подписчиков и подписок по id.
+
+        :raises HTTPException: Когда юзер не найден.
+        """
+        row = (
+            await self._session.execute(
+                select(
+                    User.id,
+                    User.name,
+                    User.followers_count,
+                    User.following_count,
+                    self._follows_preview(idx, followers=True, limit=preview),
+                    self._follows_preview(idx, followers=False, limit=preview),
+                ).filter_by(id=idx)
+            )
+        ).first()
+
+        if not row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found.",
             )
+        return {
+            "id": row[0],
+            "name": row[1],
+            "followers_count": row[2],
+            "following_count": row[3],
+            "followers": [dict(id=i, name=n) for i, n in row[4] or []],
+            "following": [dict(id=i, name=n) for i, n in row[5] or []],
+        }
+
+    def _follows_preview(
+        self, idx: int, followers: bool, limit: int
+    ) -> ColumnElement:
+        """JSON-массив пар `[id, имя]` первых подписчиков или подписок."""
+        other = aliased(User)
+        page = self._follows_query(other, idx, followers).limit(limit)
+        page = page.subquery()
+        return (
+            select(self._json_agg(self._json_array(page.c.id, page.c.name)))
+            .select_from(page)
+            .scalar_subquery()
         )
 
-        return await self._session.scalar(stmt)
+    @staticmethod
+    def _follows_query(
+        other, idx: int, followers: bool, after: int | None = None
+    ) -> Select:
+        """
+        `(id, имя)` подписчиков (`followers`) или подписок юзера по
+        возрастанию id после `after`: индекс `(following_id, followers_id)`
+        или PK.
+        """
+        follows = user_to_user.c
+        mine, theirs = (follows.followers_id, follows.following_id)
+        if followers:
+            mine, theirs = theirs, mine
 
-    async def get_user_by_idx(self, idx: int):
-        """Возвращает юзера по id."""
         stmt = (
-            select(User)
-            .filter_by(id=idx)
-            .options(joinedload(User.following), joinedload(User.followers))
+            select(other.id, other.name)
+            .join(user_to_user, theirs == other.id)
+            .where(mine == idx)
+            .order_by(theirs)
         )
-        user = await self._session.scalar(stmt)
+        if after is not None:
+            stmt = stmt.where(theirs > after)
+        return stmt
 
-        if not user:
+    async def get_follows(
+        self,
+        idx: int,
+        followers: bool,
+        limit: int,
+        cursor: str | None = None,
+    ) -> Page:
+        """
+        Возвращает страницу подписчиков или подписок юзера по возрастанию id.
+
+        :raises HTTPException: Когда юзер не найден.
+        """
+        if not await self._session.scalar(select(User.id).filter_by(id=idx)):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found.",
             )
-        return user
 
-    async def get_all_tweets(self, user: User):
+        after = decode_id_cursor(cursor) if cursor else None
+        stmt = self._follows_query(User, idx, followers, after)
+        users = (await self._session.execute(stmt.limit(limit + 1))).all()
+
+        if len(users) <= limit:
+            return Page(items=users, next_cursor=None)
+
+        return Page(
+            items=users[:limit],
+            next_cursor=encode_id_cursor(users[limit - 1].id),
+        )
+
+    async def get_timeline_version(self, user_id: int) -> tuple | None:
         """
-        Возвращает все твиты в порядке убывания даты создания
+        Версия ленты юзера: сумма и число `feed_version` авторов ленты и
+        `graph_version` самого юзера. None - юзер не найден.
+
+        Меняется при новом/удаленном твите или лайке у любого автора ленты
+        и при подписке/отписке юзера.
+        """
+        followees = select(user_to_user.c.following_id).where(
+            user_to_user.c.followers_id == user_id
+        )
+        stmt = select(
+            func.coalesce(func.sum(User.feed_version), 0),
+            func.count(User.id),
+            func.max(case((User.id == user_id, User.graph_version))),
+        ).where(or_(User.id == user_id, User.id.in_(followees)))
+        version = (await self._session.execute(stmt)).one()
+
+        return None if version[2] is None else tuple(version)
+
+    async def get_profile_version(self, idx: int) -> tuple | None:
+        """Версия профиля юзера `(имя, graph_version)`, None - не найден."""
+        stmt = select(User.name, User.graph_version).filter_by(id=idx)
+        version = (await self._session.execute(stmt)).first()
+
+        return None if version is None else tuple(version)
+
+    async def get_followee_ids(self, user_id: int) -> set[int]:
+        """Возвращает id юзеров, на которых подписан юзер."""
+        stmt = select(user_to_user.c.following_id).where(
+            user_to_user.c.followers_id == user_id
+        )
+        return set(await self._session.scalars(stmt))
+
+    async def follow(
+        self, follower_id: int, user_ids: list[int]
+    ) -> FollowChange:
+        """
+        Идемпотентно подписывает юзера на юзеров `user_ids`: вставка с
+        ON CONFLICT DO NOTHING, без загрузки подписок в память.
+        Подписка на себя пропускается.
+        """
+        found = await self._existing_users(user_ids)
+        targets = [idx for idx in found if idx != follower_id]
+        changed = []
+        if targets:
+            stmt = (
+                self._insert(user_to_user)
+                .values(
+                    [
+                        dict(followers_id=follower_id, following_id=idx)
+                        for idx in targets
+                    ]
+                )
+                .on_conflict_do_nothing()
+                .returning(user_to_user.c.following_id)
+            )
+            changed = list(await self._session.scalars(stmt))
+        if changed:
+            await self._record_follows(follower_id, changed, 1)
+            await self.backfill_timeline(follower_id, changed)
+
+        await self._session.commit()
+        for idx in changed:
+            await hub.publish('follow', idx, user_id=follower_id)
+        return FollowChange(changed, self._missing(user_ids, found))
+
+    async def unfollow(
+        self, follower_id: int, user_ids: list[int]
+    ) -> FollowChange:
+        """Идемпотентно отписывает юзера от юзеров `user_ids`."""
+        found = await self._existing_users(user_ids)
+        changed = []
+        if found:
+            stmt = (
+                delete(user_to_user)
+                .where(
+                    user_to_user.c.followers_id == follower_id,
+                    user_to_user.c.following_id.in_(found),
+                )
+                .returning(user_to_user.c.following_id)
+            )
+            changed = list(await self._session.scalars(stmt))
+        if changed:
+            await self._record_follows(follower_id, changed, -1)
+            await self.trim_timeline(follower_id, changed)
+
+        await self._session.commit()
+        for idx in changed:
+            await hub.publish('unfollow', idx, user_id=follower_id)
+        return FollowChange(changed, self._missing(user_ids, found))
+
+    async def _existing_users(self, user_ids: list[int]) -> list[int]:
+        """Существующие из `user_ids` - одним запросом."""
+        stmt = select(User.id).where(User.id.in_(user_ids)).order_by(User.id)
+        return list(await self._session.scalars(stmt))
+
+    @staticmethod
+    def _missing(user_ids: list[int], found: list[int]) -> list[int]:
+        return sorted(set(user_ids) - set(found))
+
+    async def _record_follows(
+        self, follower_id: int, followee_ids: list[int], delta: int
+    ) -> None:
+        """
+        Меняет счетчики подписок на `delta` и версии подписок юзеров
+        в текущей транзакции.
+        """
+        users = users_table.c
+        stmt = (
+            update(users_table)
+            .where(users.id.in_([follower_id, *followee_ids]))
+            .values(
+                graph_version=users.graph_version + 1,
+                following_count=users.following_count
+                + case(
+                    (users.id == follower_id, delta * len(followee_ids)),
+                    else_=0,
+                ),
+                followers_count=users.followers_count
+                + case((users.id.in_(followee_ids), delta), else_=0),
+            )
+        )
+        await self._session.execute(stmt)
+
+    async def _bump_feed_version(self, user_id: int) -> None:
+        """Отмечает изменение твитов автора в текущей транзакции."""
+        stmt = (
+            update(users_table)
+            .where(users_table.c.id == user_id)
+            .values(feed_version=users_table.c.feed_version + 1)
+        )
+        await self._session.execute(stmt)
+
+    async def get_timeline_rows(
+        self,
+        user_id: int,
+        limit: int,
+        cursor: str | None = None,
+        with_likes: bool = True,
+    ) -> Page:
+        """
+        Возвращает страницу твитов в порядке убывания даты создания
         читаемых пользователей + свои твиты для конкретного юзера.
+
+        Пагинация keyset по `(created_at, id)`: курсор указывает на последний
+        твит предыдущей страницы. Страница собирается одним запросом из
+        колонок, без ORM-сущностей: элементы - `TimelineRow`. Без
+        `with_likes` лайки не загружаются.
+
+        Вложения и лайкнувшие собираются в JSON-массивы в самой БД.
+
+        :raises HTTPException: Когда курсор поврежден.
         """
+        after = decode_cursor(cursor) if cursor else None
+        keys = self._timeline_keys(user_id, limit, after)
+        attachments = (
+            select(
+                self._json_agg(
+                    func.coalesce(TweetMedia.feed_url, TweetMedia.url)
+                )
+            )
+            .where(TweetMedia.tweet_id == Tweet.id)
+            .scalar_subquery()
+        )
+        likes = (
+            select(self._json_agg(self._json_array(User.id, User.name)))
+            .select_from(TweetLike)
+            .join(User, User.id == TweetLike.user_id)
+            .where(TweetLike.tweet_id == Tweet.id)
+            .scalar_subquery()
+            if with_likes
+            else null()
+        )
+        stmt = (
+            select(
+                Tweet.id,
+                Tweet.content,
+                Tweet.like_count,
+                User.id,
+                User.name,
+                attachments,
+                likes,
+                Tweet.created_at,
+            )
+            .join(keys, Tweet.id == keys.c.tweet_id)
+            .join(User, User.id == Tweet.user_id)
+            .order_by(
+                *self._timeline_order(keys.c.created_at, keys.c.tweet_id)
+            )
+            .limit(limit + 1)
+        )
+        rows = (await self._session.execute(stmt)).all()
+
+        items = [
+            TimelineRow(*row[:5], row[5] or [], row[6] or [])
+            for row in rows[:limit]
+        ]
+        if len(rows) <= limit:
+            return Page(items=items, next_cursor=None)
+
+        last = rows[limit - 1]
+        return Page(
+            items=items, next_cursor=encode_cursor(last.created_at, last[0])
+        )
+
+    def _created_at_key(self, value) -> ColumnElement:
+        """
+        Дата создания как ключ keyset-пагинации. В SQLite дата - текст:
+        `CURRENT_TIMESTAMP` пишется без долей секунды, значения из Python и
+        курсора - с микросекундами, и строки одной даты не равны. Обе
+        стороны приводятся к одному формату.
+        """
+        if self._dialect == 'sqlite':
+            return func.strftime('%Y-%m-%d %H:%M:%f', value)
+        return value
 
-        # получаем все id читаемых пользователей и добавляем свой
-        ids = [f.id for f in user.following] + [user.id]
+    def _timeline_order(self, created_at, tweet_id) -> tuple:
+        """Порядок ленты: от новых к старым, при равной дате - по id."""
+        return self._created_at_key(created_at).desc(), tweet_id.desc()
 
+    def _timeline_page(
+        self,
+        stmt: Select,
+        created_at,
+        tweet_id,
+        limit: int,
+        after: tuple[datetime, int] | None,
+    ) -> Select:
+        """
+        Ограничивает выборку ключей ленты страницей: ключи после курсора
+        `after`, по порядку ленты, не больше `limit + 1`.
+        """
+        stmt = stmt.order_by(
+            *self._timeline_order(created_at, tweet_id)
+        ).limit(limit + 1)
+        if after:
+            stmt = stmt.where(
+                tuple_(self._created_at_key(created_at), tweet_id)
+                < tuple_(self._created_at_key(literal(after[0])), after[1])
+            )
+        return stmt
+
+    def _json_agg(self, expr) -> ColumnElement:
+        """Агрегат значений в JSON-массив для диалекта текущей сессии."""
+        if self._dialect == 'postgresql':
+            return func.json_agg(expr, type_=JSON)
+        return func.json_group_array(expr, type_=JSON)
+
+    def _json_array(self, *exprs) -> ColumnElement:
+        """JSON-массив из значений для диалекта текущей сессии."""
+        if self._dialect == 'postgresql':
+            return func.json_build_array(*exprs)
+        return func.json(func.json_array(*exprs))
+
+    def _timeline_keys(
+        self, user_id: int, limit: int, after: tuple[datetime, int] | None
+    ) -> Subquery:
+        """Ключи `(tweet_id, created_at)` страницы ленты юзера."""
+        if get_settings().fanout_on_write:
+            keys = self._fanout_timeline_keys(user_id, limit, after)
+        else:
+            keys = self._pull_timeline_keys(user_id, limit, after)
+        return keys.subquery()
+
+    @staticmethod
+    def _tweet_options(with_likes: bool) -> tuple:
+        """Связи твита, нужные для выдачи в поиске."""
+        return (
+            selectinload(Tweet.author),
+            selectinload(Tweet.likes) if with_likes else noload(Tweet.likes),
+            selectinload(Tweet.tweet_media_ids),
+        )
+
+    async def search_tweets(
+        self,
+        query: str,
+        limit: int,
+        cursor: str | None = None,
+        with_likes: bool = True,
+    ) -> Page:
+        """
+        Возвращает страницу твитов со всеми словами запроса, самые
+        релевантные первыми.
+
+        Пагинация keyset по `(rank, id)`. На PostgreSQL поиск идет по
+        tsvector-колонке с GIN-индексом, на остальных диалектах - по
+        инвертированному индексу в памяти.
+        """
+        after = decode_rank_cursor(cursor) if cursor else None
+        if self._dialect == 'postgresql':
+            ranked = await self._search_tsvector(query, limit, after)
+        else:
+            ranked = await self._search_in_memory(query, limit, after)
+
+        ids = [idx for _, idx in ranked]
         stmt = (
             select(Tweet)
-            .where(Tweet.user_id.in_(ids))
-            .options(
-                selectinload(Tweet.author),
-                selectinload(Tweet.likes),
-                selectinload(Tweet.tweet_media_ids),
+            .where(Tweet.id.in_(ids))
+            .options(*self._tweet_options(with_likes))
+        )
+        by_id = {t.id: t for t in await self._session.scalars(stmt)}
+        tweets = [by_id[idx] for idx in ids if idx in by_id]
+
+        if len(ranked) <= limit:
+            return Page(items=tweets, next_cursor=None)
+        rank, idx = ranked[limit - 1]
+        return Page(
+            items=tweets[:limit], next_cursor=encode_rank_cursor(rank, idx)
+        )
+
+    async def _search_tsvector(
+        self, query: str, limit: int, after: tuple[float, int] | None
+    ) -> list[tuple[float, int]]:
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        tsv = literal_column(f'tweets.{TWEET_SEARCH_COLUMN}')
+        rank = func.ts_rank_cd(tsv, tsquery)
+        stmt = (
+            select(rank, Tweet.id)
+            .where(tsv.bool_op('@@')(tsquery))
+            .order_by(rank.desc(), Tweet.id.desc())
+            .limit(limit + 1)
+        )
+        if after:
+            stmt = stmt.where(tuple_(rank, Tweet.id) < tuple_(*after))
+        return [tuple(row) for row in await self._session.execute(stmt)]
+
+    async def _search_in_memory(
+        self, query: str, limit: int, after: tuple[float, int] | None
+    ) -> list[tuple[float, int]]:
+        if not tweet_index.built:
+            rows = await self._session.execute(select(Tweet.id, Tweet.content))
+            tweet_index.build(rows)
+        ranked = tweet_index.search(query)
+        if after:
+            ranked = [key for key in ranked if key < after]
+        return ranked[: limit + 1]
+
+    async def get_likes_summary(
+        self, tweet_ids: list[int], user_id: int, sample_size: int
+    ) -> dict[int, LikesSummary]:
+        """
+        Одним запросом возвращает для каждого твита, лайкнул ли его юзер,
+        и не больше `sample_size` лайкнувших.
+
+        Читается не больше `sample_size` лайков на твит по первичному
+        ключу `(tweet_id, user_id)`, а `liked` - точечная проверка ключа,
+        так что стоимость не растет с общим числом лайков.
+        """
+        page = (
+            select(Tweet.id.label('tweet_id'))
+            .where(Tweet.id.in_(tweet_ids))
+            .subquery()
+        )
+        liked = (
+            select(TweetLike.tweet_id)
+            .where(
+                TweetLike.tweet_id == page.c.tweet_id,
+                TweetLike.user_id == user_id,
             )
-            .order_by(desc(Tweet.created_at))
+            .exists()
+            .label('liked')
         )
-        tweets = await self._session.scalars(stmt)
+        if self._dialect == 'postgresql':
+            sample = (
+                select(User.id, User.name)
+                .join(TweetLike, TweetLike.user_id == User.id)
+                .where(TweetLike.tweet_id == page.c.tweet_id)
+                .order_by(TweetLike.user_id)
+                .limit(sample_size)
+                .lateral()
+            )
+            onclause = true()
+        else:
+            # без LATERAL: первые лайкнувшие - коррелированным подзапросом
+            first = aliased(TweetLike)
+            sample = (
+                select(TweetLike.tweet_id, User.id, User.name)
+                .join(User, User.id == TweetLike.user_id)
+                .where(
+                    TweetLike.tweet_id.in_(tweet_ids),
+                    TweetLike.user_id.in_(
+                        select(first.user_id)
+                        .where(first.tweet_id == TweetLike.tweet_id)
+                        .order_by(first.user_id)
+                        .limit(sample_size)
+                    ),
+                )
+                .subquery()
+            )
+            onclause = sample.c.tweet_id == page.c.tweet_id
+        stmt = (
+            select(page.c.tweet_id, liked, sample.c.id, sample.c.name)
+            .outerjoin(sample, onclause)
+            .order_by(page.c.tweet_id, sample.c.id)
+        )
+
+        summary = {idx: LikesSummary(False, []) for idx in tweet_ids}
+        for row in await self._session.execute(stmt):
+            item = summary[row.tweet_id]
+            if row.liked and not item.liked:
+                summary[row.tweet_id] = item = item._replace(liked=True)
+            if row.id is not None:
+                item.sample.append({"id": row.id, "name": row.name})
 
-        return tweets.all()
+        return summary
 
-    async def _get_like(self, tweet_id: int, user_id: int) -> TweetLike:
-        """Возвращает лайк твита по id твита и пользователя."""
-        stmt = select(TweetLike).where(
-            TweetLike.user_id == user_id, TweetLike.tweet_id == tweet_id
+    async def get_tweet_likes(
+        self, tweet_id: int, limit: int, cursor: str | None = None
+    ) -> Page:
+        """
+        Возвращает страницу лайкнувших твит юзеров в порядке возрастания id.
+
+        :raises HTTPException: Когда твит не найден.
+        """
+        if not await self._session.scalar(
+            select(Tweet.id).filter_by(id=tweet_id)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Tweet not found.",
+            )
+
+        stmt = (
+            select(User.id, User.name)
+            .join(TweetLike, TweetLike.user_id == User.id)
+            .where(TweetLike.tweet_id == tweet_id)
+            .order_by(User.id)
+            .limit(limit + 1)
         )
+        if cursor:
+            stmt = stmt.where(User.id > decode_id_cursor(cursor))
+        users = (await self._session.execute(stmt)).all()
 
-        return await self._session.scalar(stmt)
+        if len(users) <= limit:
+            return Page(items=users, next_cursor=None)
+
+        return Page(
+            items=users[:limit],
+            next_cursor=encode_id_cursor(users[limit - 1].id),
+        )
+
+    @staticmethod
+    def _followees(user_id: int) -> Select:
+        """Id юзеров, на которых подписан юзер."""
+        return select(user_to_user.c.following_id).where(
+            user_to_user.c.followers_id == user_id
+        )
+
+    def _pull_timeline_keys(
+        self, user_id: int, limit: int, after: tuple[datetime, int] | None
+    ) -> Select:
+        """Ключи ленты, собираемой при чтении из твитов читаемых авторов."""
+        stmt = select(Tweet.id.label('tweet_id'), Tweet.created_at).where(
+            or_(
+                Tweet.user_id == user_id,
+                Tweet.user_id.in_(self._followees(user_id)),
+            )
+        )
+        return self._timeline_page(
+            stmt, Tweet.created_at, Tweet.id, limit, after
+        )
+
+    def _fanout_timeline_keys(
+        self, user_id: int, limit: int, after: tuple[datetime, int] | None
+    ) -> Select:
+        """
+        Ключи страницы предрассчитанной ленты юзера.
+
+        Твиты авторов с числом подписчиков больше порога не раскладываются
+        по лентам при записи и подмешиваются здесь из таблицы твитов. Каждая
+        ветка - отдельный range scan страницы по своему индексу; твиты
+        популярных авторов не берутся из ленты, так что ветки не
+        пересекаются и дедупликация не нужна.
+        """
+        popular = select(User.id).where(
+            User.id.in_(self._followees(user_id)),
+            User.followers_count > get_settings().fanout_max_followers,
+        )
+        timeline = home_timeline.c
+        stored = self._timeline_page(
+            select(timeline.tweet_id, timeline.created_at).where(
+                timeline.user_id == user_id,
+                timeline.author_id.not_in(popular),
+            ),
+            timeline.created_at,
+            timeline.tweet_id,
+            limit,
+            after,
+        ).subquery()
+        merged = self._timeline_page(
+            select(Tweet.id.label('tweet_id'), Tweet.created_at).where(
+                Tweet.user_id.in_(popular)
+            ),
+            Tweet.created_at,
+            Tweet.id,
+            limit,
+            after,
+        ).subquery()
+
+        return union_all(select(stored), select(merged))
+
+    async def _fan_out_tweets(
+        self, tweet_ids: list[int], author_id: int
+    ) -> None:
+        """
+        Раскладывает твиты по ленте автора и лентам его подписчиков.
+        Подписчики популярных авторов получат их при чтении ленты.
+        """
+        followers = (
+            select(user_to_user.c.followers_id)
+            .join(User, User.id == user_to_user.c.following_id)
+            .where(
+                user_to_user.c.following_id == author_id,
+                User.followers_count <= get_settings().fanout_max_followers,
+            )
+        )
+        recipients = union_all(
+            select(literal(author_id).label('user_id')), followers
+        ).subquery()
+
+        stmt = insert(home_timeline).from_select(
+            ['user_id', 'tweet_id', 'author_id', 'created_at'],
+            select(
+                recipients.c.user_id, Tweet.id, Tweet.user_id, Tweet.created_at
+            )
+            .join(recipients, true())
+            .where(Tweet.id.in_(tweet_ids)),
+        )
+        await self._session.execute(stmt)
+
+    async def backfill_timeline(
+        self, user_id: int, author_ids: list[int]
+    ) -> None:
+        """
+        Добавляет в ленту юзера последние твиты авторов после подписки.
+        Популярные авторы пропускаются: их твиты подмешиваются при чтении.
+        """
+        s = get_settings()
+        if not s.fanout_on_write:
+            return
+
+        rank = (
+            func.row_number()
+            .over(
+                partition_by=Tweet.user_id,
+                order_by=(Tweet.created_at.desc(), Tweet.id.desc()),
+            )
+            .label('rank')
+        )
+        recent = (
+            select(Tweet.id, Tweet.user_id, Tweet.created_at, rank)
+            .join(User, User.id == Tweet.user_id)
+            .where(
+                Tweet.user_id.in_(author_ids),
+                User.followers_count <= s.fanout_max_followers,
+            )
+            .subquery()
+        )
+        stmt = insert(home_timeline).from_select(
+            ['user_id', 'tweet_id', 'author_id', 'created_at'],
+            select(
+                literal(user_id),
+                recent.c.id,
+                recent.c.user_id,
+                recent.c.created_at,
+            ).where(recent.c.rank <= s.fanout_backfill_size),
+        )
+        await self._session.execute(stmt)
+
+    async def trim_timeline(self, user_id: int, author_ids: list[int]) -> None:
+        """Убирает из ленты юзера твиты авторов после отписки."""
+        if not get_settings().fanout_on_write:
+            return
+
+        stmt = delete(home_timeline).where(
+            home_timeline.c.user_id == user_id,
+            home_timeline.c.author_id.in_(author_ids),
+        )
+        await self._session.execute(stmt)
 
     async def _get_tweet(self, tweet_id) -> Tweet:
-        """Возвращает твит по id."""
-        stmt = select(Tweet).filter_by(id=tweet_id)
+        """Возвращает твит по id (без связей)."""
+        stmt = select(Tweet).filter_by(id=tweet_id).options(lazyload('*'))
 
         return await self._session.scalar(stmt)
 
-    async def add_tweet(self, tweet: TweetIn, user_id: int) -> Tweet:
+    async def add_tweet(self, tweet: TweetIn, user_id: int) -> int:
+        """
+        Создает новый твит и прикрепляет к нему медиа. Возвращает id твита.
+
+        :raises HTTPException: Когда медиа нельзя прикрепить.
         """
-        Создает новый твит.
-        Если получен список медиа, прикрепляет их к данному твиту.
+        (tweet_id,) = await self.add_tweets([tweet], user_id)
+        return tweet_id
+
+    async def add_tweets(
+        self, tweets: list[TweetIn], user_id: int
+    ) -> list[int]:
         """
+        Создает твиты юзера одной транзакцией: один INSERT на все твиты
+        и один UPDATE на все медиа. Возвращает id в порядке `tweets`.
+
+        :raises HTTPException: Когда медиа не найдены, загружены другим
+            юзером, уже прикреплены или повторяются.
+        """
+        stmt = insert(tweets_table).returning(
+            tweets_table.c.id, sort_by_parameter_order=True
+        )
+        tweet_ids = list(
+            await self._session.scalars(
+                stmt,
+                [dict(content=t.tweet_data, user_id=user_id) for t in tweets],
+            )
+        )
 
-        new_tweet = Tweet(content=tweet.tweet_data, user_id=user_id)
-        self._session.add(new_tweet)
-        await self._session.flush()
+        media = {}
+        for tweet, tweet_id in zip(tweets, tweet_ids):
+            for media_id in tweet.tweet_media_ids or ():
+                if media.setdefault(media_id, tweet_id) != tweet_id:
+                    raise self._media_not_attached([media_id])
+        if media:
+            await self._bind_media(media, user_id)
 
-        if ids := tweet.tweet_media_ids:
-            await self._bind_media_to_tweet(ids, new_tweet.id)
+        if get_settings().fanout_on_write:
+            await self._fan_out_tweets(tweet_ids, user_id)
 
+        await self._bump_feed_version(user_id)
         await self._session.commit()
+        for tweet, tweet_id in zip(tweets, tweet_ids):
+            # Core INSERT обходит события ORM, которые ведут индекс поиска
+            if tweet_index.built:
+                tweet_index.add(tweet_id, tweet.tweet_data)
+            await hub.publish(
+                'tweet', user_id, tweet_id=tweet_id, content=tweet.tweet_data
+            )
 
-        return new_tweet
+        return tweet_ids
 
-    async def add_like_to_tweet(self, tweet_id: int, user_id: int) -> None:
-        """Добавляет лайк твиту от конкретного юзера."""
-        tweet = await self._get_tweet(tweet_id)
+    @property
+    def _dialect(self) -> str:
+        return self._session.get_bind().dialect.name
+
+    def _insert(self, table):
+        """INSERT с поддержкой ON CONFLICT для диалекта текущей сессии."""
+        if self._dialect == 'postgresql':
+            return pg_insert(table)
+        return sqlite_insert(table)
+
+    @staticmethod
+    def _tweet_not_found() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tweet not found.",
+        )
 
-        if not await self._get_like(tweet_id=tweet_id, user_id=user_id):
-            like = TweetLike(user_id=user_id, tweet_id=tweet.id)
+    async def add_like_to_tweet(self, tweet_id: int, user_id: int) -> None:
+        """
+        Идемпотентно добавляет лайк твиту от конкретного юзера.
 
-            self._session.add(like)
-            await self._session.commit()
+        :raises HTTPException: Когда твит не найден.
+        """
+        insert_like = (
+            self._insert(likes_table)
+            .from_select(
+                ['tweet_id', 'user_id'],
+                select(tweets_table.c.id, literal(user_id)).where(
+                    tweets_table.c.id == tweet_id
+                ),
+            )
+            .on_conflict_do_nothing()
+            .returning(likes_table.c.tweet_id)
+        )
+        author_id = await self._apply_like_change(insert_like, tweet_id, 1)
+        if author_id is not None:
+            await hub.publish(
+                'like', author_id, tweet_id=tweet_id, user_id=user_id
+            )
 
     async def remove_like_from_tweet(
         self, tweet_id: int, user_id: int
     ) -> None:
-        """Удаляет лайк с твита."""
-        tweet = await self._get_tweet(tweet_id)
+        """
+        Идемпотентно удаляет лайк с твита.
+
+        :raises HTTPException: Когда твит не найден.
+        """
+        delete_like = (
+            delete(likes_table)
+            .where(
+                likes_table.c.tweet_id == tweet_id,
+                likes_table.c.user_id == user_id,
+            )
+            .returning(likes_table.c.tweet_id)
+        )
+        author_id = await self._apply_like_change(delete_like, tweet_id, -1)
+        if author_id is not None:
+            await hub.publish(
+                'unlike', author_id, tweet_id=tweet_id, user_id=user_id
+            )
+
+    async def apply_like_batch(
+        self, intents: dict[tuple[int, int], bool]
+    ) -> set[int]:
+        """
+        Применяет пакет лайков одной транзакцией: (tweet_id, user_id) ->
+        True - лайк, False - снятие. Счетчики и версии лент меняются только
+        по действительно изменившимся строкам. Возвращает id
+        несуществующих твитов.
+        """
+        tweet_ids = {tweet_id for tweet_id, _ in intents}
+        authors = dict(
+            (
+                await self._session.execute(
+                    select(tweets_table.c.id, tweets_table.c.user_id).where(
+                        tweets_table.c.id.in_(tweet_ids)
+                    )
+                )
+            ).all()
+        )
+        likes, unlikes = [], []
+        for key, like in intents.items():
+            if key[0] in authors:
+                (likes if like else unlikes).append(key)
+
+        changes = []
+        if likes:
+            stmt = (
+                self._insert(likes_table)
+                .values([dict(tweet_id=t, user_id=u) for t, u in likes])
+                .on_conflict_do_nothing()
+                .returning(likes_table.c.tweet_id, likes_table.c.user_id)
+            )
+            rows = (await self._session.execute(stmt)).all()
+            changes += [('like', *row, 1) for row in rows]
+        if unlikes:
+            stmt = (
+                delete(likes_table)
+                .where(
+                    tuple_(likes_table.c.tweet_id, likes_table.c.user_id).in_(
+                        unlikes
+                    )
+                )
+                .returning(likes_table.c.tweet_id, likes_table.c.user_id)
+            )
+            rows = (await self._session.execute(stmt)).all()
+            changes += [('unlike', *row, -1) for row in rows]
+
+        deltas: dict[int, int] = {}
+        for _, tweet_id, _, delta in changes:
+            deltas[tweet_id] = deltas.get(tweet_id, 0) + delta
+        if deltas:
+            await self._session.execute(
+                update(tweets_table)
+                .where(tweets_table.c.id.in_(deltas))
+                .values(
+                    like_count=tweets_table.c.like_count
+                    + case(deltas, value=tweets_table.c.id, else_=0)
+                )
+            )
+            await self._session.execute(
+                update(users_table)
+                .where(users_table.c.id.in_({authors[t] for t in deltas}))
+                .values(feed_version=users_table.c.feed_version + 1)
+            )
+        await self._session.commit()
+
+        for kind, tweet_id, user_id, _ in changes:
+            await hub.publish(
+                kind, authors[tweet_id], tweet_id=tweet_id, user_id=user_id
+            )
+        return tweet_ids - authors.keys()
+
+    async def _apply_like_change(
+        self, change: UpdateBase, tweet_id: int, delta: int
+    ) -> int | None:
+        """
+        Применяет вставку/удаление лайка и меняет счетчик и версию ленты
+        автора, только если строка лайка действительно изменилась.
+        Возвращает id автора твита, если лайк изменился.
 
-        like = await self._get_like(tweet_id=tweet.id, user_id=user_id)
-        if like:
-            await self._session.delete(like)
-            await self._session.commit()
+        В PostgreSQL это один запрос: DML в CTE и проверка существования
+        твита. Для остальных диалектов (SQLite в тестах) - несколько запросов
+        в одной транзакции.
+
+        :raises HTTPException: Когда твит не найден.
+        """
+        author = select(tweets_table.c.user_id).where(
+            tweets_table.c.id == tweet_id
+        )
+
+        if self._dialect == 'postgresql':
+            changed = change.cte('changed')
+            counter = (
+                update(tweets_table)
+                .where(tweets_table.c.id.in_(select(changed.c.tweet_id)))
+                .values(like_count=tweets_table.c.like_count + delta)
+                .returning(tweets_table.c.user_id)
+                .cte('counter')
+            )
+            version = (
+                update(users_table)
+                .where(users_table.c.id.in_(select(counter.c.user_id)))
+                .values(feed_version=users_table.c.feed_version + 1)
+                .returning(users_table.c.id)
+                .cte('version')
+            )
+            stmt = author.add_columns(
+                select(func.count()).select_from(version).scalar_subquery()
+            ).add_cte(counter)
+            row = (await self._session.execute(stmt)).first()
+            author_id, changed = row if row else (None, False)
+        else:
+            author_id = await self._session.scalar(author)
+            changed = bool(
+                author_id and (await self._session.execute(change)).first()
+            )
+            if changed:
+                await self._change_like_count(tweet_id, delta)
+                await self._bump_feed_version(author_id)
+
+        await self._session.commit()
+        if author_id is None:
+            raise self._tweet_not_found()
+        return author_id if changed else None
+
+    async def _change_like_count(self, tweet_id: int, delta: int) -> None:
+        """Атомарно меняет счетчик лайков твита в текущей транзакции."""
+        stmt = (
+            update(Tweet)
+            .where(Tweet.id == tweet_id)
+            .values(like_count=Tweet.like_count + delta)
+        )
+        await self._session.execute(stmt)
 
     async def delete_tweet(self, tweet_id: int, user_id: int):
         """
@@ -130,25 +1057,76 @@ class Dal:
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access forbidden",
             )
+        await self._session.execute(
+            delete(home_timeline).where(home_timeline.c.tweet_id == tweet.id)
+        )
         await self._session.delete(tweet)
+        await self._bump_feed_version(user_id)
         await self._session.commit()
+        await hub.publish('tweet_deleted', user_id, tweet_id=tweet_id)
+
+    async def _bind_media(self, media: dict[int, int], user_id: int):
+        """
+        Прикрепляет медиа (media_id -> tweet_id) к твитам одним UPDATE.
+        Прикрепить можно только свои и еще свободные файлы.
+
+        :raises HTTPException: Когда хотя бы один файл не прикрепился.
+        """
+        media_table = TweetMedia.__table__
+        stmt = (
+            update(media_table)
+            .where(
+                media_table.c.id.in_(media),
+                media_table.c.tweet_id.is_(None),
+                media_table.c.uploader_id == user_id,
+            )
+            .values(tweet_id=case(media, value=media_table.c.id))
+            .returning(media_table.c.id)
+        )
+        bound = set(await self._session.scalars(stmt))
+        if failed := sorted(media.keys() - bound):
+            raise self._media_not_attached(failed)
+
+    @staticmethod
+    def _media_not_attached(ids: list[int]) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Media {ids} can't be attached.",
+        )
+
+    async def upload_file(
+        self, file: UploadFile, user_id: int
+    ) -> TweetMedia | None:
+        """
+        Записывает файл на диск и возвращает его медиа-запись.
 
-    async def _bind_media_to_tweet(self, ids: list, tweet_id: int):
-        """Связывает медиафайлы с твитом."""
-        stmt = select(TweetMedia).filter(TweetMedia.id.in_(ids))
-
-        medias = await self._session.scalars(stmt)
-        for media in medias:
-            if not media.tweet_id:
-                media.tweet_id = tweet_id
-
-        self._session.add_all(medias)
-
-    async def upload_file(self, file: UploadFile):
-        """Записывает в файл в память."""
-        new_filename = await write_file(file)
-        if new_filename:
-            new_file = TweetMedia(url=new_filename)
-            self._session.add(new_file)
-            await self._session.commit()
-            return new_file
+        Повторная загрузка того же содержимого тем же юзером, пока оно не
+        прикреплено к твиту, возвращает уже существующую запись
+        (уникальный индекс по `uploader_id`, `content_hash`). Для картинок
+        в пуле процессов создаются уменьшенные варианты.
+        """
+        stored = await write_file(file)
+        if not stored:
+            return None
+
+        variants = await make_variants(stored)
+        insert_media = self._insert(TweetMedia).values(
+            url=stored.url,
+            uploader_id=user_id,
+            content_hash=stored.sha256,
+            thumb_url=variants.get('thumb'),
+            feed_url=variants.get('feed'),
+        )
+        # DO UPDATE вместо DO NOTHING, чтобы RETURNING вернул и прежнюю запись
+        stmt = insert_media.on_conflict_do_update(
+            index_elements=[TweetMedia.uploader_id, TweetMedia.content_hash],
+            index_where=TweetMedia.tweet_id.is_(None),
+            set_={
+                'url': insert_media.excluded.url,
+                'thumb_url': insert_media.excluded.thumb_url,
+                'feed_url': insert_media.excluded.feed_url,
+            },
+        ).returning(TweetMedia)
+        media = await self._session.scalar(stmt)
+        await self._session.commit()
+        return media
@@ -6,6 +6,40 @@ from pydantic import BaseSettings, Field
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 MEDIA_ROOT = './media'
 
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 200
+LIKES_SAMPLE_SIZE = 3
+LIKES_PAGE_SIZE = 100
+LIKES_MAX_PAGE_SIZE = 1000
+SEARCH_MAX_QUERY = 256
+FOLLOWS_PAGE_SIZE = 100
+FOLLOWS_MAX_PAGE_SIZE = 1000
+# максимум юзеров в одном запросе массовой подписки
+FOLLOW_BATCH_SIZE = 1000
+# максимум твитов в одном запросе пакетной публикации
+TWEET_BATCH_SIZE = 100
+# подписчиков и подписок в профиле, полные списки - постранично
+PROFILE_PREVIEW_SIZE = 50
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# запас тела запроса сверх `max_upload_size` на границы и заголовки multipart
+UPLOAD_BODY_OVERHEAD = 64 * 1024
+# варианты картинок: имя -> максимальная ширина в px
+IMAGE_VARIANTS = {"thumb": 200, "feed": 680}
+IMAGE_FORMAT = "WEBP"
+IMAGE_QUALITY = 80
+# ответы с ETag: кэшировать можно только в браузере и с перепроверкой
+CACHE_CONTROL = "private, no-cache"
+# push-обновления ленты: канал NOTIFY, очередь на подключение, пинг в сек.
+STREAM_CHANNEL = "tweet_events"
+STREAM_QUEUE_SIZE = 100
+STREAM_KEEPALIVE = 15.0
+# пакетная запись лайков: размер пакета, ожидание добора в сек., очередь
+# и сколько секунд ждать места в ней до ответа 503
+LIKE_BATCH_SIZE = 500
+LIKE_BATCH_DELAY = 0.005
+LIKE_QUEUE_SIZE = 10_000
+LIKE_QUEUE_TIMEOUT = 1.0
+
 TESTING = False
 USE_SENTRY = False
 
@@ -15,8 +49,63 @@ class Settings(BaseSettings):
     dev_db: str = Field(..., env="DEV_DATABASE_URL")
     test_db: str = Field(..., env="TEST_DATABASE_URL")
     sentry_dsn: str = Field(..., env="DSN")
+    sentry_traces_sample_rate: float = Field(
+        0.05, env="SENTRY_TRACES_SAMPLE_RATE"
+    )
     debug: bool = Field(..., env="DEBUG")
 
+    # fan-out-on-write: твит раскладывается по лентам подписчиков при записи,
+    # авторы с числом подписчиков больше порога подмешиваются при чтении
+    fanout_on_write: bool = Field(False, env="FANOUT_ON_WRITE")
+    fanout_max_followers: int = Field(10_000, env="FANOUT_MAX_FOLLOWERS")
+    fanout_backfill_size: int = Field(800, env="FANOUT_BACKFILL_SIZE")
+
+    # кэш api key -> пользователь; размер 0 отключает кэш
+    auth_cache_size: int = Field(10_000, env="AUTH_CACHE_SIZE")
+    auth_cache_ttl: float = Field(60.0, env="AUTH_CACHE_TTL")
+
+    # максимальный размер загружаемого файла в байтах, больше - 413
+    max_upload_size: int = Field(20 * 1024 * 1024, env="MAX_UPLOAD_SIZE")
+    # процессы для обработки картинок; 0 отключает варианты
+    image_workers: int = Field(2, env="IMAGE_WORKERS")
+
+    # пул соединений с БД
+    db_pool_size: int = Field(5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(10, env="DB_MAX_OVERFLOW")
+    db_pool_timeout: float = Field(30.0, env="DB_POOL_TIMEOUT")
+    db_pool_recycle: int = Field(1800, env="DB_POOL_RECYCLE")
+    db_pool_pre_ping: bool = Field(True, env="DB_POOL_PRE_PING")
+    # кэш подготовленных выражений asyncpg; 0 - для pgbouncer
+    db_statement_cache_size: int = Field(100, env="DB_STATEMENT_CACHE_SIZE")
+    # соединений БД на все воркеры (max_connections сервера минус резерв);
+    # пул каждого воркера урезается до своей доли
+    db_max_connections: int = Field(90, env="DB_MAX_CONNECTIONS")
+    # реплики для GET-маршрутов через запятую; пусто - все в первичную БД
+    db_replica_urls: str = Field("", env="DB_REPLICA_URLS")
+    # сколько секунд после своей записи клиент читает первичную БД
+    replica_sticky_seconds: float = Field(5.0, env="REPLICA_STICKY_SECONDS")
+    # через сколько секунд снова пробовать недоступную реплику
+    replica_retry_seconds: float = Field(10.0, env="REPLICA_RETRY_SECONDS")
+
+    # сервер (server.py): при DEBUG - один процесс с перезагрузкой,
+    # иначе `workers` процессов и плавная остановка за `graceful_timeout`
+    host: str = Field("0.0.0.0", env="UVICORN_HOST")
+    port: int = Field(5000, env="UVICORN_PORT")
+    reload: bool = Field(False, env="UVICORN_RELOAD")
+    workers: int = Field(1, env="WORKERS")
+    graceful_timeout: float = Field(30.0, env="GRACEFUL_TIMEOUT")
+
+    # бюджет SQL-выражений на маршрут: в режиме DEBUG превышение пишется
+    # в лог, в строгом режиме - исключение (для тестов)
+    query_budget_strict: bool = Field(False, env="QUERY_BUDGET_STRICT")
+
+    # брокер событий /api/stream: memory (один воркер) или postgres
+    # (LISTEN/NOTIFY, события видны всем воркерам)
+    stream_broker: str = Field("memory", env="STREAM_BROKER")
+
+    # лайки пишутся пакетами одной транзакцией вместо транзакции на запрос
+    like_batching: bool = Field(False, env="LIKE_BATCHING")
+
     class Config:  # noqa
         env_prefix = ""
         case_sensitive = False
@@ -33,6 +122,12 @@ def get_settings():
     return Settings()
 
 
+def get_replica_urls() -> list[str]:
+    """Ссылки на реплики БД из `db_replica_urls`."""
+    urls = get_settings().db_replica_urls.split(",")
+    return [url.strip() for url in urls if url.strip()]
+
+
 def get_db_url():
     """
     Возвращает ссылку на базу данных в зависимости от флага DEBUG
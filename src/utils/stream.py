@@ -0,0 +1,216 @@
+"""
+Модуль содержит pub/sub для push-обновлений ленты.
+
+`Dal` после коммита публикует событие (новый/удаленный твит, лайк,
+подписка) в `hub`. Хаб через брокер доставляет его подписчикам, чья
+лента содержит автора события. Брокер в памяти работает в пределах
+процесса, `PostgresBroker` (LISTEN/NOTIFY) - между воркерами.
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable
+
+import asyncpg
+from loguru import logger
+from sqlalchemy.engine import make_url
+
+from utils.settings import (
+    STREAM_CHANNEL,
+    STREAM_QUEUE_SIZE,
+    get_db_url,
+    get_settings,
+)
+
+Deliver = Callable[[str], None]
+
+# события, меняющие состав ленты подписчика
+GRAPH_EVENTS = {"follow": set.add, "unfollow": set.discard}
+
+
+class Broker(ABC):
+    """Транспорт событий между хабами воркеров."""
+
+    @abstractmethod
+    async def start(self, deliver: Deliver) -> None:
+        """Начинает получать сообщения, передавая их в `deliver`."""
+
+    @abstractmethod
+    async def publish(self, message: str) -> None:
+        """Отправляет сообщение всем хабам, включая свой."""
+
+    @abstractmethod
+    async def stop(self) -> None:
+        """Прекращает получение сообщений."""
+
+
+class MemoryBroker(Broker):
+    """Брокер в пределах процесса: сообщение сразу уходит своему хабу."""
+
+    def __init__(self) -> None:
+        self._deliver: Deliver | None = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, message: str) -> None:
+        if self._deliver is not None:
+            self._deliver(message)
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+
+class PostgresBroker(Broker):
+    """
+    Брокер на PostgreSQL LISTEN/NOTIFY.
+
+    Слушает канал на отдельном соединении, публикует через маленький пул,
+    чтобы не занимать соединения приложения.
+    """
+
+    def __init__(self, dsn: str, channel: str = STREAM_CHANNEL) -> None:
+        self.dsn = dsn
+        self.channel = channel
+        self._listener: asyncpg.Connection | None = None
+        self._pool: asyncpg.Pool | None = None
+
+    @classmethod
+    def from_url(cls, url: str, channel: str = STREAM_CHANNEL):
+        """Брокер по SQLAlchemy-ссылке на БД (`postgresql+asyncpg://`)."""
+        dsn = make_url(url).set(drivername="postgresql")
+        return cls(dsn.render_as_string(hide_password=False), channel)
+
+    async def start(self, deliver: Deliver) -> None:
+        def on_notify(connection, pid, channel, payload) -> None:
+            deliver(payload)
+
+        self._listener = await asyncpg.connect(self.dsn)
+        await self._listener.add_listener(self.channel, on_notify)
+        self._pool = await asyncpg.create_pool(
+            self.dsn, min_size=1, max_size=2
+        )
+
+    async def publish(self, message: str) -> None:
+        if self._pool is None:
+            return
+        await self._pool.execute(
+            "SELECT pg_notify($1, $2)", self.channel, message
+        )
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+
+
+class Subscription:
+    """
+    Очередь событий одного подключения.
+
+    Медленный клиент не копит события без предела: при переполнении
+    очередь сбрасывается, и клиент получает `resync` - перечитать ленту.
+    """
+
+    def __init__(self, user_id: int, authors: set[int], maxsize: int):
+        self.user_id = user_id
+        self.authors = authors
+        self.lagged = False
+        self._queue: asyncio.Queue[dict] = asyncio.Queue(maxsize)
+
+    def put(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagged = True
+
+    async def get(self, timeout: float | None = None) -> dict | None:
+        """Следующее событие или None, если за `timeout` его не было."""
+        if self.lagged:
+            self.lagged = False
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            return {"type": "resync"}
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Hub:
+    """Подписки процесса, сгруппированные по авторам их лент."""
+
+    def __init__(self, broker: Broker, queue_size: int = STREAM_QUEUE_SIZE):
+        self.broker = broker
+        self.queue_size = queue_size
+        self._by_author: dict[int, set[Subscription]] = defaultdict(set)
+        self._by_user: dict[int, set[Subscription]] = defaultdict(set)
+
+    async def start(self) -> None:
+        await self.broker.start(self._deliver)
+
+    async def stop(self) -> None:
+        await self.broker.stop()
+
+    async def publish(self, kind: str, author_id: int, **data) -> None:
+        """Публикует событие автора `author_id`; ошибки брокера в лог."""
+        message = json.dumps({"type": kind, "author_id": author_id, **data})
+        try:
+            await self.broker.publish(message)
+        except (OSError, asyncpg.PostgresError) as exc:
+            logger.warning(f"stream event {kind!r} is lost: {exc!r}")
+
+    def subscribe(self, user_id: int, authors: set[int]) -> Subscription:
+        """Подписывает юзера на события авторов его ленты (и свои)."""
+        sub = Subscription(user_id, {*authors, user_id}, self.queue_size)
+        self._by_user[user_id].add(sub)
+        for author in sub.authors:
+            self._by_author[author].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._discard(self._by_user, sub.user_id, sub)
+        for author in sub.authors:
+            self._discard(self._by_author, author, sub)
+
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self._by_user.values())
+
+    def _deliver(self, message: str) -> None:
+        """Раздает сообщение брокера подписчикам процесса."""
+        event = json.loads(message)
+        author = event["author_id"]
+        if change := GRAPH_EVENTS.get(event["type"]):
+            for sub in self._by_user.get(event["user_id"], ()):
+                change(sub.authors, author)
+                if author in sub.authors:
+                    self._by_author[author].add(sub)
+                else:
+                    self._discard(self._by_author, author, sub)
+                sub.put(event)
+            return
+
+        for sub in self._by_author.get(author, ()):
+            sub.put(event)
+
+    @staticmethod
+    def _discard(index: dict, key: int, sub: Subscription) -> None:
+        subs = index.get(key)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del index[key]
+
+
+def make_broker() -> Broker:
+    """Брокер из настроек `stream_broker`: `memory` или `postgres`."""
+    if get_settings().stream_broker == "postgres":
+        return PostgresBroker.from_url(get_db_url())
+    return MemoryBroker()
+
+
+hub = Hub(make_broker())
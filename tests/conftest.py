@@ -3,17 +3,21 @@ import json
 
 import pytest
 from httpx import AsyncClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
-from database.init_db import db
+from database.init_db import db, db_read
 from database.models import Base, User, Tweet
 from main import app
+from utils.authentication import principal_cache
+from utils.metrics import instrument_engine
+from utils.query_budget import assert_max_queries
 from utils.settings import get_settings
 
 s = get_settings()
+s.query_budget_strict = True
 
 test_engine = create_async_engine(
     s.test_db,
@@ -38,6 +42,8 @@ async def override_db():
 
 
 app.dependency_overrides[db] = override_db
+app.dependency_overrides[db_read] = override_db
+instrument_engine(test_engine)
 
 
 @pytest.fixture(scope="session")
@@ -56,6 +62,31 @@ async def startup(async_session):
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@pytest.fixture(autouse=True)
+def clear_principal_cache():
+    """Every test starts with a cold api-key cache."""
+    principal_cache.clear()
+
+
+@pytest.fixture
+def query_budget():
+    """`with query_budget(n):` fails the test on more than n statements."""
+    return assert_max_queries
+
+
+@pytest.fixture
+def statements():
+    """Collects SQL statements issued through the test engine."""
+    issued = []
+
+    def on_execute(conn, cursor, statement, *args):
+        issued.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", on_execute)
+    yield issued
+    event.remove(test_engine.sync_engine, "before_cursor_execute", on_execute)
+
+
 @pytest.fixture(scope="session")
 async def async_client():
     async with AsyncClient(
@@ -85,7 +116,10 @@ def user_1():
 def user_1_expected():
     return {
         "result": True,
-        "user": {"id": 1, "name": "test", "following": [], "followers": []}
+        "user": {
+            "id": 1, "name": "test", "followers_count": 0,
+            "following_count": 0, "following": [], "followers": [],
+        }
     }
 
 
@@ -102,7 +136,10 @@ def user_2():
 def user_2_expected():
     return {
         "result": True,
-        "user": {"id": 1, "name": "test2", "following": [], "followers": []}
+        "user": {
+            "id": 1, "name": "test2", "followers_count": 0,
+            "following_count": 0, "following": [], "followers": [],
+        }
     }
 
 
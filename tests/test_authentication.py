@@ -0,0 +1,66 @@
+import pytest
+
+from utils.authentication import Principal, PrincipalCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.users
+class TestPrincipalCache:
+    """Test api-key -> user cache."""
+
+    def test_hit_and_miss_are_counted(self):
+        cache = PrincipalCache(maxsize=2, ttl=60)
+
+        assert cache.get("key") is None
+        cache.set("key", Principal(1, "test"))
+
+        assert cache.get("key") == Principal(1, "test")
+        assert cache.stats() == {
+            "hits": 1, "misses": 1, "size": 1, "maxsize": 2
+        }
+
+    def test_entry_expires(self):
+        timer = FakeTimer()
+        cache = PrincipalCache(maxsize=2, ttl=60, timer=timer)
+        cache.set("key", Principal(1, "test"))
+
+        timer.now = 61
+
+        assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PrincipalCache(maxsize=2, ttl=60)
+        cache.set("a", Principal(1, "a"))
+        cache.set("b", Principal(2, "b"))
+        cache.get("a")
+
+        cache.set("c", Principal(3, "c"))
+
+        assert cache.get("b") is None
+        assert cache.get("a") == Principal(1, "a")
+
+    def test_invalidation(self):
+        cache = PrincipalCache(maxsize=10, ttl=60)
+        cache.set("old", Principal(1, "test"))
+        cache.set("new", Principal(1, "test"))
+        cache.set("other", Principal(2, "other"))
+
+        cache.invalidate("other")
+        assert cache.get("other") is None
+
+        cache.invalidate_user(1)
+        assert len(cache) == 0
+
+    def test_zero_size_disables_cache(self):
+        cache = PrincipalCache(maxsize=0, ttl=60)
+        cache.set("key", Principal(1, "test"))
+
+        assert cache.get("key") is None
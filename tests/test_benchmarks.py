@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from benchmarks import serialization
+from benchmarks.run import SCENARIOS, bench
+from benchmarks.seed import SeedConfig
+from utils import batching
+from utils.settings import get_settings
+
+
+@pytest.mark.benchmarks
+class TestBenchmarks:
+    """Smoke test for the benchmark harness."""
+
+    async def test_bench_sqlite(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        config = SeedConfig(
+            users=20, following=5, tweets_per_user=3, likes_per_user=5
+        )
+
+        results = await bench(
+            f"sqlite+aiosqlite:///{tmp_path / 'bench.db'}",
+            config,
+            list(SCENARIOS),
+            requests=5,
+            concurrency=2,
+        )
+
+        assert [r.name for r in results] == list(SCENARIOS)
+        for result in results:
+            assert result.errors == 0
+            assert len(result.latencies) == 5
+
+    async def test_bench_like_batching(self, tmp_path, monkeypatch):
+        pytest.importorskip("aiosqlite")
+        monkeypatch.setattr(get_settings(), "like_batching", True)
+        sessionmaker = batching.like_batcher.sessionmaker
+        flushed = batching.batch_size.values.get((), ([0], [0]))[1][0]
+
+        (result,) = await bench(
+            f"sqlite+aiosqlite:///{tmp_path / 'bench.db'}",
+            SeedConfig(
+                users=5, following=2, tweets_per_user=2, likes_per_user=3
+            ),
+            ["like"],
+            requests=5,
+            concurrency=2,
+        )
+
+        # лайки прошли через батчер и записаны в базу замера
+        assert result.errors == 0
+        assert batching.batch_size.values[()][1][0] == flushed + 5
+        assert not batching.like_batcher.running
+        assert batching.like_batcher.sessionmaker is sessionmaker
+
+    def test_serialization_paths_agree(self):
+        tweets = serialization.orm_page(3, 2)
+        rows = serialization.row_page(3, 2)
+
+        assert json.loads(serialization.pydantic_path(tweets)) == json.loads(
+            serialization.fast_path(rows)
+        )
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import bulk
+from database.models import Base, Tweet, User, user_to_user
+from tests.conftest import test_engine
+from utils.search import tweet_index
+
+
+@pytest.mark.internal
+class TestBulkLoad:
+    """Test CSV/NDJSON bulk import and export."""
+
+    @pytest.fixture
+    async def cleanup(self):
+        yield
+        async with test_engine.begin() as conn:
+            await conn.execute(
+                delete(user_to_user).where(user_to_user.c.followers_id > 700)
+            )
+            await conn.execute(delete(User).where(User.id > 700))
+
+    async def test_copy_roundtrip(self, tmp_path, cleanup):
+        users = tmp_path / "users.csv"
+        users.write_text(
+            "id,name,api_key\n701,bulk one,bulk1\n702,bulk two,bulk2\n"
+        )
+        follows = tmp_path / "follows.ndjson"
+        follows.write_text(
+            json.dumps({"followers_id": 701, "following_id": 702}) + "\n"
+        )
+
+        assert await bulk.load(test_engine, "users", users, batch_size=1) == 2
+        assert await bulk.load(test_engine, "user_follows", follows) == 1
+
+        async with test_engine.connect() as conn:
+            names = await conn.scalars(
+                select(User.name).where(User.id > 700).order_by(User.id)
+            )
+            assert names.all() == ["bulk one", "bulk two"]
+            counts = await conn.execute(
+                select(User.following_count, User.followers_count)
+                .where(User.id > 700)
+                .order_by(User.id)
+            )
+            assert counts.all() == [(1, 0), (0, 1)]
+            versions = await conn.scalars(
+                select(User.graph_version)
+                .where(User.id > 700)
+                .order_by(User.id)
+            )
+            assert versions.all() == [1, 1]
+
+        exported = tmp_path / "export.csv"
+        await bulk.dump(test_engine, "user_follows", exported)
+        assert "701,702" in exported.read_text().splitlines()
+
+    async def test_unknown_column(self, tmp_path):
+        users = tmp_path / "users.csv"
+        users.write_text("id,nickname\n703,bulk\n")
+
+        with pytest.raises(ValueError):
+            await bulk.load(test_engine, "users", users)
+
+    async def test_executemany_fallback(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/db")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        (tmp_path / "users.csv").write_text("id,name,api_key\n1,a,a\n2,b,b\n")
+        (tmp_path / "tweets.ndjson").write_text(
+            json.dumps(
+                {"id": 1, "content": "x", "user_id": 1,
+                 "created_at": "2026-10-18T09:00:00"}
+            ) + "\n"
+        )
+        (tmp_path / "likes.csv").write_text(
+            "tweet_id,user_id\n1,1\n1,2\n"
+        )
+        await bulk.load(engine, "users", tmp_path / "users.csv")
+        tweet_index.build([])
+        await bulk.load(engine, "tweets", tmp_path / "tweets.ndjson")
+        assert not tweet_index.built
+        await bulk.load(engine, "tweet_likes", tmp_path / "likes.csv")
+
+        async with engine.connect() as conn:
+            assert await conn.scalar(select(Tweet.like_count)) == 2
+            assert await conn.scalar(select(func.count(User.id))) == 2
+            # твит и лайки на нем меняют версию автора, но не лайкнувшего
+            versions = await conn.scalars(
+                select(User.feed_version).order_by(User.id)
+            )
+            assert versions.all() == [2, 0]
+
+        exported = tmp_path / "tweets_out.ndjson"
+        await bulk.dump(engine, "tweets", exported)
+        row = json.loads(exported.read_text())
+        assert row["created_at"] == "2026-10-18T09:00:00"
+        assert row["like_count"] == 2
+        await engine.dispose()
@@ -0,0 +1,263 @@
+import pytest
+from fastapi import Request
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import init_db
+from database.init_db import pool_limits
+from database.pool import InstrumentedAsyncPool
+from database.replicas import SessionRouter
+from routers import create_app
+from routers.users import get_user_by_id
+from server import uvicorn_options
+from tests.conftest import TestSession, test_engine
+from utils.metrics import Histogram, instrument_engine
+from utils.query_budget import QueryBudgetExceeded
+from utils.settings import get_settings
+
+
+@pytest.mark.internal
+class TestPoolMetrics:
+    """Test connection pool instrumentation."""
+
+    async def test_checkout_wait_and_timeout(self):
+        engine = create_async_engine(
+            get_settings().test_db,
+            poolclass=InstrumentedAsyncPool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.1,
+        )
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("select 1"))
+                with pytest.raises(exc.TimeoutError):
+                    await engine.connect().start()
+
+                stats = engine.pool.stats()
+                assert stats["in_use"] == 1
+                assert stats["checkouts"] == 1
+                assert stats["waits"] == 1
+                assert stats["timeouts"] == 1
+
+            assert engine.pool.stats()["in_use"] == 0
+        finally:
+            await engine.dispose()
+
+    async def test_metrics_endpoint(self, async_client):
+        response = await async_client.get("/internal/metrics")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert {"in_use", "waits", "checkout_seconds_total"} <= set(
+            data["pool"]
+        )
+        assert data["auth_cache"]["maxsize"] == get_settings().auth_cache_size
+
+
+@pytest.mark.internal
+class TestMetrics:
+    """Test Prometheus metrics."""
+
+    def test_histogram_render(self):
+        histogram = Histogram("latency", "Latency.", (0.1, 1.0))
+        histogram.observe(0.1, route="/a")
+        histogram.observe(5, route="/a")
+
+        assert histogram.render().splitlines() == [
+            "# HELP latency Latency.",
+            "# TYPE latency histogram",
+            'latency_bucket{route="/a",le="0.1"} 1',
+            'latency_bucket{route="/a",le="1.0"} 1',
+            'latency_bucket{route="/a",le="+Inf"} 2',
+            'latency_sum{route="/a"} 5.1',
+            'latency_count{route="/a"} 2',
+        ]
+
+    async def test_request_metrics(self, async_client):
+        instrument_engine(test_engine)
+
+        response = await async_client.get("/api/users/999999")
+        assert response.status_code == 404
+
+        response = await async_client.get("/metrics")
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        route = 'route="/api/users/{idx}"'
+        assert any(
+            line.startswith("http_request_duration_seconds_count")
+            and route in line
+            and 'status="404"' in line
+            for line in lines
+        )
+        statements = next(
+            line
+            for line in lines
+            if line.startswith("http_request_db_statements_sum{")
+            and route in line
+        )
+        assert float(statements.rsplit(" ", 1)[1]) >= 1
+        assert "http_requests_in_flight 1" in lines
+        assert any(line.startswith("db_pool_in_use ") for line in lines)
+
+
+@pytest.mark.internal
+class TestQueryBudget:
+    """Test per-route SQL statement budgets."""
+
+    async def test_block_over_budget(self, query_budget):
+        async with TestSession() as session:
+            with query_budget(2) as stats:
+                await session.execute(text("select 1"))
+                await session.execute(text("select 2"))
+            assert stats.statements == 2
+
+            with pytest.raises(QueryBudgetExceeded) as exc:
+                with query_budget(1):
+                    await session.execute(text("select 1"))
+                    await session.execute(text("select 2"))
+            assert exc.value.statements == 2
+
+    async def test_route_over_budget(self, async_client, monkeypatch):
+        monkeypatch.setattr(get_user_by_id, "query_budget", 0)
+
+        with pytest.raises(QueryBudgetExceeded) as exc:
+            await async_client.get("/api/users/999999")
+
+        assert "GET /api/users/{idx}" in str(exc.value)
+
+
+@pytest.mark.internal
+class TestServerProfile:
+    """Test production server options and per-worker pool sizing."""
+
+    @pytest.fixture
+    def settings(self, monkeypatch):
+        s = get_settings()
+        for name in ('debug', 'workers', 'db_max_connections'):
+            monkeypatch.setattr(s, name, getattr(s, name))
+        return s
+
+    @pytest.mark.parametrize(
+        'workers, broker, expected',
+        [(1, 'memory', (5, 10)), (8, 'memory', (5, 6)),
+         (8, 'postgres', (5, 3)), (100, 'memory', (1, 0))],
+    )
+    def test_pool_limits(self, settings, monkeypatch, workers, broker,
+                         expected):
+        monkeypatch.setattr(settings, 'stream_broker', broker)
+        monkeypatch.setattr(settings, 'db_pool_size', 5)
+        monkeypatch.setattr(settings, 'db_max_overflow', 10)
+        settings.db_max_connections = 90
+        settings.workers = workers
+
+        assert pool_limits() == expected
+
+    def test_uvicorn_options(self, settings):
+        settings.debug = False
+        settings.workers = 4
+
+        options = uvicorn_options()
+
+        assert options['workers'] == 4
+        assert options['lifespan'] == 'on'
+        assert 'reload' not in options
+
+        settings.debug = True
+        assert uvicorn_options()['workers'] == 1
+
+    def test_app_debug_follows_settings(self, settings):
+        settings.debug = False
+        assert create_app().debug is False
+
+
+@pytest.mark.internal
+class TestReplicaRouting:
+    """Test read routing with two local SQLite databases."""
+
+    @pytest.fixture
+    async def databases(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        engines = []
+        for name in ("primary", "replica"):
+            engine = create_async_engine(
+                f"sqlite+aiosqlite:///{tmp_path / name}.db"
+            )
+            async with engine.begin() as conn:
+                await conn.execute(text("create table source (name text)"))
+                await conn.execute(
+                    text("insert into source values (:name)"), {"name": name}
+                )
+            engines.append(engine)
+        yield engines
+        for engine in engines:
+            await engine.dispose()
+
+    @pytest.fixture
+    def clock(self):
+        return [0.0]
+
+    def router(self, databases, clock, replicas=None):
+        primary, replica = databases
+        return SessionRouter(
+            async_sessionmaker(bind=primary),
+            [replica] if replicas is None else replicas,
+            sticky_seconds=5,
+            retry_seconds=10,
+            timer=lambda: clock[0],
+        )
+
+    @staticmethod
+    async def source(router, key=None):
+        async with await router.read(key) as session:
+            return await session.scalar(text("select name from source"))
+
+    async def test_reads_your_writes(self, databases, clock):
+        router = self.router(databases, clock)
+
+        assert await self.source(router, "alice") == "replica"
+        router.mark_write("alice")
+        assert await self.source(router, "alice") == "primary"
+        assert await self.source(router, "bob") == "replica"
+
+        clock[0] = 6
+        assert await self.source(router, "alice") == "replica"
+        assert router.stats()["primary_reads"] == 1
+
+    async def test_failover_to_primary(self, databases, clock, tmp_path):
+        broken = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db"
+        )
+        router = self.router(databases, clock, replicas=[broken])
+
+        assert await self.source(router) == "primary"
+        assert await self.source(router) == "primary"
+        stats = router.stats()
+        assert stats["failovers"] == 1
+        assert stats["healthy"] == 0
+
+        clock[0] = 11
+        assert await self.source(router) == "primary"
+        assert router.stats()["failovers"] == 2
+        await broken.dispose()
+
+    async def test_write_request_marks_sticky(
+        self, databases, clock, monkeypatch
+    ):
+        router = self.router(databases, clock)
+        monkeypatch.setattr(init_db, "session_router", router)
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "headers": [(b"api-key", b"alice")],
+        }
+
+        writer = init_db.db(Request(scope))
+        await anext(writer)
+        await writer.aclose()
+
+        assert router.sticky.active("alice")
+        reader = init_db.db_read(Request({**scope, "method": "GET"}))
+        session = await anext(reader)
+        assert session.bind is router.primary.kw["bind"]
+        await reader.aclose()
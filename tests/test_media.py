@@ -0,0 +1,237 @@
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from database.models import Tweet, TweetMedia, User
+from tests.conftest import TestSession
+from utils import file_system, images
+from utils.settings import (
+    UPLOAD_BODY_OVERHEAD,
+    UPLOAD_CHUNK_SIZE,
+    get_settings,
+)
+
+
+@pytest.fixture
+def media_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_system, "MEDIA_ROOT", str(tmp_path))
+    monkeypatch.setattr(images, "MEDIA_ROOT", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def max_upload_size(monkeypatch):
+    monkeypatch.setattr(get_settings(), "max_upload_size", 1024)
+    return 1024
+
+
+@pytest.fixture
+async def author():
+    async with TestSession() as session:
+        session.add(User(id=601, name="media", api_key="media"))
+        await session.commit()
+    yield 601
+    async with TestSession() as session:
+        await session.execute(
+            TweetMedia.__table__.delete().where(
+                TweetMedia.content_hash.is_not(None)
+            )
+        )
+        await session.execute(
+            Tweet.__table__.delete().where(Tweet.user_id == 601)
+        )
+        await session.execute(
+            User.__table__.delete().where(User.id == 601)
+        )
+        await session.commit()
+
+
+def upload(name: str, content: bytes) -> UploadFile:
+    return UploadFile(filename=name, file=io.BytesIO(content))
+
+
+@pytest.mark.media
+class TestWriteFile:
+    """Test streaming media upload to disk."""
+
+    async def test_write_file(self, media_root):
+        content = b"x" * (file_system.UPLOAD_CHUNK_SIZE * 2 + 10)
+
+        stored = await file_system.write_file(upload("cat.png", content))
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = f"{sha256[:2]}/{sha256[2:4]}/{sha256}.png"
+        assert stored == (f"/images/{path}", sha256, len(content))
+        assert (media_root / path).read_bytes() == content
+        assert [p.name for p in media_root.iterdir()] == [sha256[:2]]
+
+    async def test_write_file_dedupes_content(self, media_root):
+        first = await file_system.write_file(upload("cat.png", b"cat"))
+        second = await file_system.write_file(upload("dog.PNG", b"cat"))
+        other = await file_system.write_file(upload("cat.png", b"dog"))
+
+        assert first == second
+        assert other.url != first.url
+        assert len(list(media_root.rglob("*.png"))) == 2
+
+    async def test_write_file_too_large(self, media_root, max_upload_size):
+        with pytest.raises(HTTPException) as exc:
+            await file_system.write_file(
+                upload("big.png", b"x" * (max_upload_size + 1))
+            )
+
+        assert exc.value.status_code == 413
+        assert list(media_root.iterdir()) == []
+
+    async def test_upload_too_large(
+        self, async_client, media_root, max_upload_size, author
+    ):
+        response = await async_client.post(
+            "/api/medias",
+            files={"file": ("big.png", b"x" * (max_upload_size + 1))},
+            headers={"api-key": "media"},
+        )
+
+        assert response.status_code == 413
+        assert list(media_root.iterdir()) == []
+
+    async def test_body_rejected_before_parsing(
+        self, async_client, media_root, max_upload_size, author
+    ):
+        limit = max_upload_size + UPLOAD_BODY_OVERHEAD
+        response = await async_client.post(
+            "/api/medias",
+            files={"file": ("big.png", b"x" * limit)},
+            headers={"api-key": "media"},
+        )
+        assert response.status_code == 413
+        assert str(limit) in response.json()["detail"]
+
+        async def chunks():
+            yield b"--b\r\nContent-Disposition: form-data; "
+            yield b'name="file"; filename="big.png"\r\n\r\n'
+            for _ in range(limit // UPLOAD_CHUNK_SIZE + 2):
+                yield b"x" * UPLOAD_CHUNK_SIZE
+
+        # без Content-Length: тело обрывается по мере чтения
+        response = await async_client.post(
+            "/api/medias",
+            content=chunks(),
+            headers={
+                "api-key": "media",
+                "content-type": "multipart/form-data; boundary=b",
+            },
+        )
+        assert response.status_code == 413, response.text
+        assert list(media_root.iterdir()) == []
+
+
+@pytest.mark.media
+class TestUploadDedupe:
+    """Test identical uploads resolve to one media row."""
+
+    async def test_upload_dedupe(self, async_client, media_root, author):
+        async def post():
+            response = await async_client.post(
+                "/api/medias",
+                files={"file": ("cat.png", b"cat")},
+                headers={"api-key": "media"},
+            )
+            assert response.status_code == 201
+            return response.json()["media_id"]
+
+        first = await post()
+        assert await post() == first
+        assert len(list(media_root.rglob("*.png"))) == 1
+
+        async with TestSession() as session:
+            tweet = Tweet(id=601, content="cat", user_id=author)
+            session.add(tweet)
+            await session.flush()
+            media = await session.get(TweetMedia, first)
+            media.tweet_id = tweet.id
+            await session.commit()
+
+        attached_again = await post()
+        assert attached_again != first
+        assert await post() == attached_again
+        assert len(list(media_root.rglob("*.png"))) == 1
+
+    async def test_delete_tweet_with_reuploaded_media(
+        self, async_client, media_root, author
+    ):
+        async def post():
+            response = await async_client.post(
+                "/api/medias",
+                files={"file": ("dog.png", b"dog")},
+                headers={"api-key": "media"},
+            )
+            return response.json()["media_id"]
+
+        attached = await post()
+        async with TestSession() as session:
+            session.add(Tweet(id=602, content="dog", user_id=author))
+            await session.flush()
+            media = await session.get(TweetMedia, attached)
+            media.tweet_id = 602
+            await session.commit()
+        pending = await post()
+
+        response = await async_client.delete(
+            "/api/tweets/602", headers={"api-key": "media"}
+        )
+        assert response.status_code == 200
+        async with TestSession() as session:
+            assert await session.get(TweetMedia, attached) is None
+            assert (await session.get(TweetMedia, pending)).tweet_id is None
+        assert len(list(media_root.rglob("*.png"))) == 1
+
+
+@pytest.mark.media
+class TestImageVariants:
+    """Test downscaled image variants."""
+
+    @pytest.fixture
+    def png(self):
+        pil = pytest.importorskip("PIL.Image")
+        buffer = io.BytesIO()
+        pil.new("RGB", (1000, 500), "red").save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    async def test_make_variants(self, media_root, png):
+        from PIL import Image
+
+        stored = await file_system.write_file(upload("red.png", png))
+        variants = await images.make_variants(stored)
+
+        assert set(variants) == {"thumb", "feed"}
+        for name, url in variants.items():
+            assert url.endswith(f".{name}.webp")
+            path = media_root / url.removeprefix("/images/")
+            with Image.open(path) as image:
+                assert image.format == "WEBP"
+                assert image.width == images.IMAGE_VARIANTS[name]
+
+    async def test_not_an_image(self, media_root):
+        pytest.importorskip("PIL")
+        stored = await file_system.write_file(upload("cat.png", b"cat"))
+
+        assert await images.make_variants(stored) == {}
+
+    def test_missing_pillow_is_reported(self, monkeypatch):
+        messages = []
+        monkeypatch.setattr(images, "Image", None)
+        monkeypatch.setattr(images.logger, "warning", messages.append)
+
+        assert images.check_image_support() is False
+        assert "Pillow is not installed" in messages[0]
+
+        monkeypatch.setattr(get_settings(), "image_workers", 0)
+        assert images.check_image_support() is True
+
+    def test_display_url(self):
+        assert TweetMedia(url="/a.png").display_url == "/a.png"
+        media = TweetMedia(url="/a.png", feed_url="/a.feed.webp")
+        assert media.display_url == "/a.feed.webp"
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from routers.stream import event_stream
+from utils.settings import get_settings
+from utils.stream import Hub, MemoryBroker, PostgresBroker, hub
+
+
+@pytest.mark.stream
+class TestHub:
+    """Test routing of events to subscriptions."""
+
+    @pytest.fixture
+    async def local_hub(self):
+        local = Hub(MemoryBroker(), queue_size=3)
+        await local.start()
+        yield local
+        await local.stop()
+
+    async def test_events_reach_followers_of_author(self, local_hub):
+        reader = local_hub.subscribe(1, {2})
+        stranger = local_hub.subscribe(3, set())
+
+        await local_hub.publish('tweet', 2, tweet_id=10, content='hi')
+        await local_hub.publish('like', 1, tweet_id=11, user_id=3)
+
+        assert await reader.get(0.1) == {
+            'type': 'tweet', 'author_id': 2, 'tweet_id': 10, 'content': 'hi'
+        }
+        assert (await reader.get(0.1))['type'] == 'like'
+        assert await stranger.get(0.01) is None
+
+    async def test_follow_changes_routing(self, local_hub):
+        reader = local_hub.subscribe(1, set())
+
+        await local_hub.publish('follow', 2, user_id=1)
+        await local_hub.publish('tweet', 2, tweet_id=10, content='hi')
+        await local_hub.publish('unfollow', 2, user_id=1)
+        await local_hub.publish('tweet', 2, tweet_id=11, content='bye')
+
+        kinds = [(await reader.get(0.1))['type'] for _ in range(3)]
+        assert kinds == ['follow', 'tweet', 'unfollow']
+        assert await reader.get(0.01) is None
+
+    async def test_slow_subscriber_gets_resync(self, local_hub):
+        reader = local_hub.subscribe(1, set())
+        for idx in range(4):
+            await local_hub.publish('tweet', 1, tweet_id=idx, content='')
+
+        assert await reader.get(0.1) == {'type': 'resync'}
+        assert await reader.get(0.01) is None
+
+    async def test_unsubscribe(self, local_hub):
+        reader = local_hub.subscribe(1, {2})
+        assert len(local_hub) == 1
+
+        local_hub.unsubscribe(reader)
+        await local_hub.publish('tweet', 2, tweet_id=10, content='hi')
+
+        assert len(local_hub) == 0
+        assert await reader.get(0.01) is None
+
+    async def test_event_stream(self):
+        await hub.start()
+        try:
+            stream = event_stream(hub.subscribe(1, set()), keepalive=0.01)
+            assert await anext(stream) == ': connected\n\n'
+            assert await anext(stream) == ': ping\n\n'
+
+            await hub.publish('tweet_deleted', 1, tweet_id=10)
+            chunk = await anext(stream)
+
+            event, data = chunk.strip().split('\n')
+            assert event == 'event: tweet_deleted'
+            assert json.loads(data.removeprefix('data: '))['tweet_id'] == 10
+            await stream.aclose()
+            assert len(hub) == 0
+        finally:
+            await hub.stop()
+
+
+@pytest.mark.stream
+class TestPostgresBroker:
+    """Test events shared between hubs through LISTEN/NOTIFY."""
+
+    async def test_event_crosses_hubs(self):
+        url = get_settings().test_db
+        publisher = Hub(PostgresBroker.from_url(url))
+        listener = Hub(PostgresBroker.from_url(url))
+        await publisher.start()
+        await listener.start()
+        try:
+            reader = listener.subscribe(1, {2})
+            await publisher.publish('tweet', 2, tweet_id=10, content='hi')
+
+            event = await reader.get(5)
+            assert event['tweet_id'] == 10
+        finally:
+            await publisher.stop()
+            await listener.stop()
@@ -1,7 +1,20 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
 import pytest
-from sqlalchemy import select
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from database import models
+from schemas.tweet_schema import TweetIn, TweetsOut
+from tests.conftest import TestSession
+from utils import batching
+from utils.batching import LikeBatcher, like_batcher
+from utils.service import Dal
+from utils.settings import get_settings
+from utils.stream import hub
 
 
 @pytest.mark.tweets
@@ -45,7 +58,7 @@ class TestTweets:
         assert response.json() == {"result": True, "tweet_id": 2}
 
     async def test_add_like_to_tweet(
-            self, tweetDB_us1, async_client, async_session, user_1
+            self, tweetDB_us1, async_client, async_session, user_1, statements
     ):
         """Test like can be added to tweet."""
         assert tweetDB_us1.author == user_1
@@ -55,12 +68,67 @@ class TestTweets:
             headers={"api-key": f"{user_1.api_key}"}
         )
         assert response.status_code == 201
+        # api-key -> user, like + like_count in one statement
+        assert len(statements) == 2
         await async_session.refresh(tweetDB_us1)
 
         assert len(tweetDB_us1.likes) == 1
+        assert tweetDB_us1.like_count == 1
+
+    async def test_like_is_idempotent(self, tweetDB_us1, async_client):
+        """Test repeated like keeps one like and a correct counter."""
+        response = await async_client.post(
+            f'api/tweets/{tweetDB_us1.id}/likes'
+        )
+        assert response.status_code == 201
+
+        response = await async_client.get('/api/tweets/')
+        liked = next(
+            t for t in response.json()["tweets"] if t["id"] == tweetDB_us1.id
+        )
+        assert liked["like_count"] == 1
+        assert len(liked["likes"]) == 1
+
+    async def test_like_missing_tweet(self, async_client):
+        """Test like and unlike of unknown tweet return 404."""
+        response = await async_client.post('api/tweets/100500/likes')
+        assert response.status_code == 404
+
+        response = await async_client.delete('api/tweets/100500/likes')
+        assert response.status_code == 404
+
+    async def test_get_likes_summary_and_list(
+            self, tweetDB_us1, async_client, user_1
+    ):
+        """Test timeline likes summary and paginated likers list."""
+        response = await async_client.get(
+            '/api/tweets/', params={"likes": "summary"}
+        )
+
+        assert response.status_code == 200
+        liked = next(
+            t for t in response.json()["tweets"] if t["id"] == tweetDB_us1.id
+        )
+        assert liked["like_count"] == 1
+        assert liked["liked"] is True
+        assert liked["likes"] == [{"user_id": 1, "username": "test"}]
+
+        response = await async_client.get(
+            f'/api/tweets/{tweetDB_us1.id}/likes', params={"limit": 1}
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "result": True,
+            "likes": [{"id": 1, "name": "test"}],
+            "next_cursor": None,
+        }
+
+        response = await async_client.get('/api/tweets/100500/likes')
+        assert response.status_code == 404
 
     async def test_delete_like(
-            self, tweetDB_us1, async_client, async_session, user_1
+            self, tweetDB_us1, async_client, async_session, user_1, statements
     ):
         """Test tweet like can be deleted."""
         assert tweetDB_us1.author == user_1
@@ -71,8 +139,11 @@ class TestTweets:
         )
 
         assert response.status_code == 200
+        # api-key -> user, like + like_count in one statement
+        assert len(statements) == 2
         await async_session.refresh(tweetDB_us1)
         assert len(tweetDB_us1.likes) == 0
+        assert tweetDB_us1.like_count == 0
 
     async def test_delete_tweet_by_another_user(
             self, tweetDB_us1, async_client, async_session, user_1, user_2
@@ -87,7 +158,7 @@ class TestTweets:
         )
 
         assert response.status_code == 403
-        await async_session.refresh(user_1)
+        await async_session.refresh(user_1, ['tweets'])
 
         assert len(user_1.tweets) == 2
 
@@ -104,7 +175,7 @@ class TestTweets:
         )
 
         assert response.status_code == 200
-        await async_session.refresh(user_1)
+        await async_session.refresh(user_1, ['tweets'])
 
         assert len(user_1.tweets) == 1
 
@@ -122,3 +193,1074 @@ class TestTweets:
         # который вернет "Could not validate credentials" и код 401
         assert response.status_code == 401
         assert response.json() == {'detail': "Could not validate credentials"}
+
+    async def test_get_tweets_paginated(self, tweet, async_client):
+        """Test timeline is paged by cursor without gaps and duplicates."""
+        for _ in range(4):
+            await async_client.post('/api/tweets/', content=tweet)
+
+        seen, cursor = [], None
+        for expected_size in (2, 2, 1):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = await async_client.get('/api/tweets/', params=params)
+
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page["tweets"]) == expected_size
+            seen += [t["id"] for t in page["tweets"]]
+            cursor = page["next_cursor"]
+
+        assert cursor is None
+        assert seen == sorted(set(seen), reverse=True)
+
+    async def test_get_tweets_invalid_cursor(self, async_client):
+        """Test broken cursor is rejected."""
+        response = await async_client.get(
+            '/api/tweets/', params={"cursor": "not a cursor"}
+        )
+
+        assert response.status_code == 422
+
+
+@pytest.mark.tweets
+class TestFanOutTimeline:
+    """Test precomputed (fan-out-on-write) home timelines."""
+
+    @pytest.fixture(autouse=True, scope='class')
+    async def setup(self):
+        """Setup test: reader, regular author and popular author."""
+        users = [
+            models.User(id=101, name='reader', api_key='reader'),
+            models.User(id=102, name='author', api_key='author'),
+            models.User(id=103, name='star', api_key='star'),
+        ]
+        async with TestSession() as session:
+            session.add_all(users)
+            await session.commit()
+            yield
+            await session.execute(
+                delete(models.Tweet).where(models.Tweet.user_id >= 101)
+            )
+            await session.execute(
+                delete(models.user_to_user).where(
+                    models.user_to_user.c.followers_id >= 101
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id >= 101)
+            )
+            await session.commit()
+
+    @pytest.fixture(autouse=True)
+    def fanout(self, monkeypatch):
+        s = get_settings()
+        monkeypatch.setattr(s, 'fanout_on_write', True)
+        monkeypatch.setattr(s, 'fanout_max_followers', 1)
+
+    @staticmethod
+    async def timeline(async_client):
+        response = await async_client.get(
+            '/api/tweets/', headers={"api-key": "reader"}
+        )
+        assert response.status_code == 200
+        return [t["content"] for t in response.json()["tweets"]]
+
+    @staticmethod
+    async def post(async_client, api_key, text):
+        response = await async_client.post(
+            '/api/tweets/',
+            json={"tweet_data": text, "tweet_media_ids": []},
+            headers={"api-key": api_key},
+        )
+        return response.json()["tweet_id"]
+
+    async def test_tweet_is_fanned_out_to_followers(self, async_client):
+        for idx in (102, 103):
+            await async_client.post(
+                f'/api/users/{idx}/follow', headers={"api-key": "reader"}
+            )
+        await async_client.post(
+            '/api/users/103/follow', headers={"api-key": "author"}
+        )
+
+        await self.post(async_client, 'reader', 'own')
+        await self.post(async_client, 'author', 'fanned out')
+        # у автора `star` больше подписчиков, чем порог - подмешивается
+        merged = await self.post(async_client, 'star', 'merged')
+
+        assert await self.timeline(async_client) == [
+            'merged', 'fanned out', 'own'
+        ]
+        async with TestSession() as session:
+            recipients = await session.scalars(
+                select(models.home_timeline.c.user_id).where(
+                    models.home_timeline.c.tweet_id == merged
+                )
+            )
+            assert recipients.all() == [103]
+
+    async def test_unfollow_trims_and_follow_backfills(self, async_client):
+        await async_client.delete(
+            '/api/users/102/follow', headers={"api-key": "reader"}
+        )
+        assert 'fanned out' not in await self.timeline(async_client)
+
+        await async_client.post(
+            '/api/users/102/follow', headers={"api-key": "reader"}
+        )
+        assert 'fanned out' in await self.timeline(async_client)
+
+    async def test_deleted_tweet_leaves_timelines(self, async_client):
+        idx = await self.post(async_client, 'author', 'to be deleted')
+        assert 'to be deleted' in await self.timeline(async_client)
+
+        await async_client.delete(
+            f'/api/tweets/{idx}', headers={"api-key": "author"}
+        )
+        assert 'to be deleted' not in await self.timeline(async_client)
+
+    async def test_pages_merge_without_duplicates(
+        self, async_client, monkeypatch
+    ):
+        # твит `star`, разложенный по лентам, пока автор не был популярным
+        monkeypatch.setattr(get_settings(), 'fanout_max_followers', 10)
+        await self.post(async_client, 'star', 'early')
+        monkeypatch.setattr(get_settings(), 'fanout_max_followers', 1)
+
+        contents, cursor = [], None
+        while True:
+            params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+            response = await async_client.get(
+                '/api/tweets/', params=params, headers={"api-key": "reader"}
+            )
+            page = response.json()
+            contents += [t["content"] for t in page["tweets"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert contents == ['early', 'merged', 'fanned out', 'own']
+
+
+@pytest.mark.tweets
+class TestConcurrentLikes:
+    """Test likes fired in parallel at one tweet."""
+
+    users = range(201, 501)
+
+    @pytest.fixture(scope='class')
+    async def tweet_id(self):
+        """Setup test: 300 users and one tweet to like."""
+        async with TestSession() as session:
+            await session.execute(
+                insert(models.User),
+                [dict(id=i, name=f'fan{i}', api_key=f'fan{i}') for i in self.users],
+            )
+            tweet = models.Tweet(content='viral', user_id=201)
+            session.add(tweet)
+            await session.commit()
+            yield tweet.id
+            await session.execute(
+                delete(models.TweetLike).where(
+                    models.TweetLike.tweet_id == tweet.id
+                )
+            )
+            await session.execute(
+                delete(models.Tweet).where(models.Tweet.id == tweet.id)
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_(self.users))
+            )
+            await session.commit()
+
+    @pytest.fixture
+    async def pooled_session(self):
+        """Sessions over a bounded pool, so hundreds of likes queue on it."""
+        engine = create_async_engine(
+            get_settings().test_db, pool_size=20, max_overflow=0
+        )
+        yield async_sessionmaker(engine, expire_on_commit=False)
+        await engine.dispose()
+
+    async def like_count(self, tweet_id):
+        async with TestSession() as session:
+            tweet = await session.get(models.Tweet, tweet_id)
+            likes = await session.scalar(
+                select(func.count()).where(
+                    models.TweetLike.tweet_id == tweet_id
+                )
+            )
+        return tweet.like_count, likes
+
+    async def test_parallel_likes_from_many_users(
+            self, tweet_id, pooled_session
+    ):
+        async def like(user_id):
+            async with pooled_session() as session:
+                await Dal(session).add_like_to_tweet(tweet_id, user_id)
+
+        await asyncio.gather(*(like(i) for i in self.users))
+
+        assert await self.like_count(tweet_id) == (300, 300)
+
+    async def test_parallel_unlikes_and_repeated_likes(
+            self, tweet_id, pooled_session
+    ):
+        async def unlike(user_id):
+            async with pooled_session() as session:
+                await Dal(session).remove_like_from_tweet(tweet_id, user_id)
+
+        async def like(user_id):
+            async with pooled_session() as session:
+                await Dal(session).add_like_to_tweet(tweet_id, user_id)
+
+        await asyncio.gather(
+            *(unlike(i) for i in self.users if i % 2),
+            *(like(202) for _ in range(100)),
+        )
+
+        assert await self.like_count(tweet_id) == (150, 150)
+
+
+@pytest.mark.tweets
+class TestLikesSQLite:
+    """Test like/unlike fallback for dialects without DML in CTE."""
+
+    @pytest.fixture
+    async def sqlite_session(self):
+        pytest.importorskip('aiosqlite')
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+            s.add(models.User(id=1, name='test', api_key='test'))
+            s.add(models.Tweet(id=1, content='sqlite', user_id=1))
+            await s.commit()
+            yield s
+        await engine.dispose()
+
+    async def test_like_and_unlike(self, sqlite_session):
+        dal = Dal(sqlite_session)
+        for _ in range(2):
+            await dal.add_like_to_tweet(1, 1)
+        tweet = await sqlite_session.get(models.Tweet, 1)
+        await sqlite_session.refresh(tweet)
+        assert tweet.like_count == 1
+
+        for _ in range(2):
+            await dal.remove_like_from_tweet(1, 1)
+        await sqlite_session.refresh(tweet)
+        assert tweet.like_count == 0
+
+        with pytest.raises(HTTPException) as e:
+            await dal.add_like_to_tweet(100500, 1)
+        assert e.value.status_code == 404
+
+    async def test_like_batch(self, sqlite_session):
+        dal = Dal(sqlite_session)
+        missing = await dal.apply_like_batch(
+            {(1, 1): True, (100500, 1): True}
+        )
+        assert missing == {100500}
+        await dal.apply_like_batch({(1, 1): False})
+        tweet = await sqlite_session.get(models.Tweet, 1)
+        await sqlite_session.refresh(tweet)
+        assert tweet.like_count == 0
+
+    async def test_likes_summary(self, sqlite_session):
+        sqlite_session.add_all(
+            models.User(id=idx, name=f'u{idx}', api_key=f'u{idx}')
+            for idx in (2, 3)
+        )
+        sqlite_session.add(models.Tweet(id=2, content='quiet', user_id=1))
+        await sqlite_session.flush()
+        await sqlite_session.execute(
+            insert(models.TweetLike),
+            [dict(tweet_id=1, user_id=idx) for idx in (1, 2, 3)],
+        )
+
+        summary = await Dal(sqlite_session).get_likes_summary([1, 2], 3, 2)
+        # свой лайк вне выборки все равно отмечается
+        assert summary[1].liked is True
+        assert [u['id'] for u in summary[1].sample] == [1, 2]
+        assert summary[2] == (False, [])
+
+
+@pytest.mark.tweets
+class TestLikesSummary:
+    """Test the bounded likers sample of the timeline summary."""
+
+    users = (1301, 1302, 1303)
+
+    @pytest.fixture(scope='class')
+    async def tweets(self):
+        """Setup test: one tweet liked by everyone, one without likes."""
+        async with TestSession() as session:
+            session.add_all(
+                models.User(id=idx, name=f'u{idx}', api_key=f'sum{idx}')
+                for idx in self.users
+            )
+            await session.flush()
+            await session.execute(
+                insert(models.Tweet),
+                [
+                    dict(id=13001, content='liked', user_id=1301),
+                    dict(id=13002, content='quiet', user_id=1301),
+                ],
+            )
+            await session.execute(
+                insert(models.TweetLike),
+                [dict(tweet_id=13001, user_id=idx) for idx in self.users],
+            )
+            await session.commit()
+            yield
+            for model, column in (
+                (models.TweetLike, models.TweetLike.tweet_id),
+                (models.Tweet, models.Tweet.id),
+            ):
+                await session.execute(
+                    delete(model).where(column.in_([13001, 13002]))
+                )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_(self.users))
+            )
+            await session.commit()
+
+    async def test_sample_and_liked(self, tweets):
+        async with TestSession() as session:
+            summary = await Dal(session).get_likes_summary(
+                [13001, 13002], 1303, 2
+            )
+
+        assert summary[13001].liked is True
+        assert [u['id'] for u in summary[13001].sample] == [1301, 1302]
+        assert summary[13002] == (False, [])
+
+
+@pytest.mark.tweets
+class TestTimelineSQLite:
+    """Test keyset pagination over SQLite text timestamps."""
+
+    @pytest.fixture
+    async def sqlite_session(self):
+        pytest.importorskip('aiosqlite')
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        async with async_sessionmaker(engine, expire_on_commit=False)() as s:
+            s.add(models.User(id=1, name='test', api_key='test'))
+            # CURRENT_TIMESTAMP без долей секунды и даты из Python с ними
+            s.add_all(
+                models.Tweet(id=i, content=f'{i}', user_id=1)
+                for i in range(1, 6)
+            )
+            await s.flush()
+            second = (await s.get(models.Tweet, 1)).created_at
+            s.add_all(
+                [
+                    models.Tweet(
+                        id=6, content='6', user_id=1, created_at=second
+                    ),
+                    models.Tweet(
+                        id=7,
+                        content='7',
+                        user_id=1,
+                        created_at=second.replace(microsecond=500),
+                    ),
+                ]
+            )
+            await s.commit()
+            yield s
+        await engine.dispose()
+
+    async def test_pages_do_not_repeat(self, sqlite_session):
+        dal = Dal(sqlite_session)
+        seen, cursor = [], None
+        for _ in range(10):
+            page = await dal.get_timeline_rows(1, limit=2, cursor=cursor)
+            seen += [row.id for row in page.items]
+            if not (cursor := page.next_cursor):
+                break
+
+        assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+
+@pytest.mark.tweets
+class TestLikeBatcher:
+    """Test likes written in micro-batches."""
+
+    users = [1101, 1102, 1103]
+
+    @pytest.fixture(scope='class')
+    async def tweets(self):
+        """Setup test: three fans and two tweets of the first one."""
+        async with TestSession() as session:
+            session.add_all(
+                models.User(id=i, name=f'batch{i}', api_key=f'batch{i}')
+                for i in self.users
+            )
+            await session.flush()
+            session.add_all(
+                [
+                    models.Tweet(id=11001, content='first', user_id=1101),
+                    models.Tweet(id=11002, content='second', user_id=1101),
+                ]
+            )
+            await session.commit()
+            yield [11001, 11002]
+            await session.execute(
+                delete(models.TweetLike).where(
+                    models.TweetLike.user_id.in_(self.users)
+                )
+            )
+            await session.execute(
+                delete(models.Tweet).where(models.Tweet.user_id == 1101)
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_(self.users))
+            )
+            await session.commit()
+
+    @pytest.fixture
+    async def batcher(self):
+        batcher = LikeBatcher(TestSession, max_delay=0.05)
+        await batcher.start()
+        yield batcher
+        await batcher.stop()
+
+    async def likes(self, tweet_id):
+        async with TestSession() as session:
+            tweet = await session.get(models.Tweet, tweet_id)
+            likers = await session.scalars(
+                select(models.TweetLike.user_id)
+                .where(models.TweetLike.tweet_id == tweet_id)
+                .order_by(models.TweetLike.user_id)
+            )
+            return tweet.like_count, list(likers)
+
+    @staticmethod
+    def flushed():
+        """Flushed batches and intents in them, from the metric."""
+        counts, total = batching.batch_size.values.get((), ([0], [0]))
+        return sum(counts), total[0]
+
+    async def test_one_batch_for_parallel_likes(self, tweets, batcher):
+        before = self.flushed()
+        await asyncio.gather(
+            *(batcher.submit(11001, user, like=True) for user in self.users),
+            batcher.submit(11002, 1102, like=True),
+            batcher.submit(11002, 1102, like=False),
+            batcher.submit(11002, 1103, like=True),
+        )
+        batches, intents = self.flushed()
+        assert (batches - before[0], intents - before[1]) == (1, 6)
+        assert await self.likes(11001) == (3, self.users)
+        assert await self.likes(11002) == (1, [1103])
+
+        await asyncio.gather(
+            batcher.submit(11001, 1101, like=False),
+            batcher.submit(11001, 1101, like=False),
+            batcher.submit(11002, 1103, like=True),
+        )
+        assert await self.likes(11001) == (2, [1102, 1103])
+        assert await self.likes(11002) == (1, [1103])
+
+    async def test_missing_tweet_fails_only_its_request(
+        self, tweets, batcher
+    ):
+        results = await asyncio.gather(
+            batcher.submit(100500, 1101, like=True),
+            batcher.submit(11002, 1101, like=True),
+            return_exceptions=True,
+        )
+        assert isinstance(results[0], HTTPException)
+        assert results[0].status_code == 404
+        assert results[1] is None
+        assert await self.likes(11002) == (2, [1101, 1103])
+
+    async def test_full_queue_is_rejected(self, tweets):
+        gate = asyncio.Event()
+
+        @asynccontextmanager
+        async def slow_session():
+            await gate.wait()
+            async with TestSession() as session:
+                yield session
+
+        batcher = LikeBatcher(
+            slow_session, max_delay=0, queue_size=1, put_timeout=0.05
+        )
+        await batcher.start()
+        # первый пакет ждет сессию, второе намерение занимает очередь
+        pending = [
+            asyncio.create_task(batcher.submit(11001, 1101, like=True)),
+            asyncio.create_task(batcher.submit(11002, 1102, like=True)),
+        ]
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as e:
+            await batcher.submit(11001, 1102, like=False)
+        assert e.value.status_code == 503
+
+        gate.set()
+        await batcher.stop()
+        assert all(task.done() for task in pending)
+        assert (await self.likes(11001))[1] == self.users
+        assert (await self.likes(11002))[1] == [1101, 1102, 1103]
+
+    async def test_api_uses_batcher(self, tweets, async_client, monkeypatch):
+        monkeypatch.setattr(get_settings(), 'like_batching', True)
+        monkeypatch.setattr(like_batcher, 'sessionmaker', TestSession)
+        await like_batcher.start()
+        try:
+            headers = {'api-key': 'batch1101'}
+            response = await async_client.delete(
+                '/api/tweets/11001/likes', headers=headers
+            )
+            assert response.status_code == 200
+            response = await async_client.post(
+                '/api/tweets/100500/likes', headers=headers
+            )
+            assert response.status_code == 404
+        finally:
+            await like_batcher.stop()
+        assert await self.likes(11001) == (2, [1102, 1103])
+
+    async def test_not_started(self, tweets, async_client, monkeypatch):
+        await batching.start_like_batcher()
+        assert not like_batcher.running
+        with pytest.raises(RuntimeError):
+            await like_batcher.submit(11002, 1101, like=False)
+
+        # включенный без запуска батчер не ломает лайки - пишем напрямую
+        monkeypatch.setattr(get_settings(), 'like_batching', True)
+        response = await async_client.delete(
+            '/api/tweets/11002/likes', headers={'api-key': 'batch1101'}
+        )
+        assert response.status_code == 200
+        assert await self.likes(11002) == (2, [1102, 1103])
+
+
+@pytest.mark.tweets
+class TestSearch:
+    """Test full-text tweet search."""
+
+    contents = {
+        3001: 'red apple pie',
+        3002: 'apple apple apple',
+        3003: 'green pear',
+    }
+
+    @pytest.fixture(scope='class')
+    async def tweets(self):
+        """Setup test: one author with a few tweets."""
+        async with TestSession() as session:
+            session.add(models.User(id=301, name='cook', api_key='cook'))
+            await session.flush()
+            await session.execute(
+                insert(models.Tweet),
+                [
+                    dict(id=idx, content=content, user_id=301)
+                    for idx, content in self.contents.items()
+                ],
+            )
+            await session.commit()
+            yield
+            await session.execute(
+                delete(models.Tweet).where(models.Tweet.user_id == 301)
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id == 301)
+            )
+            await session.commit()
+
+    async def search(self, async_client, **params):
+        response = await async_client.get(
+            '/api/tweets/search', params=params, headers={"api-key": "cook"}
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    async def test_search_ranked_and_paginated(self, async_client, tweets):
+        page = await self.search(async_client, q='apple', limit=1)
+        assert [t['content'] for t in page['tweets']] == ['apple apple apple']
+
+        page = await self.search(
+            async_client, q='apple', limit=1, cursor=page['next_cursor']
+        )
+        assert [t['content'] for t in page['tweets']] == ['red apple pie']
+        assert page['next_cursor'] is None
+
+        page = await self.search(async_client, q='apple pie', likes='summary')
+        assert [t['id'] for t in page['tweets']] == [3001]
+        assert page['tweets'][0]['like_count'] == 0
+
+        assert (await self.search(async_client, q='plum'))['tweets'] == []
+
+    async def test_search_sqlite(self):
+        pytest.importorskip('aiosqlite')
+        from utils.search import tweet_index
+
+        engine = create_async_engine('sqlite+aiosqlite://')
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(engine)() as session:
+                session.add(models.User(id=1, name='cook', api_key='cook'))
+                session.add_all(
+                    models.Tweet(id=idx, content=content, user_id=1)
+                    for idx, content in self.contents.items()
+                )
+                await session.commit()
+                dal = Dal(session)
+
+                page = await dal.search_tweets('apple', limit=1)
+                assert [t.id for t in page.items] == [3002]
+                page = await dal.search_tweets(
+                    'apple', limit=1, cursor=page.next_cursor
+                )
+                assert [t.id for t in page.items] == [3001]
+                assert page.next_cursor is None
+
+                session.add(models.Tweet(id=3004, content='pear', user_id=1))
+                await session.commit()
+                page = await dal.search_tweets('PEAR', limit=10)
+                assert [t.id for t in page.items] == [3004, 3003]
+
+                # твиты из API пишутся мимо ORM, но попадают в индекс
+                tweet_id = await dal.add_tweet(
+                    TweetIn(tweet_data='pear tart', tweet_media_ids=[]), 1
+                )
+                page = await dal.search_tweets('tart', limit=10)
+                assert [t.id for t in page.items] == [tweet_id]
+        finally:
+            tweet_index.clear()
+            await engine.dispose()
+
+
+@pytest.mark.tweets
+class TestTimelineSerialization:
+    """Test the column-based timeline matches the pydantic one."""
+
+    @pytest.fixture(scope='class')
+    async def reader(self):
+        """Setup test: two users, liked tweets with media."""
+        async with TestSession() as session:
+            session.add_all(
+                [
+                    models.User(id=401, name='reader', api_key='reader401'),
+                    models.User(id=402, name='writer', api_key='writer402'),
+                ]
+            )
+            await session.flush()
+            await session.execute(
+                insert(models.user_to_user),
+                [dict(followers_id=401, following_id=402)],
+            )
+            await session.execute(
+                insert(models.Tweet),
+                [
+                    dict(id=4001, content='first', user_id=402),
+                    dict(id=4002, content='second', user_id=401),
+                ],
+            )
+            await session.execute(
+                insert(models.TweetMedia),
+                [dict(url='/images/a.png', feed_url='/images/a.webp',
+                      tweet_id=4001)],
+            )
+            await session.execute(
+                insert(models.TweetLike),
+                [dict(tweet_id=4001, user_id=401),
+                 dict(tweet_id=4001, user_id=402)],
+            )
+            await session.commit()
+            yield 401
+            for model, column in (
+                (models.TweetLike, models.TweetLike.tweet_id),
+                (models.TweetMedia, models.TweetMedia.tweet_id),
+                (models.Tweet, models.Tweet.id),
+            ):
+                await session.execute(
+                    delete(model).where(column.in_([4001, 4002]))
+                )
+            await session.execute(
+                delete(models.user_to_user).where(
+                    models.user_to_user.c.followers_id == 401
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_([401, 402]))
+            )
+            await session.commit()
+
+    @pytest.mark.parametrize('likes', ['full', 'summary'])
+    async def test_same_json(self, reader, async_client, likes):
+        # эталон - ORM-сущности, сериализованные pydantic-схемой
+        async with TestSession() as session:
+            orm_tweets = await session.scalars(
+                select(models.Tweet)
+                .where(models.Tweet.id.in_([4001, 4002]))
+                .options(*Dal._tweet_options(likes == 'full'))
+                .order_by(models.Tweet.id.desc())
+            )
+            tweets = orm_tweets.all()
+            summary = await Dal(session).get_likes_summary(
+                [t.id for t in tweets], reader, 3
+            )
+        if likes == 'summary':
+            tweets = [
+                dict(
+                    id=t.id, content=t.content, author=t.author,
+                    attachments=[m.display_url for m in t.tweet_media_ids],
+                    like_count=t.like_count,
+                    liked=summary[t.id].liked, likes=summary[t.id].sample,
+                )
+                for t in tweets
+            ]
+        expected = json.loads(
+            TweetsOut(tweets=tweets, next_cursor=None).json(by_alias=True)
+        )
+
+        response = await async_client.get(
+            '/api/tweets/',
+            params={'limit': 2, 'likes': likes},
+            headers={'api-key': 'reader401'},
+        )
+
+        def by_liker(page):
+            for t in page['tweets']:
+                t['likes'].sort(key=lambda like: like['user_id'])
+            return page
+
+        assert by_liker(response.json()) == by_liker(expected)
+        assert [t['id'] for t in expected['tweets']] == [4002, 4001]
+        assert expected['tweets'][1]['attachments'] == ['/images/a.webp']
+        assert len(expected['tweets'][1]['likes']) == 2
+
+
+@pytest.mark.tweets
+class TestConditionalRequests:
+    """Test ETag / If-None-Match on the timeline and profiles."""
+
+    @pytest.fixture(scope='class')
+    async def reader(self):
+        """Setup test: reader follows writer, one tweet each."""
+        async with TestSession() as session:
+            session.add_all(
+                [
+                    models.User(id=801, name='etag_reader', api_key='etag801'),
+                    models.User(id=802, name='etag_writer', api_key='etag802'),
+                ]
+            )
+            await session.flush()
+            await session.execute(
+                insert(models.user_to_user),
+                [dict(followers_id=801, following_id=802)],
+            )
+            await session.execute(
+                insert(models.Tweet),
+                [
+                    dict(id=8001, content='mine', user_id=801),
+                    dict(id=8002, content='theirs', user_id=802),
+                ],
+            )
+            await session.commit()
+            yield 'etag801'
+            await session.execute(
+                delete(models.TweetLike).where(
+                    models.TweetLike.tweet_id.in_([8001, 8002])
+                )
+            )
+            await session.execute(
+                delete(models.Tweet).where(models.Tweet.id.in_([8001, 8002]))
+            )
+            await session.execute(
+                delete(models.user_to_user).where(
+                    models.user_to_user.c.followers_id.in_([801, 802])
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_([801, 802]))
+            )
+            await session.commit()
+
+    async def _etag(self, async_client, url, api_key, etag=None):
+        headers = {'api-key': api_key}
+        if etag:
+            headers['If-None-Match'] = etag
+        return await async_client.get(url, headers=headers)
+
+    async def test_timeline_not_modified(
+        self, reader, async_client, statements
+    ):
+        first = await self._etag(async_client, '/api/tweets/', reader)
+        assert first.status_code == 200
+        assert first.headers['cache-control'] == 'private, no-cache'
+        etag = first.headers['etag']
+
+        statements.clear()
+        second = await self._etag(async_client, '/api/tweets/', reader, etag)
+
+        assert second.status_code == 304
+        assert second.content == b''
+        assert second.headers['etag'] == etag
+        assert not any('FROM tweets' in s for s in statements)
+
+    async def test_timeline_etag_depends_on_query(self, reader, async_client):
+        full = await self._etag(async_client, '/api/tweets/', reader)
+        summary = await self._etag(
+            async_client, '/api/tweets/?likes=summary', reader,
+            full.headers['etag'],
+        )
+
+        assert summary.status_code == 200
+        assert summary.headers['etag'] != full.headers['etag']
+
+    async def test_like_by_other_user_changes_timeline(
+        self, reader, async_client
+    ):
+        before = await self._etag(async_client, '/api/tweets/', reader)
+        like = await async_client.post(
+            '/api/tweets/8002/likes', headers={'api-key': 'etag802'}
+        )
+        assert like.status_code == 201
+
+        after = await self._etag(
+            async_client, '/api/tweets/', reader, before.headers['etag']
+        )
+
+        assert after.status_code == 200
+        tweets = {t['id']: t for t in after.json()['tweets']}
+        assert tweets[8002]['likes'] == [
+            {'user_id': 802, 'username': 'etag_writer'}
+        ]
+
+    async def test_follow_changes_profiles(self, reader, async_client):
+        me = await self._etag(async_client, '/api/users/me', reader)
+        other = await self._etag(async_client, '/api/users/802', reader)
+        assert me.status_code == other.status_code == 200
+        cached = await self._etag(
+            async_client, '/api/users/802', reader, other.headers['etag']
+        )
+        assert cached.status_code == 304
+
+        unfollow = await async_client.delete(
+            '/api/users/802/follow', headers={'api-key': reader}
+        )
+        assert unfollow.status_code == 200
+
+        pairs = (('/api/users/me', me), ('/api/users/802', other))
+        for url, response in pairs:
+            fresh = await self._etag(
+                async_client, url, reader, response.headers['etag']
+            )
+            assert fresh.status_code == 200
+            assert fresh.headers['etag'] != response.headers['etag']
+
+        timeline = await self._etag(async_client, '/api/tweets/', reader)
+        assert [t['id'] for t in timeline.json()['tweets']] == [8001]
+
+    async def test_unknown_profile_is_not_cached(self, reader, async_client):
+        response = await self._etag(async_client, '/api/users/899', reader)
+
+        assert response.status_code == 404
+        assert 'etag' not in response.headers
+
+
+@pytest.mark.tweets
+class TestTimelineEvents:
+    """Test committed changes are published to followers."""
+
+    @pytest.fixture(scope='class')
+    async def reader(self):
+        """Setup test: reader follows writer, started hub."""
+        async with TestSession() as session:
+            session.add_all(
+                [
+                    models.User(id=901, name='push_reader', api_key='push901'),
+                    models.User(id=902, name='push_writer', api_key='push902'),
+                ]
+            )
+            await session.flush()
+            await session.execute(
+                insert(models.user_to_user),
+                [dict(followers_id=901, following_id=902)],
+            )
+            await session.commit()
+            await hub.start()
+            yield 901
+            await hub.stop()
+            await session.execute(
+                delete(models.TweetLike).where(models.TweetLike.user_id == 901)
+            )
+            await session.execute(
+                delete(models.Tweet).where(models.Tweet.user_id == 902)
+            )
+            await session.execute(
+                delete(models.user_to_user).where(
+                    models.user_to_user.c.followers_id == 901
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_([901, 902]))
+            )
+            await session.commit()
+
+    async def test_tweet_like_delete_are_pushed(self, reader, async_client):
+        subscription = hub.subscribe(reader, {902})
+        try:
+            writer = {'api-key': 'push902'}
+            posted = await async_client.post(
+                '/api/tweets/', json={'tweet_data': 'pushed'}, headers=writer
+            )
+            tweet_id = posted.json()['tweet_id']
+            for _ in range(2):
+                await async_client.post(
+                    f'/api/tweets/{tweet_id}/likes',
+                    headers={'api-key': 'push901'},
+                )
+            await async_client.delete(
+                f'/api/tweets/{tweet_id}', headers=writer
+            )
+
+            events = [await subscription.get(1) for _ in range(3)]
+            assert [e['type'] for e in events] == [
+                'tweet', 'like', 'tweet_deleted'
+            ]
+            assert events[0]['content'] == 'pushed'
+            assert events[1] == {
+                'type': 'like', 'author_id': 902,
+                'tweet_id': tweet_id, 'user_id': 901,
+            }
+            assert await subscription.get(0.01) is None
+        finally:
+            hub.unsubscribe(subscription)
+
+
+@pytest.mark.tweets
+class TestTweetBatch:
+    """Test tweets are created in one transaction with their media."""
+
+    users = [1201, 1202]
+    media = [12001, 12002, 12003]
+
+    @pytest.fixture(scope='class')
+    async def author(self):
+        """Setup test: author with three unattached uploads and a stranger."""
+        async with TestSession() as session:
+            session.add_all(
+                models.User(id=i, name=f'bot{i}', api_key=f'bot{i}')
+                for i in self.users
+            )
+            await session.flush()
+            session.add_all(
+                models.TweetMedia(id=i, url=f'/img/{i}.png', uploader_id=1201)
+                for i in self.media
+            )
+            await session.commit()
+            yield {'api-key': 'bot1201'}
+            await session.execute(
+                delete(models.TweetMedia).where(
+                    models.TweetMedia.id.in_(self.media)
+                )
+            )
+            await session.execute(
+                delete(models.Tweet).where(
+                    models.Tweet.user_id.in_(self.users)
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.in_(self.users))
+            )
+            await session.commit()
+
+    async def attached(self):
+        async with TestSession() as session:
+            rows = await session.execute(
+                select(models.TweetMedia.id, models.TweetMedia.tweet_id)
+                .where(models.TweetMedia.id.in_(self.media))
+                .order_by(models.TweetMedia.id)
+            )
+            return dict(rows.all())
+
+    async def tweet_count(self):
+        async with TestSession() as session:
+            return await session.scalar(
+                select(func.count()).where(
+                    models.Tweet.user_id.in_(self.users)
+                )
+            )
+
+    async def test_stranger_cannot_attach_media(self, author, async_client):
+        response = await async_client.post(
+            '/api/tweets/',
+            json={'tweet_data': 'mine', 'tweet_media_ids': [12001]},
+            headers={'api-key': 'bot1202'},
+        )
+
+        assert response.status_code == 400
+        assert await self.tweet_count() == 0
+        assert set((await self.attached()).values()) == {None}
+
+    async def test_attach_once(self, author, async_client):
+        async def post():
+            return await async_client.post(
+                '/api/tweets/',
+                json={'tweet_data': 'cat', 'tweet_media_ids': [12001]},
+                headers=author,
+            )
+
+        tweet_id = (await post()).json()['tweet_id']
+        response = await post()
+
+        assert response.status_code == 400
+        assert (await self.attached())[12001] == tweet_id
+        assert await self.tweet_count() == 1
+
+    async def test_batch(self, author, async_client):
+        tweets = [
+            {'tweet_data': 'first'},
+            {'tweet_data': 'second', 'tweet_media_ids': [12002, 12003]},
+            {'tweet_data': 'third'},
+        ]
+        response = await async_client.post(
+            '/api/tweets/batch', json={'tweets': tweets}, headers=author
+        )
+
+        assert response.status_code == 201
+        tweet_ids = response.json()['tweet_ids']
+        async with TestSession() as session:
+            contents = await session.scalars(
+                select(models.Tweet.content)
+                .where(models.Tweet.id.in_(tweet_ids))
+                .order_by(models.Tweet.id)
+            )
+            assert list(contents) == ['first', 'second', 'third']
+        assert tweet_ids == sorted(tweet_ids)
+        attached = await self.attached()
+        assert attached[12002] == attached[12003] == tweet_ids[1]
+
+    async def test_batch_is_atomic(self, author, async_client):
+        before = await self.tweet_count()
+        for tweets in (
+            [
+                {'tweet_data': 'ok'},
+                {'tweet_data': 'x', 'tweet_media_ids': [1]},
+            ],
+            [
+                {'tweet_data': 'a', 'tweet_media_ids': [12002]},
+                {'tweet_data': 'b', 'tweet_media_ids': [12002]},
+            ],
+        ):
+            response = await async_client.post(
+                '/api/tweets/batch', json={'tweets': tweets}, headers=author
+            )
+            assert response.status_code == 400
+
+        response = await async_client.post(
+            '/api/tweets/batch', json={'tweets': []}, headers=author
+        )
+        assert response.status_code == 422
+        assert await self.tweet_count() == before
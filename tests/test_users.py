@@ -1,5 +1,8 @@
 import pytest
+from sqlalchemy import delete
 
+from database import models
+from tests.conftest import TestSession
 from utils.service import Dal
 
 
@@ -18,7 +21,6 @@ class TestUsers:
     async def test_get_current_user(self, async_session, user_1):
         """Test func get_current_user."""
         curr_user = await Dal(async_session).get_current_user("test")
-        assert curr_user.api_key == 'test'
         assert curr_user.id == 1
         assert curr_user.name == 'test'
 
@@ -53,8 +55,8 @@ class TestUsers:
 
         assert response.status_code == 200
 
-        await async_session.refresh(user_1)
-        await async_session.refresh(user_2)
+        await async_session.refresh(user_1, ['following'])
+        await async_session.refresh(user_2, ['followers'])
 
         assert user_1.following[0] == user_2
         assert user_2.followers[0] == user_1
@@ -68,8 +70,126 @@ class TestUsers:
 
         assert response.status_code == 200
 
-        await async_session.refresh(user_1)
-        await async_session.refresh(user_2)
+        await async_session.refresh(user_1, ['following'])
+        await async_session.refresh(user_2, ['followers'])
 
         assert user_2 not in user_1.following
         assert user_1 not in user_2.followers
+
+    async def test_api_key_lookup_is_cached(self, async_client, statements):
+        """Test api-key is resolved to user once."""
+        for _ in range(3):
+            response = await async_client.get('/api/tweets/')
+            assert response.status_code == 200
+
+        lookups = [s for s in statements if 'WHERE users.api_key' in s]
+        assert len(lookups) == 1
+
+
+@pytest.mark.users
+class TestFollows:
+    """Test follow counters and paginated follower lists."""
+
+    @pytest.fixture(scope='class')
+    async def star(self):
+        """Setup test: four fans follow the star through the API."""
+        async with TestSession() as session:
+            session.add_all(
+                [models.User(id=1001, name='star', api_key='star1001')]
+                + [
+                    models.User(id=idx, name=f'fan{idx}', api_key=f'fan{idx}')
+                    for idx in range(1002, 1006)
+                ]
+            )
+            await session.commit()
+            yield 1001
+            await session.execute(
+                delete(models.user_to_user).where(
+                    models.user_to_user.c.followers_id.between(1001, 1005)
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id.between(1001, 1005))
+            )
+            await session.commit()
+
+    async def test_follow_updates_counts(self, star, async_client):
+        for fan in range(1002, 1006):
+            response = await async_client.post(
+                f'/api/users/{star}/follow', headers={'api-key': f'fan{fan}'}
+            )
+            assert response.status_code == 200
+        # повторная подписка не меняет счетчики
+        await async_client.post(
+            f'/api/users/{star}/follow', headers={'api-key': 'fan1002'}
+        )
+        await async_client.delete(
+            f'/api/users/{star}/follow', headers={'api-key': 'fan1005'}
+        )
+
+        star_user = (await async_client.get(f'/api/users/{star}')).json()
+        fan = (await async_client.get('/api/users/1002')).json()
+
+        assert star_user['user']['followers_count'] == 3
+        assert star_user['user']['following_count'] == 0
+        assert [u['id'] for u in star_user['user']['followers']] == [
+            1002, 1003, 1004
+        ]
+        assert fan['user']['following_count'] == 1
+        assert fan['user']['following'] == [{'id': star, 'name': 'star'}]
+
+    async def test_followers_pages(self, star, async_client):
+        first = await async_client.get(
+            f'/api/users/{star}/followers', params={'limit': 2}
+        )
+        assert first.status_code == 200
+        assert [u['id'] for u in first.json()['users']] == [1002, 1003]
+
+        second = await async_client.get(
+            f'/api/users/{star}/followers',
+            params={'limit': 2, 'cursor': first.json()['next_cursor']},
+        )
+        assert second.json() == {
+            'result': True,
+            'users': [{'id': 1004, 'name': 'fan1004'}],
+            'next_cursor': None,
+        }
+
+    async def test_following_page(self, star, async_client):
+        response = await async_client.get('/api/users/1003/following')
+
+        assert response.json()['users'] == [{'id': star, 'name': 'star'}]
+
+    async def test_unknown_user(self, async_client):
+        response = await async_client.get('/api/users/1099/followers')
+
+        assert response.status_code == 404
+
+    async def test_bulk_follow(self, star, async_client, statements):
+        response = await async_client.post(
+            '/api/users/follow',
+            json={'user_ids': [star, 1002, 1005, 1099]},
+            headers={'api-key': 'fan1005'},
+        )
+
+        assert response.json() == {
+            'result': True, 'followed': [star, 1002], 'not_found': [1099],
+        }
+        assert not any('FROM user_follows' in s for s in statements)
+        fan = (await async_client.get('/api/users/1005')).json()['user']
+        assert fan['following_count'] == 2
+        assert [u['id'] for u in fan['following']] == [star, 1002]
+
+        again = await async_client.post(
+            '/api/users/follow',
+            json={'user_ids': [star]},
+            headers={'api-key': 'fan1005'},
+        )
+        assert again.json()['followed'] == []
+
+    async def test_bulk_follow_validates_ids(self, async_client):
+        response = await async_client.post(
+            '/api/users/follow', json={'user_ids': []}
+        )
+
+        assert response.status_code == 422